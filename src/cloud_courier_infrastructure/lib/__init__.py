@@ -1,13 +1,21 @@
+from .alerting import AlertRouting
 from .alerting import Dashboard
+from .alerting import LocationAlert
 from .alerting import NodeAlert
+from .appconfig_delivery import AppConfigDelivery
+from .appconfig_delivery import NodeAppConfig
 from .bucket import RawDataBucket
 from .courier_config_models import AppConfig
+from .courier_config_models import ComputerConfigDocument
 from .courier_config_models import FolderToWatch
+from .courier_config_models import UploadWindow
 from .hybrid_activation import OnPremNode
+from .hybrid_activation import SharedNodeRole
 from .models import AlertingConfig
 from .models import ComputerLocation
 from .models import LabComputerConfig
 from .ssm_distributor import CloudCourierAgentInstaller
 from .ssm_distributor import DistributorFileToPackage
+from .ssm_inventory import FleetInventory
 from .ssm_logs_bucket import SsmLogsBucket
 from .ssm_run_commands import CloudCourierSsmCommands
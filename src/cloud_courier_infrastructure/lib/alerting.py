@@ -1,7 +1,7 @@
+import hashlib
 import math
 from typing import Any
 
-import pulumi_aws
 from ephemeral_pulumi_deploy import append_resource_suffix
 from ephemeral_pulumi_deploy import common_tags_native
 from pulumi import ComponentResource
@@ -10,48 +10,125 @@ from pulumi import ResourceOptions
 from pulumi_aws_native import cloudwatch
 from pulumi_aws_native import sns
 
+from .courier_config_models import AGENT_CPU_METRIC_NAME
 from .courier_config_models import CLOUDWATCH_HEARTBEAT_NAMESPACE
+from .courier_config_models import CLOUDWATCH_HOST_LOAD_NAMESPACE
 from .courier_config_models import CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME
 from .courier_config_models import HEARTBEAT_METRIC_NAME
+from .courier_config_models import HOST_CPU_METRIC_NAME
+from .models import AlertingConfig
+from .models import ComputerLocation
 from .models import LabComputerConfig
+from .program_context import ProgramContext
 
 
-class NodeAlert(ComponentResource):
+def _format_email_address(email_address: str) -> str:
+    return email_address.replace("@", "-at-").replace(".", "-dot-")
+
+
+def _get_recipient_set(alerting_config: AlertingConfig) -> tuple[str, ...]:
+    return tuple(sorted({email_address.lower() for email_address in alerting_config.emails}))
+
+
+class AlertRouting(ComponentResource):
+    """One SNS topic per unique set of alert recipients, shared by every computer alerting that same set of people.
+
+    So someone who owns 30 instruments gets a single subscription confirmation instead of 30.
+    """
+
     def __init__(
         self,
         *,
-        lab_computer_config: LabComputerConfig,
+        lab_computer_configs: list[LabComputerConfig],
     ):
         super().__init__(
-            "labauto:OnPremComputerAlert",
-            lab_computer_config.immutable_full_resource_name,
+            "labauto:AlertRouting",
+            append_resource_suffix("alert-routing", max_length=100),
             None,
         )
-        self.lab_computer_config = lab_computer_config
+        self._topic_arns: dict[tuple[str, ...], Output[str]] = {}
+        for lab_computer_config in lab_computer_configs:
+            _ = self.get_topic_arn(lab_computer_config.alerting_config)
+
+    def get_recipient_set_topic_arn(self, recipient_set: tuple[str, ...]) -> Output[str]:
+        """Return the topic for the (sorted, lowercased) recipient set, creating it the first time the set is seen."""
+        if recipient_set in self._topic_arns:
+            return self._topic_arns[recipient_set]
+        # a hash of the addresses keeps the name stable and short no matter how many there are. Autonaming turns it into
+        # the physical TopicName, which only allows [A-Za-z0-9_-], so the addresses themselves can't be used
+        topic_key = f"{len(recipient_set)}-recipients-{hashlib.sha256(','.join(recipient_set).encode('utf-8')).hexdigest()[:12]}"
         sns_topic = sns.Topic(
-            append_resource_suffix(f"{lab_computer_config.resource_name}-alert"),
+            append_resource_suffix(f"alert-{topic_key}", max_length=100),
             opts=ResourceOptions(parent=self),
             tags=common_tags_native(),
         )
-        # TODO: consider some sort of different structure where there's just a single SNS topic per email address...that may result in fewer "SNS Subscription" emails
-        for email_address in lab_computer_config.alerting_config.emails:
-            formatted_address = email_address.replace("@", "-at-").replace(".", "-dot-")
+        for email_address in recipient_set:
             _ = sns.Subscription(
-                append_resource_suffix(f"{lab_computer_config.resource_name}--{formatted_address}", max_length=100),
+                append_resource_suffix(f"alert-{topic_key}--{_format_email_address(email_address)}", max_length=100),
                 topic_arn=sns_topic.topic_arn,
                 protocol="email",
                 endpoint=email_address,
+                opts=ResourceOptions(parent=sns_topic),
+            )
+        self._topic_arns[recipient_set] = sns_topic.topic_arn
+        return sns_topic.topic_arn
+
+    def get_topic_arn(self, alerting_config: AlertingConfig) -> Output[str]:
+        return self.get_recipient_set_topic_arn(_get_recipient_set(alerting_config))
+
+
+class NodeAlert(ComponentResource):
+    def __init__(
+        self,
+        *,
+        lab_computer_config: LabComputerConfig,
+        alert_routing: AlertRouting | None = None,
+        notify_directly: bool = True,
+    ):
+        """Alarm when the computer's heartbeat stops.
+
+        If alert_routing is given, the alarm notifies its shared topic instead of a topic created just for this computer.
+        If notify_directly is False, the alarm itself has no actions and a LocationAlert notifies topic_arn instead, so
+        the notification can be suppressed during an outage of the whole location.
+        """
+        super().__init__(
+            "labauto:OnPremComputerAlert",
+            lab_computer_config.immutable_full_resource_name,
+            None,
+        )
+        self.lab_computer_config = lab_computer_config
+        if alert_routing is not None:
+            topic_arn = alert_routing.get_topic_arn(lab_computer_config.alerting_config)
+        else:
+            sns_topic = sns.Topic(
+                append_resource_suffix(f"{lab_computer_config.resource_name}-alert"),
                 opts=ResourceOptions(parent=self),
+                tags=common_tags_native(),
             )
+            topic_arn = sns_topic.topic_arn
+            for email_address in lab_computer_config.alerting_config.emails:
+                _ = sns.Subscription(
+                    append_resource_suffix(
+                        f"{lab_computer_config.resource_name}--{_format_email_address(email_address)}", max_length=100
+                    ),
+                    topic_arn=sns_topic.topic_arn,
+                    protocol="email",
+                    endpoint=email_address,
+                    opts=ResourceOptions(parent=self),
+                )
         self.alarm = cloudwatch.Alarm(
             append_resource_suffix(lab_computer_config.resource_name),
             comparison_operator="LessThanThreshold",
-            evaluation_periods=1,
+            evaluation_periods=lab_computer_config.alerting_config.evaluation_periods,
+            datapoints_to_alarm=lab_computer_config.alerting_config.datapoints_to_alarm
+            if lab_computer_config.alerting_config.datapoints_to_alarm
+            != lab_computer_config.alerting_config.evaluation_periods
+            else None,  # CloudWatch defaults to all of the evaluation periods, so leave it unset then to avoid a diff on existing alarms
             alarm_description=f"The CloudCourier agent for {lab_computer_config.name} at {lab_computer_config.location.name} is unresponsive.",
             alarm_name=lab_computer_config.immutable_full_resource_name,
             metric_name=HEARTBEAT_METRIC_NAME,
             namespace=CLOUDWATCH_HEARTBEAT_NAMESPACE,
-            period=lab_computer_config.alerting_config.timeout_seconds,
+            period=lab_computer_config.alerting_config.period_seconds,
             statistic="Sum",
             threshold=1,
             treat_missing_data="breaching",
@@ -61,10 +138,256 @@ class NodeAlert(ComponentResource):
                     name=CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME, value=lab_computer_config.immutable_full_resource_name
                 ),
             ],
-            alarm_actions=[sns_topic.topic_arn],
+            alarm_actions=[topic_arn] if notify_directly else [],
             opts=ResourceOptions(parent=self),
             tags=common_tags_native(),
         )
+        self.topic_arn = topic_arn
+        self.notify_directly = notify_directly
+
+
+MAX_ALARMS_PER_COMPOSITE_RULE = 100  # CloudWatch's limit on the alarms a single composite alarm rule can reference
+MIN_COMPUTERS_FOR_LOCATION_ALERT = 2  # with a single computer, a location alert would just duplicate its own alarm
+
+
+def _create_all_in_alarm_rule(alarm_names: list[str]) -> str:
+    return " AND ".join(f'ALARM("{alarm_name}")' for alarm_name in alarm_names)
+
+
+class LocationAlert(ComponentResource):
+    """A single alert when every computer at a location stops sending heartbeats, e.g. the site lost power or network.
+
+    While it is in alarm, it suppresses the notifications of the individual computers' alarms, so a site outage sends one
+    notification instead of one per computer.
+    """
+
+    def __init__(
+        self,
+        *,
+        location: ComputerLocation,
+        node_alerts: list[NodeAlert],
+        alert_routing: AlertRouting | None = None,
+    ):
+        """If alert_routing is given, the location alarm notifies the shared topic for everyone alerted at the location."""
+        location_resource_name = f"{location.name.lower()}-outage"
+        super().__init__(
+            "labauto:OnPremLocationAlert",
+            append_resource_suffix(location_resource_name, max_length=100),
+            None,
+        )
+        recipients = tuple(
+            sorted(
+                {
+                    email_address.lower()
+                    for node_alert in node_alerts
+                    for email_address in node_alert.lab_computer_config.alerting_config.emails
+                }
+            )
+        )
+        if alert_routing is not None:
+            topic_arn = alert_routing.get_recipient_set_topic_arn(recipients)
+        else:
+            sns_topic = sns.Topic(
+                append_resource_suffix(f"{location_resource_name}-alert", max_length=100),
+                opts=ResourceOptions(parent=self),
+                tags=common_tags_native(),
+            )
+            topic_arn = sns_topic.topic_arn
+            for email_address in recipients:
+                _ = sns.Subscription(
+                    append_resource_suffix(
+                        f"{location_resource_name}--{_format_email_address(email_address)}", max_length=100
+                    ),
+                    topic_arn=sns_topic.topic_arn,
+                    protocol="email",
+                    endpoint=email_address,
+                    opts=ResourceOptions(parent=sns_topic),
+                )
+
+        node_alarm_names = [node_alert.lab_computer_config.immutable_full_resource_name for node_alert in node_alerts]
+        rule_alarm_names: list[str] = node_alarm_names
+        child_alarms: list[cloudwatch.CompositeAlarm] = []
+        if len(node_alarm_names) > MAX_ALARMS_PER_COMPOSITE_RULE:
+            # a location too big for one rule is split into groups, which the location alarm then combines
+            rule_alarm_names = []
+            for chunk_index, chunk_start in enumerate(range(0, len(node_alarm_names), MAX_ALARMS_PER_COMPOSITE_RULE)):
+                child_alarm_name = append_resource_suffix(f"{location_resource_name}-{chunk_index}", max_length=255)
+                child_alarms.append(
+                    cloudwatch.CompositeAlarm(
+                        child_alarm_name,
+                        alarm_name=child_alarm_name,
+                        alarm_rule=_create_all_in_alarm_rule(
+                            node_alarm_names[chunk_start : chunk_start + MAX_ALARMS_PER_COMPOSITE_RULE]
+                        ),
+                        opts=ResourceOptions(parent=self, depends_on=[node_alert.alarm for node_alert in node_alerts]),
+                        tags=common_tags_native(),
+                    )
+                )
+                rule_alarm_names.append(child_alarm_name)
+        location_alarm_name = append_resource_suffix(location_resource_name, max_length=255)
+        self.alarm = cloudwatch.CompositeAlarm(
+            location_alarm_name,
+            alarm_name=location_alarm_name,
+            alarm_description=f"None of the CloudCourier agents at {location.name} are responding. The location may have lost power or network.",
+            alarm_rule=_create_all_in_alarm_rule(rule_alarm_names),
+            alarm_actions=[topic_arn],
+            opts=ResourceOptions(
+                parent=self, depends_on=[*(node_alert.alarm for node_alert in node_alerts), *child_alarms]
+            ),
+            tags=common_tags_native(),
+        )
+
+        # heartbeat alarms at the same location can go off up to one period apart during the same outage
+        suppressor_period_seconds = max(
+            node_alert.lab_computer_config.alerting_config.timeout_seconds for node_alert in node_alerts
+        )
+        for node_alert in node_alerts:
+            node_alarm_name = node_alert.lab_computer_config.immutable_full_resource_name
+            _ = cloudwatch.CompositeAlarm(
+                append_resource_suffix(f"{node_alert.lab_computer_config.resource_name}-notify", max_length=100),
+                alarm_name=append_resource_suffix(
+                    f"{node_alert.lab_computer_config.original_resource_name}-notify", max_length=255
+                ),
+                alarm_description=f"The CloudCourier agent for {node_alert.lab_computer_config.name} at {location.name} is unresponsive.",
+                alarm_rule=f'ALARM("{node_alarm_name}")',
+                alarm_actions=[node_alert.topic_arn],
+                actions_suppressor=self.alarm.alarm_name,
+                actions_suppressor_wait_period=suppressor_period_seconds,
+                actions_suppressor_extension_period=suppressor_period_seconds,
+                opts=ResourceOptions(parent=self, depends_on=[node_alert.alarm]),
+                tags=common_tags_native(),
+            )
+
+
+MAX_SEARCH_EXPRESSION_LENGTH = 1024  # CloudWatch's limit on a single metric math expression
+MAX_ALARMS_PER_ALARM_WIDGET = 100  # CloudWatch's limit on the alarms listed in one alarm status widget
+MAX_NODES_PER_LOCATION_WIDGET = (
+    MAX_ALARMS_PER_ALARM_WIDGET  # keeps the SEARCH expressions per widget bounded (about 10)
+)
+DASHBOARD_GRID_WIDTH = 24
+HEARTBEAT_WIDGET_PERIOD_SECONDS = 60
+HOST_LOAD_WIDGET_PERIOD_SECONDS = 300
+HOST_LOAD_METRIC_NAMES = (HOST_CPU_METRIC_NAME, AGENT_CPU_METRIC_NAME)
+
+
+def _publishes_host_load(node_alert: NodeAlert) -> bool:
+    return node_alert.lab_computer_config.app_config.host_load_metric_frequency_seconds is not None
+
+
+def _create_node_search_expressions(
+    node_alerts: list[NodeAlert], *, namespace: str, metric_names: tuple[str, ...], stat: str, period_seconds: int
+) -> list[str]:
+    """Match each node's metrics exactly by name, split across as many SEARCH expressions as the length limit needs.
+
+    The metrics have no location dimension, and a partial match on the location name could also pick up nodes at
+    other locations whose names share those words, so the node names are listed explicitly.
+    """
+    metric_name_terms = " OR ".join(f'MetricName="{metric_name}"' for metric_name in metric_names)
+    search_prefix = (
+        f"SEARCH('{{{namespace},Application,{CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME}}} ({metric_name_terms}) AND ("
+    )
+    search_suffix = f")', '{stat}', {period_seconds})"
+    expressions: list[str] = []
+    node_terms: list[str] = []
+    for node_alert in node_alerts:
+        node_term = (
+            f'{CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME}="{node_alert.lab_computer_config.immutable_full_resource_name}"'
+        )
+        if node_terms and (
+            len(search_prefix) + len(" OR ".join([*node_terms, node_term])) + len(search_suffix)
+            > MAX_SEARCH_EXPRESSION_LENGTH
+        ):
+            expressions.append(f"{search_prefix}{' OR '.join(node_terms)}{search_suffix}")
+            node_terms = []
+        node_terms.append(node_term)
+    if node_terms:
+        expressions.append(f"{search_prefix}{' OR '.join(node_terms)}{search_suffix}")
+    return expressions
+
+
+def _create_location_widgets(
+    *, location_name: str, node_alerts: list[NodeAlert], y: int, aws_region: str
+) -> list[dict[str, Any]]:
+    """Draw the heartbeats of (up to MAX_NODES_PER_LOCATION_WIDGET) computers at a location in one widget.
+
+    Their CPU usage is drawn next to it, and the status of their alarms underneath.
+    """
+    heartbeat_height = 6
+    alarm_status_height = 2
+    host_load_node_alerts = [node_alert for node_alert in node_alerts if _publishes_host_load(node_alert)]
+    heartbeat_width = DASHBOARD_GRID_WIDTH // 2 if host_load_node_alerts else DASHBOARD_GRID_WIDTH
+    widgets: list[dict[str, Any]] = [
+        {
+            "type": "metric",
+            "x": 0,
+            "y": y,
+            "width": heartbeat_width,
+            "height": heartbeat_height,
+            "properties": {
+                "metrics": [
+                    [{"expression": expression, "id": f"heartbeats{index}", "period": HEARTBEAT_WIDGET_PERIOD_SECONDS}]
+                    for index, expression in enumerate(
+                        _create_node_search_expressions(
+                            node_alerts,
+                            namespace=CLOUDWATCH_HEARTBEAT_NAMESPACE,
+                            metric_names=(HEARTBEAT_METRIC_NAME,),
+                            stat="Sum",
+                            period_seconds=HEARTBEAT_WIDGET_PERIOD_SECONDS,
+                        )
+                    )
+                ],
+                "view": "timeSeries",
+                "period": HEARTBEAT_WIDGET_PERIOD_SECONDS,
+                "stat": "Sum",
+                "region": aws_region,
+                "title": f"Heartbeats at {location_name}",
+            },
+        }
+    ]
+    if host_load_node_alerts:
+        widgets.append(
+            {
+                "type": "metric",
+                "x": heartbeat_width,
+                "y": y,
+                "width": DASHBOARD_GRID_WIDTH - heartbeat_width,
+                "height": heartbeat_height,
+                "properties": {
+                    "metrics": [
+                        [{"expression": expression, "id": f"cpu{index}", "period": HOST_LOAD_WIDGET_PERIOD_SECONDS}]
+                        for index, expression in enumerate(
+                            _create_node_search_expressions(
+                                host_load_node_alerts,
+                                namespace=CLOUDWATCH_HOST_LOAD_NAMESPACE,
+                                metric_names=HOST_LOAD_METRIC_NAMES,
+                                stat="Average",
+                                period_seconds=HOST_LOAD_WIDGET_PERIOD_SECONDS,
+                            )
+                        )
+                    ],
+                    "view": "timeSeries",
+                    "period": HOST_LOAD_WIDGET_PERIOD_SECONDS,
+                    "stat": "Average",
+                    "yAxis": {"left": {"min": 0, "max": 100, "label": "CPU %", "showUnits": False}},
+                    "region": aws_region,
+                    "title": f"Host and agent CPU usage at {location_name}",
+                },
+            }
+        )
+    widgets.append(
+        {
+            "type": "alarm",
+            "x": 0,
+            "y": y + heartbeat_height,
+            "width": DASHBOARD_GRID_WIDTH,
+            "height": alarm_status_height,
+            "properties": {
+                "alarms": [node_alert.alarm.arn for node_alert in node_alerts],
+                "title": f"Upload Agent Alarm Status at {location_name}",
+            },
+        }
+    )
+    return widgets
 
 
 class Dashboard(ComponentResource):
@@ -72,12 +395,29 @@ class Dashboard(ComponentResource):
         self,
         *,
         node_alerts: list[NodeAlert],
+        program_context: ProgramContext,
+        use_search_expressions: bool = False,
+        max_nodes_per_dashboard: int = 100,
     ):
+        """Create the dashboard showing the heartbeat and alarm status of every computer.
+
+        With use_search_expressions, the heartbeats are drawn in one widget per location (of up to
+        MAX_NODES_PER_LOCATION_WIDGET computers) instead of one per computer. Once the fleet is larger than
+        max_nodes_per_dashboard there is a separate dashboard for each location, and a location larger than that is
+        split across several dashboards, so no dashboard ever has more than max_nodes_per_dashboard computers on it.
+        """
         super().__init__(
             "labauto:OnPremComputerStatusDashboard",
             append_resource_suffix("computer-status-dashboard", max_length=100),
             None,
         )
+        if use_search_expressions:
+            self._create_location_dashboards(
+                node_alerts=node_alerts,
+                aws_region=program_context.aws_region,
+                max_nodes_per_dashboard=max_nodes_per_dashboard,
+            )
+            return
         widgets: list[dict[str, Any]] = []  # TODO: use JSON type hint
 
         # Define dimensions for metric widgets.
@@ -103,11 +443,27 @@ class Dashboard(ComponentResource):
                             "CloudCourier",
                             CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME,
                             node_alert.lab_computer_config.immutable_full_resource_name,
-                        ]
+                        ],
+                        *(
+                            [
+                                [
+                                    CLOUDWATCH_HOST_LOAD_NAMESPACE,
+                                    metric_name,
+                                    "Application",
+                                    "CloudCourier",
+                                    CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME,
+                                    node_alert.lab_computer_config.immutable_full_resource_name,
+                                    {"stat": "Average", "period": HOST_LOAD_WIDGET_PERIOD_SECONDS, "yAxis": "right"},
+                                ]
+                                for metric_name in HOST_LOAD_METRIC_NAMES
+                            ]
+                            if _publishes_host_load(node_alert)
+                            else []
+                        ),
                     ],
                     "period": 60,
                     "stat": "Sum",
-                    "region": pulumi_aws.config.region,
+                    "region": program_context.aws_region,
                     "title": f"Heartbeat for {node_alert.lab_computer_config.name} at {node_alert.lab_computer_config.location.name}",
                 },
             }
@@ -137,3 +493,48 @@ class Dashboard(ComponentResource):
             dashboard_name=append_resource_suffix("agent-status"),
         )
         # TODO: figure out way to export the URL to the dashboard
+
+    def _create_location_dashboards(
+        self, *, node_alerts: list[NodeAlert], aws_region: str, max_nodes_per_dashboard: int
+    ) -> None:
+        node_alerts_by_location: dict[str, list[NodeAlert]] = {}
+        for node_alert in node_alerts:
+            node_alerts_by_location.setdefault(node_alert.lab_computer_config.location.name, []).append(node_alert)
+
+        # the node metrics have no location dimension to SEARCH on, so each widget lists its nodes explicitly and the
+        # size of a widget or dashboard is capped instead, to keep them quick to load however large a location grows
+        widgets_by_dashboard: dict[str, list[dict[str, Any]]] = {}
+        for location_name, location_node_alerts in node_alerts_by_location.items():
+            for dashboard_index, dashboard_start in enumerate(
+                range(0, len(location_node_alerts), max_nodes_per_dashboard)
+            ):
+                if len(node_alerts) <= max_nodes_per_dashboard:
+                    dashboard_name = "agent-status"
+                elif len(location_node_alerts) <= max_nodes_per_dashboard:
+                    dashboard_name = f"agent-status-{location_name.lower()}"
+                else:
+                    dashboard_name = f"agent-status-{location_name.lower()}-{dashboard_index}"
+                dashboard_node_alerts = location_node_alerts[
+                    dashboard_start : dashboard_start + max_nodes_per_dashboard
+                ]
+                widgets = widgets_by_dashboard.setdefault(dashboard_name, [])
+                for widget_start in range(0, len(dashboard_node_alerts), MAX_NODES_PER_LOCATION_WIDGET):
+                    y = max((widget["y"] + widget["height"] for widget in widgets), default=0)
+                    widgets.extend(
+                        _create_location_widgets(
+                            location_name=location_name,
+                            node_alerts=dashboard_node_alerts[
+                                widget_start : widget_start + MAX_NODES_PER_LOCATION_WIDGET
+                            ],
+                            y=y,
+                            aws_region=aws_region,
+                        )
+                    )
+
+        for dashboard_name, widgets in widgets_by_dashboard.items():
+            _ = cloudwatch.Dashboard(
+                append_resource_suffix(dashboard_name),
+                dashboard_body=Output.json_dumps({"widgets": widgets}),
+                opts=ResourceOptions(parent=self),
+                dashboard_name=append_resource_suffix(dashboard_name),
+            )
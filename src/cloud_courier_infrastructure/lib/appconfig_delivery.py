@@ -0,0 +1,182 @@
+from ephemeral_pulumi_deploy import append_resource_suffix
+from ephemeral_pulumi_deploy import common_tags_native
+from ephemeral_pulumi_deploy import get_config
+from pulumi import ComponentResource
+from pulumi import Input
+from pulumi import Output
+from pulumi import ResourceOptions
+from pulumi_aws.iam import RolePolicy
+from pulumi_aws_native import TagArgs
+from pulumi_aws_native import appconfig
+from pulumi_aws_native import iam
+
+from .hybrid_activation import NODE_LOCATION_TAG_KEY
+from .iam_policy import PolicyCondition
+from .iam_policy import PolicyStatement
+from .iam_policy import build_policy_document
+from .models import LabComputerConfig
+from .program_context import ProgramContext
+
+APPCONFIG_APPLICATION_BASE_NAME = "cloud-courier"  # Warning! The Cloud Courier Agent derives the application name by appending the `--{project}--{stack}` suffix of its own role name, and the environment name from the original location its role name starts with, so changing either will require changes there as well
+CONFIG_DOCUMENT_CONTENT_TYPE = "application/json"
+MAX_ENVIRONMENTS_PER_APPLICATION = 20  # AppConfig's default quota
+
+
+class AppConfigDelivery(ComponentResource):
+    """The AppConfig application, environments and deployment strategy that every computer's configuration is deployed with.
+
+    Agents poll AppConfig with a configuration session instead of reading SSM parameters, and AppConfig returns an empty
+    response when nothing has changed since the last poll, which is much cheaper than re-reading every parameter.
+
+    An environment only allows one deployment in progress at a time, so there is an environment per (original) location.
+    Deployments then only wait on the others at the same location, instead of on every computer in the fleet.
+    """
+
+    def __init__(
+        self,
+        *,
+        program_context: ProgramContext,
+    ):
+        super().__init__(
+            "labauto:AppConfigDelivery",
+            append_resource_suffix("appconfig-delivery", max_length=100),
+            None,
+        )
+        self._program_context = program_context
+        self.application = appconfig.Application(
+            append_resource_suffix(APPCONFIG_APPLICATION_BASE_NAME),
+            name=append_resource_suffix(APPCONFIG_APPLICATION_BASE_NAME),
+            description="Configuration for the Cloud Courier Agent on each lab computer.",
+            tags=common_tags_native(),
+            opts=ResourceOptions(parent=self),
+        )
+        self._environments: dict[str, appconfig.Environment] = {}
+        self.deployment_strategy = appconfig.DeploymentStrategy(
+            append_resource_suffix("all-at-once"),
+            name=append_resource_suffix("all-at-once"),
+            description="Each deployment only changes the configuration of a single computer, so there is nothing to gradually roll out.",
+            deployment_duration_in_minutes=0,
+            final_bake_time_in_minutes=0,
+            growth_factor=100,
+            growth_type=appconfig.DeploymentStrategyGrowthType.LINEAR,
+            replicate_to=appconfig.DeploymentStrategyReplicateTo.NONE,
+            tags=common_tags_native(),
+            opts=ResourceOptions(parent=self),
+        )
+
+    def get_environment(self, location_name: str) -> appconfig.Environment:
+        """Return the environment for the (lowercased) location, creating it the first time the location is seen."""
+        if location_name in self._environments:
+            return self._environments[location_name]
+        if len(self._environments) >= MAX_ENVIRONMENTS_PER_APPLICATION:
+            msg = f"AppConfig allows at most {MAX_ENVIRONMENTS_PER_APPLICATION} environments per application, so configuration can't be delivered to more than that many locations"
+            raise ValueError(msg)
+        environment = appconfig.Environment(
+            append_resource_suffix(f"{location_name}-appconfig-env", max_length=100),
+            application_id=self.application.application_id,
+            name=location_name,
+            description=f"The lab computers originally set up at {location_name}, in the {get_config('proj:env')} environment.",
+            tags=common_tags_native(),
+            opts=ResourceOptions(parent=self.application),
+        )
+        self._environments[location_name] = environment
+        return environment
+
+    def create_read_policy(
+        self,
+        *,
+        role: iam.Role,
+        resource_name: str,
+        environment_id: Input[str],
+        configuration_profile_id: Input[str],
+        conditions: tuple[PolicyCondition, ...] = (),
+    ) -> RolePolicy:
+        """Allow the role to start configuration sessions for the profile in the environment.
+
+        When configuration_profile_id is `*`, pass conditions that narrow it down (e.g. by the profiles' tags).
+        """
+        return RolePolicy(  # the native provider has some CloudControl error when the policy document had an output in it
+            append_resource_suffix(f"{resource_name}-read-appconfig", max_length=100),
+            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+            name="read-appconfig",
+            policy=Output.all(self.application.application_id, environment_id, configuration_profile_id).apply(
+                lambda args: build_policy_document(
+                    PolicyStatement(
+                        sid="ReadConfiguration",
+                        actions=("appconfig:StartConfigurationSession", "appconfig:GetLatestConfiguration"),
+                        resources=(
+                            f"arn:aws:appconfig:{self._program_context.aws_region}:{self._program_context.aws_account_id}:application/{args[0]}/environment/{args[1]}/configuration/{args[2]}",
+                        ),
+                        conditions=conditions,
+                    ),
+                )
+            ),
+            opts=ResourceOptions(parent=role),
+        )
+
+
+class NodeAppConfig(ComponentResource):
+    def __init__(
+        self,
+        *,
+        lab_computer_config: LabComputerConfig,
+        appconfig_delivery: AppConfigDelivery,
+        data_bucket_name: Output[str],
+        node_role: iam.Role | None,
+        previous_deployment: appconfig.Deployment | None = None,
+    ):
+        """Deploy the computer's full configuration document as an AppConfig hosted configuration.
+
+        The deployment goes to the environment of the computer's original location. An environment can only have one
+        deployment in progress at a time, so pass the previous_deployment to that same environment for this one to wait
+        on. If node_role is None (e.g. it is shared with other computers), granting it access is up to the caller.
+        """
+        super().__init__(
+            "labauto:OnPremComputerAppConfig",
+            lab_computer_config.immutable_full_resource_name,
+            None,
+        )
+        application_id = appconfig_delivery.application.application_id
+        environment = appconfig_delivery.get_environment(lab_computer_config.original_location_name)
+        configuration_profile = appconfig.ConfigurationProfile(
+            append_resource_suffix(f"{lab_computer_config.original_resource_name}-config", max_length=100),
+            application_id=application_id,
+            name=lab_computer_config.immutable_full_resource_name,  # the agent identifies itself by its role name, which is this
+            location_uri="hosted",
+            type="AWS.Freeform",
+            tags=[  # lets a location's shared node role read only the profiles of its own computers
+                TagArgs(key=NODE_LOCATION_TAG_KEY, value=lab_computer_config.location.name.lower()),
+                *common_tags_native(),
+            ],
+            opts=ResourceOptions(parent=self),
+        )
+        configuration_version = appconfig.HostedConfigurationVersion(
+            append_resource_suffix(f"{lab_computer_config.resource_name}-config-version", max_length=100),
+            application_id=application_id,
+            configuration_profile_id=configuration_profile.configuration_profile_id,
+            content=data_bucket_name.apply(
+                lambda bucket_name: lab_computer_config.create_config_document(
+                    bucket_name=bucket_name
+                ).model_dump_json()
+            ),
+            content_type=CONFIG_DOCUMENT_CONTENT_TYPE,
+            opts=ResourceOptions(parent=configuration_profile),
+        )
+        self.deployment = appconfig.Deployment(
+            append_resource_suffix(f"{lab_computer_config.resource_name}-config-deployment", max_length=100),
+            application_id=application_id,
+            environment_id=environment.environment_id,
+            configuration_profile_id=configuration_profile.configuration_profile_id,
+            configuration_version=configuration_version.version_number.apply(str),
+            deployment_strategy_id=appconfig_delivery.deployment_strategy.aws_id,
+            opts=ResourceOptions(
+                parent=configuration_profile, depends_on=[] if previous_deployment is None else [previous_deployment]
+            ),
+        )
+        if node_role is not None:
+            _ = appconfig_delivery.create_read_policy(
+                role=node_role,
+                resource_name=lab_computer_config.resource_name,
+                environment_id=environment.environment_id,
+                configuration_profile_id=configuration_profile.configuration_profile_id,
+            )
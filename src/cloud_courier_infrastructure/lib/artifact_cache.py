@@ -0,0 +1,168 @@
+"""A persistent cache of the artifacts downloaded from S3 to build the agent installer package.
+
+Every preview used to download the full agent exe zip again. Now each artifact is stored once, named by its SHA-256,
+and an index maps its S3 URL to the ETag and version ID it was downloaded at. On the next run a conditional HEAD
+(`If-None-Match` the cached ETag) confirms the cached copy is still current without transferring the object.
+
+The cache is shared by every stack and version on the machine, and the least recently used artifacts are evicted once
+it grows past its size limit. Set CLOUD_COURIER_ARTIFACT_CACHE_DIR to keep it somewhere persistent in CI, and
+CLOUD_COURIER_ARTIFACT_CACHE_MAX_BYTES to change the limit.
+"""
+
+import logging
+import os
+import threading
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import boto3
+from botocore.exceptions import ClientError
+from pydantic import BaseModel
+from pydantic import Field
+
+from .file_hashing import get_default_cache_dir
+from .file_hashing import hash_file_contents
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_CACHE_MAX_BYTES_ENV_VAR = "CLOUD_COURIER_ARTIFACT_CACHE_MAX_BYTES"
+DEFAULT_ARTIFACT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+INDEX_FILE_NAME = "index.json"
+BLOBS_DIR_NAME = "blobs"
+
+
+class CachedArtifact(BaseModel, frozen=True):
+    etag: str
+    version_id: str | None = None
+    sha256: str
+    size_bytes: int
+    last_used: float
+    """Seconds since the epoch, for least-recently-used eviction."""
+
+
+class ArtifactCacheIndex(BaseModel, frozen=True):
+    artifacts: dict[str, CachedArtifact] = Field(default_factory=dict[str, CachedArtifact])
+    """Keyed by the S3 URL the artifact was downloaded from."""
+
+
+class ArtifactCache:
+    def __init__(self, *, cache_dir: Path | None = None, max_bytes: int | None = None) -> None:
+        super().__init__()
+        self._cache_dir = get_default_cache_dir() if cache_dir is None else cache_dir
+        self._blobs_dir = self._cache_dir / BLOBS_DIR_NAME
+        self._index_path = self._cache_dir / INDEX_FILE_NAME
+        self._max_bytes = (
+            int(os.environ.get(ARTIFACT_CACHE_MAX_BYTES_ENV_VAR, DEFAULT_ARTIFACT_CACHE_MAX_BYTES))
+            if max_bytes is None
+            else max_bytes
+        )
+        self._blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._index_lock = threading.Lock()  # so several artifacts can be fetched concurrently
+
+    def _read_index(self) -> ArtifactCacheIndex:
+        if not self._index_path.exists():
+            return ArtifactCacheIndex()
+        try:
+            return ArtifactCacheIndex.model_validate_json(self._index_path.read_text(encoding="utf-8"))
+        except ValueError:
+            logger.warning(f"Ignoring the unreadable artifact cache index at {self._index_path}")
+            return ArtifactCacheIndex()
+
+    def _write_index(self, index: ArtifactCacheIndex) -> None:
+        # replaced atomically, so a concurrent run sees either the old or the new index (at worst it downloads again)
+        temp_path = self._index_path.with_name(f"{INDEX_FILE_NAME}.{os.getpid()}.tmp")
+        _ = temp_path.write_text(index.model_dump_json(indent=2), encoding="utf-8")
+        _ = temp_path.replace(self._index_path)
+
+    def get_blob_path(self, sha256: str) -> Path:
+        return self._blobs_dir / sha256
+
+    def _is_cached_copy_current(self, *, cached: CachedArtifact, s3_client: "S3Client", bucket: str, key: str) -> bool:
+        blob_path = self.get_blob_path(cached.sha256)
+        if not blob_path.exists() or blob_path.stat().st_size != cached.size_bytes:
+            return False
+        try:
+            # no VersionId here: an old version never changes, so only the latest version can reveal a new upload
+            _ = s3_client.head_object(Bucket=bucket, Key=key, IfNoneMatch=cached.etag)
+        except ClientError as e:
+            if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == HTTPStatus.NOT_MODIFIED:
+                return True
+            raise
+        return False  # a 200 means the ETag no longer matches
+
+    def fetch_s3_artifact(self, *, source_url: str, aws_region: str) -> CachedArtifact:
+        """Make sure the cache has a current copy of the S3 object, downloading it only if it's missing or stale.
+
+        The copy is at `get_blob_path(artifact.sha256)`.
+        """
+        parsed_url = urlparse(
+            source_url, allow_fragments=False
+        )  # based on https://stackoverflow.com/questions/42641315/s3-urls-get-bucket-name-and-path
+        bucket, key = parsed_url.netloc, parsed_url.path.lstrip("/")
+        s3_client = boto3.Session().client("s3", region_name=aws_region)
+        with self._index_lock:
+            cached = self._read_index().artifacts.get(source_url)
+        if cached is not None and self._is_cached_copy_current(
+            cached=cached, s3_client=s3_client, bucket=bucket, key=key
+        ):
+            logger.info(f"Using the cached copy of {source_url}")
+            cached = cached.model_copy(update={"last_used": time.time()})
+            previous = None
+        else:
+            previous = cached
+            cached = self._download(s3_client=s3_client, bucket=bucket, key=key, source_url=source_url)
+        with self._index_lock:
+            index = ArtifactCacheIndex(artifacts={**self._read_index().artifacts, source_url: cached})
+            if previous is not None and all(
+                artifact.sha256 != previous.sha256 for artifact in index.artifacts.values()
+            ):  # the object changed in S3, so nothing refers to the old content anymore
+                self.get_blob_path(previous.sha256).unlink(missing_ok=True)
+            self._write_index(self._evict(index, keep_sha256=cached.sha256))
+        return cached
+
+    def _download(self, *, s3_client: "S3Client", bucket: str, key: str, source_url: str) -> CachedArtifact:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        etag = head["ETag"]
+        version_id = head.get("VersionId") or None  # unversioned buckets leave it out
+        temp_path = self._blobs_dir / f"download.{os.getpid()}.{threading.get_ident()}.tmp"
+        extra_args = {} if version_id is None else {"VersionId": version_id}  # pin the exact version the HEAD saw
+        logger.info(f"Downloading {source_url} into the artifact cache")
+        s3_client.download_file(bucket, key, str(temp_path), ExtraArgs=extra_args)
+        sha256 = hash_file_contents(temp_path)
+        size_bytes = temp_path.stat().st_size
+        _ = temp_path.replace(self.get_blob_path(sha256))
+        return CachedArtifact(
+            etag=etag,
+            version_id=version_id,
+            sha256=sha256,
+            size_bytes=size_bytes,
+            last_used=time.time(),
+        )
+
+    def _evict(self, index: ArtifactCacheIndex, *, keep_sha256: str) -> ArtifactCacheIndex:
+        """Delete the least recently used blobs until the cache fits its size limit, keeping the one just fetched."""
+        last_used_by_sha256: dict[str, float] = {}
+        size_by_sha256: dict[str, int] = {}
+        for artifact in index.artifacts.values():  # several URLs can point at identical content
+            last_used_by_sha256[artifact.sha256] = max(last_used_by_sha256.get(artifact.sha256, 0), artifact.last_used)
+            size_by_sha256[artifact.sha256] = artifact.size_bytes
+        total_bytes = sum(size_by_sha256.values())
+        evicted: set[str] = set()
+        for sha256 in sorted(last_used_by_sha256, key=lambda sha256: last_used_by_sha256[sha256]):
+            if total_bytes <= self._max_bytes:
+                break
+            if sha256 == keep_sha256:
+                continue
+            self.get_blob_path(sha256).unlink(missing_ok=True)
+            total_bytes -= size_by_sha256[sha256]
+            evicted.add(sha256)
+            logger.info(f"Evicted {sha256} from the artifact cache")
+        return ArtifactCacheIndex(
+            artifacts={url: artifact for url, artifact in index.artifacts.items() if artifact.sha256 not in evicted}
+        )
@@ -3,54 +3,48 @@ from ephemeral_pulumi_deploy import common_tags_native
 from pulumi import ComponentResource
 from pulumi import ResourceOptions
 from pulumi import export
-from pulumi_aws.iam import GetPolicyDocumentStatementArgs
-from pulumi_aws.iam import GetPolicyDocumentStatementConditionArgs
-from pulumi_aws.iam import GetPolicyDocumentStatementPrincipalArgs
-from pulumi_aws.iam import get_policy_document
-from pulumi_aws.organizations import get_organization
 from pulumi_aws_native import s3
 
+from .iam_policy import PolicyCondition
+from .iam_policy import PolicyPrincipal
+from .iam_policy import PolicyStatement
+from .iam_policy import build_policy_document
+from .program_context import ProgramContext
 
-def create_bucket_policy(bucket_name: str) -> str:
-    org_id = get_organization().id
-    return get_policy_document(
-        statements=[
-            GetPolicyDocumentStatementArgs(
-                effect="Allow",
-                actions=["s3:GetObject", "s3:GetObjectVersion", "s3:GetObjectVersionTagging", "s3:GetObjectTagging"],
-                principals=[
-                    GetPolicyDocumentStatementPrincipalArgs(
-                        type="*",
-                        identifiers=["*"],  # Allows all principals
-                    )
-                ],
-                resources=[f"arn:aws:s3:::{bucket_name}/*"],
-                conditions=[
-                    GetPolicyDocumentStatementConditionArgs(
-                        test="StringEquals",
-                        variable="aws:PrincipalOrgID",
-                        values=[org_id],  # Limit to the AWS Organization
-                    ),
-                ],
+
+def create_bucket_policy(*, bucket_name: str, org_id: str) -> str:
+    return build_policy_document(
+        PolicyStatement(
+            actions=("s3:GetObject", "s3:GetObjectVersion", "s3:GetObjectVersionTagging", "s3:GetObjectTagging"),
+            principals=(
+                PolicyPrincipal(
+                    type="*",
+                    identifiers=("*",),  # Allows all principals
+                ),
             ),
-            GetPolicyDocumentStatementArgs(
-                effect="Allow",
-                principals=[GetPolicyDocumentStatementPrincipalArgs(type="*", identifiers=["*"])],
-                actions=["s3:ListBucket", "s3:ListBucketVersions"],
-                resources=[f"arn:aws:s3:::{bucket_name}"],
-                conditions=[
-                    GetPolicyDocumentStatementConditionArgs(
-                        test="StringEquals", variable="aws:PrincipalOrgID", values=[org_id]
-                    ),
-                ],
+            resources=(f"arn:aws:s3:::{bucket_name}/*",),
+            conditions=(
+                PolicyCondition(
+                    test="StringEquals",
+                    variable="aws:PrincipalOrgID",
+                    values=(org_id,),  # Limit to the AWS Organization
+                ),
             ),
-        ]
-    ).json
+        ),
+        PolicyStatement(
+            principals=(PolicyPrincipal(type="*", identifiers=("*",)),),
+            actions=("s3:ListBucket", "s3:ListBucketVersions"),
+            resources=(f"arn:aws:s3:::{bucket_name}",),
+            conditions=(PolicyCondition(test="StringEquals", variable="aws:PrincipalOrgID", values=(org_id,)),),
+        ),
+    )
 
 
 class RawDataBucket(ComponentResource):
     def __init__(
         self,
+        *,
+        program_context: ProgramContext,
     ):
         super().__init__(
             "labauto:AwsOrgWideRawDataBucket",
@@ -71,7 +65,9 @@ class RawDataBucket(ComponentResource):
             s3.BucketPolicy(
                 append_resource_suffix("raw-data-bucket-policy"),
                 bucket=self.bucket_name,
-                policy_document=self.bucket_name.apply(lambda bucket_name: create_bucket_policy(bucket_name)),
+                policy_document=self.bucket_name.apply(
+                    lambda bucket_name: create_bucket_policy(bucket_name=bucket_name, org_id=program_context.aws_org_id)
+                ),
                 opts=ResourceOptions(parent=self),
             ),
         )
@@ -0,0 +1,263 @@
+"""Estimate the AWS API request rates the fleet's agent settings will generate, and compare them with service quotas.
+
+The rates are modeled from each computer's configuration and from how the Cloud Courier Agent behaves:
+    - a PutMetricData call for every heartbeat, and for every host load sample (both CPU metrics in one call)
+    - on every config refresh, the reads for whichever way the configuration is published (SSM parameters, the
+      consolidated document plus its digest, or AppConfig), and on startup the alias lookup as well
+    - for every new file, a HeadObject to compare checksums and a PutObject to upload it
+
+Steady state spreads those calls evenly over time across the whole fleet. The worst case is the busiest location
+coming back from an outage, with all of its computers starting up within the burst window at once (or within their
+startup delay, if that is configured to be longer).
+
+S3 quotas apply per key prefix and each computer uploads to its own prefix, so S3 is checked per computer instead of
+across the fleet.
+
+The Pulumi program runs the same check with the default assumptions, so a preview fails before an over-quota fleet is
+deployed. Run the planner on its own to see the full report: `uv run python -m cloud_courier_infrastructure.lib.capacity_planner`
+"""
+
+import argparse
+import logging
+import math
+import sys
+from collections import Counter
+from typing import Literal
+
+from pydantic import BaseModel
+
+from ..computers import create_all_computer_configs
+from .constants import DELIVER_CONFIG_WITH_APPCONFIG
+from .constants import PUBLISH_CONSOLIDATED_COMPUTER_CONFIG
+from .models import LabComputerConfig
+from .models import validate_location_upload_bandwidth
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 60 * 60
+DESCRIBE_PARAMETERS_PAGE_SIZE = 50
+DEFAULT_BURST_WINDOW_SECONDS = 60
+DEFAULT_FILES_PER_HOUR_PER_FOLDER = 60.0
+
+PUT_METRIC_DATA = "cloudwatch:PutMetricData"
+DESCRIBE_PARAMETERS = "ssm:DescribeParameters"
+GET_PARAMETER = "ssm:GetParameter"
+HEAD_OBJECT = "s3:HeadObject"
+PUT_OBJECT = "s3:PutObject"
+
+
+class ApiQuota(BaseModel, frozen=True):
+    api_name: str
+    requests_per_second: float
+    scope: Literal["account", "prefix"] = "account"
+
+
+DEFAULT_QUOTAS = (  # the defaults for a new account, check Service Quotas for any increases applied to yours
+    ApiQuota(api_name=PUT_METRIC_DATA, requests_per_second=500),
+    ApiQuota(api_name=DESCRIBE_PARAMETERS, requests_per_second=40),
+    ApiQuota(
+        api_name=GET_PARAMETER, requests_per_second=40
+    ),  # standard throughput, shared with GetParameters and GetParametersByPath
+    ApiQuota(api_name=HEAD_OBJECT, requests_per_second=5500, scope="prefix"),
+    ApiQuota(api_name=PUT_OBJECT, requests_per_second=3500, scope="prefix"),
+)
+
+
+class ApiRate(BaseModel, frozen=True):
+    quota: ApiQuota
+    steady_state_per_second: float
+    worst_case_per_second: float
+
+    @property
+    def headroom(self) -> float:
+        """The fraction of the quota still unused in the worst case (negative when over)."""
+        return 1 - self.worst_case_per_second / self.quota.requests_per_second
+
+    @property
+    def is_exceeded(self) -> bool:
+        return self.worst_case_per_second > self.quota.requests_per_second
+
+
+class ComputerApiCalls(BaseModel, frozen=True):
+    """How many calls one computer makes, per second in steady state, and in total while starting up."""
+
+    steady_state_per_second: dict[str, float]
+    startup_calls: dict[str, float]
+    startup_delay_max_seconds: int
+
+
+def _count_config_refresh_calls(lab_computer_config: LabComputerConfig) -> dict[str, float]:
+    if DELIVER_CONFIG_WITH_APPCONFIG:
+        return {}  # AppConfig sessions replace the SSM reads entirely
+    if PUBLISH_CONSOLIDATED_COMPUTER_CONFIG:
+        return {GET_PARAMETER: 1}  # just the digest, the document itself is only read when it changed
+    num_parameters = 1 + len(lab_computer_config.folders_to_watch)  # the app config plus one per folder
+    return {
+        DESCRIBE_PARAMETERS: math.ceil(num_parameters / DESCRIBE_PARAMETERS_PAGE_SIZE),
+        GET_PARAMETER: num_parameters,
+    }
+
+
+def count_computer_api_calls(
+    lab_computer_config: LabComputerConfig, *, files_per_hour_per_folder: float
+) -> ComputerApiCalls:
+    app_config = lab_computer_config.app_config
+    config_refresh_seconds = app_config.config_refresh_frequency_minutes * SECONDS_PER_MINUTE
+    config_refresh_calls = _count_config_refresh_calls(lab_computer_config)
+    files_per_second = files_per_hour_per_folder * len(lab_computer_config.folders_to_watch) / SECONDS_PER_HOUR
+
+    steady_state_per_second = {
+        PUT_METRIC_DATA: 1 / app_config.heartbeat_frequency_seconds,
+        HEAD_OBJECT: files_per_second,
+        PUT_OBJECT: files_per_second,
+    }
+    if app_config.host_load_metric_frequency_seconds is not None:
+        steady_state_per_second[PUT_METRIC_DATA] += 1 / app_config.host_load_metric_frequency_seconds
+    for api_name, num_calls in config_refresh_calls.items():
+        steady_state_per_second[api_name] = num_calls / config_refresh_seconds
+
+    startup_calls = {PUT_METRIC_DATA: 1.0, **config_refresh_calls}
+    if not DELIVER_CONFIG_WITH_APPCONFIG:
+        startup_calls[GET_PARAMETER] = startup_calls.get(GET_PARAMETER, 0) + 1  # looking up its alias
+        if PUBLISH_CONSOLIDATED_COMPUTER_CONFIG:
+            startup_calls[GET_PARAMETER] += 1  # the first read of the document itself
+    return ComputerApiCalls(
+        steady_state_per_second=steady_state_per_second,
+        startup_calls=startup_calls,
+        startup_delay_max_seconds=app_config.startup_delay_max_seconds,
+    )
+
+
+def compute_api_rates(
+    all_computer_configs: list[LabComputerConfig],
+    *,
+    files_per_hour_per_folder: float = DEFAULT_FILES_PER_HOUR_PER_FOLDER,
+    burst_window_seconds: float = DEFAULT_BURST_WINDOW_SECONDS,
+    quotas: tuple[ApiQuota, ...] = DEFAULT_QUOTAS,
+) -> list[ApiRate]:
+    calls_by_computer = {
+        lab_computer_config.resource_name: count_computer_api_calls(
+            lab_computer_config, files_per_hour_per_folder=files_per_hour_per_folder
+        )
+        for lab_computer_config in all_computer_configs
+    }
+    computers_by_location: dict[str, list[str]] = {}
+    for lab_computer_config in all_computer_configs:
+        computers_by_location.setdefault(lab_computer_config.location.name, []).append(
+            lab_computer_config.resource_name
+        )
+
+    api_rates: list[ApiRate] = []
+    for quota in quotas:
+        if quota.scope == "prefix":
+            # only the busiest single computer matters, since each one uploads to its own prefix
+            steady_state = max(
+                (calls.steady_state_per_second.get(quota.api_name, 0) for calls in calls_by_computer.values()),
+                default=0,
+            )
+            api_rates.append(
+                ApiRate(quota=quota, steady_state_per_second=steady_state, worst_case_per_second=steady_state)
+            )
+            continue
+        steady_state = sum(calls.steady_state_per_second.get(quota.api_name, 0) for calls in calls_by_computer.values())
+        worst_location_startup_per_second = max(
+            (
+                sum(
+                    calls_by_computer[resource_name].startup_calls.get(quota.api_name, 0)
+                    / max(burst_window_seconds, calls_by_computer[resource_name].startup_delay_max_seconds)
+                    for resource_name in resource_names
+                )
+                for resource_names in computers_by_location.values()
+            ),
+            default=0,
+        )
+        api_rates.append(
+            ApiRate(
+                quota=quota,
+                steady_state_per_second=steady_state,
+                worst_case_per_second=steady_state + worst_location_startup_per_second,
+            )
+        )
+    return api_rates
+
+
+def validate_api_quotas(
+    all_computer_configs: list[LabComputerConfig],
+    *,
+    files_per_hour_per_folder: float = DEFAULT_FILES_PER_HOUR_PER_FOLDER,
+    burst_window_seconds: float = DEFAULT_BURST_WINDOW_SECONDS,
+    quotas: tuple[ApiQuota, ...] = DEFAULT_QUOTAS,
+) -> list[ApiRate]:
+    """Compute the fleet's API rates, raising if any of them would exceed its quota."""
+    api_rates = compute_api_rates(
+        all_computer_configs,
+        files_per_hour_per_folder=files_per_hour_per_folder,
+        burst_window_seconds=burst_window_seconds,
+        quotas=quotas,
+    )
+    exceeded = [
+        f"{api_rate.quota.api_name} would reach {api_rate.worst_case_per_second:.1f} requests per second, over the quota of {api_rate.quota.requests_per_second:.0f}"
+        for api_rate in api_rates
+        if api_rate.is_exceeded
+    ]
+    if exceeded:
+        msg = f"The fleet's agent settings would exceed AWS API quotas: {'; '.join(exceeded)}"
+        raise ValueError(msg)
+    return api_rates
+
+
+def format_api_rate(api_rate: ApiRate) -> str:
+    return (
+        f"{api_rate.quota.api_name:>26}: {api_rate.steady_state_per_second:9.3f}/s steady, "
+        f"{api_rate.worst_case_per_second:9.3f}/s worst case, quota {api_rate.quota.requests_per_second:7.0f}/s "
+        f"per {api_rate.quota.scope}, {api_rate.headroom:7.1%} headroom"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Estimate the fleet's AWS API request rates and check them against the default service quotas."
+    )
+    _ = parser.add_argument(
+        "--files-per-hour-per-folder",
+        type=float,
+        default=DEFAULT_FILES_PER_HOUR_PER_FOLDER,
+        help="How many new files to expect in each watched folder.",
+    )
+    _ = parser.add_argument(
+        "--burst-window-seconds",
+        type=float,
+        default=DEFAULT_BURST_WINDOW_SECONDS,
+        help="How spread out the startups of the computers at a location are after an outage.",
+    )
+    args = parser.parse_args(argv)
+
+    all_computer_configs = create_all_computer_configs()
+    validate_location_upload_bandwidth(all_computer_configs)
+    computer_counts = Counter(lab_computer_config.location.name for lab_computer_config in all_computer_configs)
+    print(  # noqa: T201 # this is a CLI report
+        f"{len(all_computer_configs)} computers across {len(computer_counts)} locations (largest: {max(computer_counts.values(), default=0)})"
+    )
+    api_rates = compute_api_rates(
+        all_computer_configs,
+        files_per_hour_per_folder=args.files_per_hour_per_folder,
+        burst_window_seconds=args.burst_window_seconds,
+    )
+    for api_rate in api_rates:
+        print(format_api_rate(api_rate))  # noqa: T201 # this is a CLI report
+    try:
+        _ = validate_api_quotas(
+            all_computer_configs,
+            files_per_hour_per_folder=args.files_per_hour_per_folder,
+            burst_window_seconds=args.burst_window_seconds,
+        )
+    except ValueError:
+        logger.exception("The fleet would exceed an AWS API quota")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1 +1,16 @@
 DOWNLOAD_EXE_FROM_GITHUB = True
+USE_SHARED_NODE_ROLES = False  # opt-in: one tag-scoped IAM role per location instead of one per computer. Switching an existing fleet replaces every Activation, so all computers need to be re-activated
+USE_SEARCH_EXPRESSION_DASHBOARD = (
+    False  # opt-in: one SEARCH-expression heartbeat widget per location instead of one widget per computer
+)
+MAX_NODES_PER_DASHBOARD = (
+    100  # only used with search expression dashboards: larger fleets get one dashboard per location
+)
+USE_SHARED_ALERT_TOPICS = False  # opt-in: one SNS topic per unique set of alert recipients instead of one per computer. Switching sends everyone a new subscription confirmation email
+USE_LOCATION_COMPOSITE_ALARMS = False  # opt-in: one alert per location when all of its computers go silent, suppressing the individual computer alerts during that outage
+PUBLISH_CONSOLIDATED_COMPUTER_CONFIG = False  # opt-in: publish each computer's config as one document plus a digest parameter instead of a parameter per folder. Requires an agent version that reads the consolidated document
+DELIVER_CONFIG_WITH_APPCONFIG = False  # opt-in: also deploy each computer's config document through AWS AppConfig, which agents can poll much more cheaply than SSM parameters
+GATHER_FLEET_INVENTORY = False  # opt-in: a State Manager association gathering SSM Inventory (installed applications and services) from every computer. SSM only allows one inventory association per instance, so leave this off if the account already gathers inventory
+DISTRIBUTOR_PACKAGE_COMPRESSION_LEVEL: int | None = (
+    6  # the zlib level (0-9) to deflate the agent installer package at, or None to store its files uncompressed. Changing it builds a new package checksum, so every computer re-downloads the package once
+)
@@ -1,39 +1,192 @@
 """Models for the Cloud Courier configuration which are shared between the application and infrastructure code."""
 
+import datetime
+import fnmatch
+import hashlib
+import re
+from typing import Literal
+from typing import Self
+
 from pydantic import BaseModel
 from pydantic import Field
+from pydantic import computed_field
+from pydantic import field_validator
+from pydantic import model_validator
 
 SSM_PARAMETER_PREFIX = "/cloud-courier"
 SSM_PARAMETER_PREFIX_TO_ALIASES = f"{SSM_PARAMETER_PREFIX}/computer-aliases"
+CONFIG_DOCUMENT_PARAMETER_NAME = "config"
+CONFIG_DIGEST_PARAMETER_NAME = "config-digest"
 CLOUDWATCH_BASE_NAMESPACE = "CloudCourier"
 CLOUDWATCH_HEARTBEAT_NAMESPACE = f"{CLOUDWATCH_BASE_NAMESPACE}/Heartbeat"
 HEARTBEAT_METRIC_NAME = "Heartbeat"
+CLOUDWATCH_HOST_LOAD_NAMESPACE = f"{CLOUDWATCH_BASE_NAMESPACE}/HostLoad"
+HOST_CPU_METRIC_NAME = "HostCpuUtilization"
+AGENT_CPU_METRIC_NAME = "AgentCpuUtilization"
+HIGH_RESOLUTION_STORAGE_SECONDS = 1
+STANDARD_RESOLUTION_STORAGE_SECONDS = 60
 CLOUDWATCH_INSTANCE_ID_DIMENSION_NAME = "NodeRoleName"
+MIN_MULTIPART_PART_SIZE_BYTES = 5 * 1024 * 1024  # S3 limits for every part except the last one
+MAX_MULTIPART_PART_SIZE_BYTES = 5 * 1024 * 1024 * 1024
+DEFAULT_MULTIPART_PART_SIZE_BYTES = 8 * 1024 * 1024
+DAYS_PER_WEEK = 7
+MATCH_EVERYTHING_PATTERNS = ("*", "**")
+GLOB_SPECIAL_CHARACTERS = frozenset("*?[]")
+MAX_SETTLE_SECONDS = 24 * 60 * 60
+type ChangeDetectionMode = Literal["path-only", "size-mtime", "full-hash"]
+_WINDOWS_DRIVE_REGEX = re.compile(r"^[A-Za-z]:")
+
+
+def _normalize_glob_pattern(pattern: str) -> str:
+    """Convert to forward slashes and reject patterns that could never match a path relative to the watched folder."""
+    normalized = pattern.strip().replace("\\", "/")
+    if not normalized:
+        msg = "Glob patterns can't be empty"
+        raise ValueError(msg)
+    if normalized.startswith("/") or _WINDOWS_DRIVE_REGEX.match(normalized) is not None:
+        msg = f"Glob pattern {pattern!r} must be relative to the folder being watched"
+        raise ValueError(msg)
+    if ".." in normalized.split("/"):
+        msg = f"Glob pattern {pattern!r} can't refer to a parent folder"
+        raise ValueError(msg)
+    _validate_character_sets(pattern=pattern, normalized=normalized)
+    return normalized
+
+
+def _validate_character_sets(*, pattern: str, normalized: str) -> None:
+    """Walk the sets the way fnmatch parses them, where a `]` right after the opening `[` (or `[!`) is a member."""
+    index = 0
+    while index < len(normalized):
+        if normalized[index] == "]":
+            msg = f"Glob pattern {pattern!r} has a ']' without a matching '['"
+            raise ValueError(msg)
+        if normalized[index] == "[":
+            set_start = index + 1
+            if normalized.startswith("!", set_start):
+                set_start += 1
+            if normalized.startswith("]", set_start):
+                set_start += 1
+            set_end = normalized.find("]", set_start)
+            if set_end == -1:
+                msg = f"Glob pattern {pattern!r} has an unclosed character set"
+                raise ValueError(msg)
+            index = set_end
+        index += 1
+
+
+def _is_literal(pattern: str) -> bool:
+    return not GLOB_SPECIAL_CHARACTERS.intersection(pattern)
+
+
+def _skips_every_match(*, ignore_pattern: str, file_pattern: str) -> bool:
+    """Whether the ignore pattern provably matches every path file_pattern can match.
+
+    Besides patterns matching everything and an exact repeat of file_pattern, that's a `*suffix` or `prefix*` ignore
+    pattern whose literal part file_pattern itself ends or starts with (`*` also matches across folders). Other
+    overlaps, e.g. between two character sets, aren't detected.
+    """
+    ignore_pattern = ignore_pattern.lower()
+    file_pattern = file_pattern.lower()
+    if ignore_pattern in MATCH_EVERYTHING_PATTERNS or ignore_pattern == file_pattern:
+        return True
+    suffix = ignore_pattern.lstrip("*")
+    if suffix != ignore_pattern and _is_literal(suffix) and file_pattern.endswith(suffix):
+        return True
+    prefix = ignore_pattern.rstrip("*")
+    return prefix != ignore_pattern and _is_literal(prefix) and file_pattern.startswith(prefix)
 
 
 class FolderToWatch(BaseModel, frozen=True):
     config_format_version: str = "1.0"
     folder_path: str
     recursive: bool = True
-    file_pattern: str = "*"  # TODO: implement
-    ignore_patterns: list[str] = Field(default_factory=list)  # TODO: implement
+    file_pattern: str = "*"
+    """A glob (fnmatch style, where `*` also matches across folders) for the files to upload, matched case-insensitively against the path relative to folder_path with forward slashes."""
+    ignore_patterns: list[str] = Field(default_factory=list)
+    """Globs, matched the same way as file_pattern, for files to skip even though file_pattern matches them."""
     s3_key_prefix: str = "will-be-filled-in-by-other-code"
     s3_bucket_name: str = "will-be-filled-in-by-other-code"
+    settle_seconds: int = 0
+    """Wait until a file's size and modification time have stayed the same for this long before uploading it, so files still being written by the instrument aren't uploaded repeatedly."""
+    change_detection: ChangeDetectionMode = "path-only"
+    """How the agent decides whether a file was already uploaded, especially when scanning the folder on startup:
+        - path-only: any file whose path was uploaded before is skipped (the cheapest, but misses files that are rewritten in place)
+        - size-mtime: re-upload when the size or modification time differ from what was uploaded
+        - full-hash: always checksum the file and compare with the uploaded object (can substantially slow down startup for folders with lots of large files)
+    """
     # TODO: allow truncating part of the file path prefix
     # TODO: allow deleting after upload
-    # TODO: allow specifying a wait period before upload.
     # TODO: add dict of extra key/value pairs to add as metadata to the S3 object (e.g. instrument serial number)
-    # TODO: add a bool if you expect files to change and want to always fully calculate checksums even if the file path itself has already been uploaded (can substantially slow down startup time if lots of large files in the folder)
 
+    @field_validator("file_pattern")
+    @classmethod
+    def normalize_file_pattern(cls, file_pattern: str) -> str:
+        return _normalize_glob_pattern(file_pattern)
 
-# TODO: check the whole list of folders to watch and confirm there's no overlaps
+    @field_validator("ignore_patterns")
+    @classmethod
+    def normalize_ignore_patterns(cls, ignore_patterns: list[str]) -> list[str]:
+        # sorted and deduplicated, so equivalent configs publish identical documents
+        return sorted({_normalize_glob_pattern(pattern) for pattern in ignore_patterns})
 
+    @model_validator(mode="after")
+    def validate_patterns_not_contradictory(self) -> Self:
+        for ignore_pattern in self.ignore_patterns:
+            if _skips_every_match(ignore_pattern=ignore_pattern, file_pattern=self.file_pattern):
+                msg = f"Ignore pattern {ignore_pattern!r} would skip every file matched by {self.file_pattern!r} in {self.folder_path}"
+                raise ValueError(msg)
+        _ = re.compile(self.path_matcher_regex)
+        return self
+
+    @model_validator(mode="after")
+    def validate_settle_seconds(self) -> Self:
+        if not 0 <= self.settle_seconds <= MAX_SETTLE_SECONDS:
+            msg = f"settle_seconds ({self.settle_seconds}) for {self.folder_path} must be between 0 and {MAX_SETTLE_SECONDS}"
+            raise ValueError(msg)
+        return self
+
+    @computed_field
+    @property
+    def path_matcher_regex(self) -> str:
+        """A single regex combining file_pattern and ignore_patterns, so the agent can filter each path with one match instead of looping over the globs."""
+        file_regex = fnmatch.translate(self.file_pattern)
+        if not self.ignore_patterns:
+            return f"(?i){file_regex}"
+        ignore_regex = "|".join(fnmatch.translate(pattern) for pattern in self.ignore_patterns)
+        return f"(?i)(?!{ignore_regex}){file_regex}"
 
-# Future AppConfig level settings:
-# TODO: add time windows where upload/monitoring should be fully paused (e.g. only upload on weekends or at night)
 
-# TODO: add the ability to check that CPU usage has been sufficiently low the past X hours before beginning upload (concerns about an overnight run having been started, even when upload is normally restricted to night time only)
+class UploadWindow(BaseModel, frozen=True):
+    """A recurring time window (in the computer's local time) when uploading is allowed, and how hard it may use the network."""
 
+    days_of_week: list[int] = Field(default_factory=lambda: list(range(DAYS_PER_WEEK)))
+    """The days the window starts on, 0 being Monday."""
+    start_time: datetime.time = datetime.time(0, 0)
+    end_time: datetime.time = datetime.time(0, 0)
+    """If it's not after start_time, the window runs past midnight into the next day (so the defaults are the whole day)."""
+    max_bandwidth_bytes_per_second: int | None = None
+    """None means no limit."""
+    max_concurrent_uploads: int = 4
+    multipart_part_size_bytes: int = DEFAULT_MULTIPART_PART_SIZE_BYTES
+
+    @model_validator(mode="after")
+    def validate_limits(self) -> Self:
+        if not self.days_of_week or any(not 0 <= day < DAYS_PER_WEEK for day in self.days_of_week):
+            msg = f"days_of_week ({self.days_of_week}) must contain at least one day, each between 0 (Monday) and {DAYS_PER_WEEK - 1} (Sunday)"
+            raise ValueError(msg)
+        if self.max_bandwidth_bytes_per_second is not None and self.max_bandwidth_bytes_per_second <= 0:
+            msg = f"max_bandwidth_bytes_per_second ({self.max_bandwidth_bytes_per_second}) must be positive, remove the window to pause uploads instead"
+            raise ValueError(msg)
+        if self.max_concurrent_uploads < 1:
+            msg = f"max_concurrent_uploads ({self.max_concurrent_uploads}) must be at least 1"
+            raise ValueError(msg)
+        if not MIN_MULTIPART_PART_SIZE_BYTES <= self.multipart_part_size_bytes <= MAX_MULTIPART_PART_SIZE_BYTES:
+            msg = f"multipart_part_size_bytes ({self.multipart_part_size_bytes}) must be between {MIN_MULTIPART_PART_SIZE_BYTES} and {MAX_MULTIPART_PART_SIZE_BYTES}"
+            raise ValueError(msg)
+        return self
+
+
+# Future AppConfig level settings:
 # TODO: (maybe just infra-side) add heartbeat alert time window. add times when not to check for heartbeats (e.g. if computer is regularly turned off at night or weekends)
 
 
@@ -42,3 +195,86 @@ class AppConfig(BaseModel, frozen=True):
     config_refresh_frequency_minutes: int = 60
     heartbeat_frequency_seconds: int = 60
     """If it's been this long since the last heartbeat, send another one."""
+    heartbeat_storage_resolution_seconds: Literal[1, 60] = STANDARD_RESOLUTION_STORAGE_SECONDS
+    """The StorageResolution to publish the heartbeat metric with. Alarms with periods under a minute need high-resolution (1 second) metrics."""
+    startup_delay_max_seconds: int = 0
+    """After starting up, wait up to this long before the first config refresh and heartbeat, so a whole location rebooting at once doesn't hit AWS in lockstep."""
+    startup_delay_offset_seconds: int | None = None
+    """The exact startup delay to use. If None, the agent picks a random delay up to startup_delay_max_seconds."""
+    config_refresh_jitter_seconds: int = 0
+    """Shift each config refresh by up to this long, so computers that started together drift apart."""
+    config_refresh_offset_seconds: int | None = None
+    """The exact shift to use for every config refresh. If None, the agent picks a random one each time up to config_refresh_jitter_seconds."""
+    retry_backoff_base_seconds: float = 1.0
+    """How long to wait before the first retry of a throttled or failed AWS call, doubled (with full jitter) on each retry after that."""
+    retry_backoff_max_seconds: int = 300
+    """The ceiling for the exponential backoff between retries."""
+    upload_windows: list[UploadWindow] | None = None
+    """When uploading is allowed, and with what limits. Outside of every window, uploads are paused. None means upload at any time without limits (unless the computer's location sets default windows)."""
+    upload_cpu_idle_threshold_percent: float | None = None
+    """Only start uploading once the host's CPU usage has stayed below this for the whole lookback window, so e.g. an overnight acquisition run that was started inside an upload window isn't disturbed. None disables the check."""
+    upload_cpu_idle_lookback_minutes: int = 120
+    """The lookback window, in minutes, that the host's CPU usage must stay below upload_cpu_idle_threshold_percent for before uploads start. Ignored when the threshold is None."""
+    host_load_metric_frequency_seconds: int | None = 300
+    """How often to publish the host's and the agent's own CPU usage to CloudWatch. None disables publishing (CPU is still sampled locally if uploads are gated on it)."""
+
+    @model_validator(mode="after")
+    def validate_timing(self) -> Self:
+        if self.startup_delay_max_seconds < 0:
+            msg = f"startup_delay_max_seconds ({self.startup_delay_max_seconds}) can't be negative"
+            raise ValueError(msg)
+        if self.config_refresh_jitter_seconds < 0:
+            msg = f"config_refresh_jitter_seconds ({self.config_refresh_jitter_seconds}) can't be negative"
+            raise ValueError(msg)
+        if self.startup_delay_offset_seconds is not None and not (
+            0 <= self.startup_delay_offset_seconds <= self.startup_delay_max_seconds
+        ):
+            msg = f"startup_delay_offset_seconds ({self.startup_delay_offset_seconds}) must be between 0 and startup_delay_max_seconds ({self.startup_delay_max_seconds})"
+            raise ValueError(msg)
+        if self.config_refresh_jitter_seconds >= self.config_refresh_frequency_minutes * 60:
+            msg = f"config_refresh_jitter_seconds ({self.config_refresh_jitter_seconds}) must be shorter than the config refresh period of {self.config_refresh_frequency_minutes} minutes"
+            raise ValueError(msg)
+        if self.config_refresh_offset_seconds is not None and not (
+            0 <= self.config_refresh_offset_seconds <= self.config_refresh_jitter_seconds
+        ):
+            msg = f"config_refresh_offset_seconds ({self.config_refresh_offset_seconds}) must be between 0 and config_refresh_jitter_seconds ({self.config_refresh_jitter_seconds})"
+            raise ValueError(msg)
+        if self.upload_cpu_idle_threshold_percent is not None and not 0 < self.upload_cpu_idle_threshold_percent <= 100:  # noqa: PLR2004 # it's a percentage
+            msg = f"upload_cpu_idle_threshold_percent ({self.upload_cpu_idle_threshold_percent}) must be between 0 and 100"
+            raise ValueError(msg)
+        if self.upload_cpu_idle_lookback_minutes < 1:
+            msg = f"upload_cpu_idle_lookback_minutes ({self.upload_cpu_idle_lookback_minutes}) must be at least 1"
+            raise ValueError(msg)
+        if self.host_load_metric_frequency_seconds is not None and self.host_load_metric_frequency_seconds < 1:
+            msg = f"host_load_metric_frequency_seconds ({self.host_load_metric_frequency_seconds}) must be at least 1, or None to stop publishing"
+            raise ValueError(msg)
+        if not 0 < self.retry_backoff_base_seconds <= self.retry_backoff_max_seconds:
+            msg = f"retry_backoff_base_seconds ({self.retry_backoff_base_seconds}) must be positive and no more than retry_backoff_max_seconds ({self.retry_backoff_max_seconds})"
+            raise ValueError(msg)
+        return self
+
+    def with_deterministic_offsets(self, *, seed: str) -> Self:
+        """Fill in any unset offsets from a hash of the seed, so each computer gets a stable, evenly spread slot instead of depending on the agent's randomness."""
+        seed_hash = int.from_bytes(hashlib.sha256(seed.encode("utf-8")).digest()[:8])
+        update: dict[str, int] = {}
+        if self.startup_delay_offset_seconds is None and self.startup_delay_max_seconds > 0:
+            update["startup_delay_offset_seconds"] = seed_hash % (self.startup_delay_max_seconds + 1)
+        if self.config_refresh_offset_seconds is None and self.config_refresh_jitter_seconds > 0:
+            update["config_refresh_offset_seconds"] = (seed_hash >> 32) % (self.config_refresh_jitter_seconds + 1)
+        return self.model_copy(update=update)
+
+
+class ComputerConfigDocument(BaseModel, frozen=True):
+    """The full effective configuration of one computer, published as a single SSM parameter.
+
+    Alongside it, a small digest parameter holds the hash of the document, so the agent can check just the digest on
+    each refresh and only fetch the document when it has changed.
+    """
+
+    config_format_version: str = "1.0"
+    app_config: AppConfig
+    folders_to_watch: dict[str, FolderToWatch]
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.model_dump_json().encode("utf-8")).hexdigest()
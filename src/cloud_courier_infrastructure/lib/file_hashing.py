@@ -0,0 +1,151 @@
+"""SHA-256 digests of local files, memoized across runs so unchanged files are never read again.
+
+Every preview hashes the files it uploads to S3 to decide whether the upload command needs to run. Each digest is now
+stored in a sidecar index next to the artifact cache, keyed by the resolved path and validated against the file's size,
+modification time and inode, so a later run only needs a `stat`.
+
+A file modified within the last couple of seconds isn't memoized: on filesystems with coarse timestamps it could be
+changed again without its modification time moving (the same "racily clean" problem git handles in its index).
+"""
+
+import functools
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import gettempdir
+
+from pydantic import BaseModel
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_CACHE_DIR_ENV_VAR = "CLOUD_COURIER_ARTIFACT_CACHE_DIR"
+DIGEST_INDEX_FILE_NAME = "file-digests.json"
+READ_BUFFER_BYTES = 8 * 1024 * 1024
+RACY_MTIME_WINDOW_NS = 2 * 1_000_000_000
+MAX_HASHING_WORKERS = 4
+
+
+def get_default_cache_dir() -> Path:
+    return Path(os.environ.get(ARTIFACT_CACHE_DIR_ENV_VAR, Path(gettempdir()) / "cloud-courier-artifact-cache"))
+
+
+def hash_file_contents(file_path: Path) -> str:
+    """Hash the file through a memory map, so it's read by the OS in large pages instead of small Python reads.
+
+    Empty files can't be memory mapped, and some filesystems don't support it, so those fall back to large buffered
+    reads.
+    """
+    sha = hashlib.sha256()
+    with file_path.open("rb") as file:
+        try:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                sha.update(mapped)  # hashlib releases the GIL for large buffers, so concurrent hashing scales
+        except (ValueError, OSError):
+            _ = file.seek(0)
+            for chunk in iter(lambda: file.read(READ_BUFFER_BYTES), b""):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+class FileDigest(BaseModel, frozen=True):
+    size_bytes: int
+    mtime_ns: int
+    inode: int
+    sha256: str
+
+    def matches(self, stat_result: os.stat_result) -> bool:
+        return (
+            self.size_bytes == stat_result.st_size
+            and self.mtime_ns == stat_result.st_mtime_ns
+            and self.inode == stat_result.st_ino
+        )
+
+
+class FileDigestIndex(BaseModel, frozen=True):
+    digests: dict[str, FileDigest] = Field(default_factory=dict[str, FileDigest])
+    """Keyed by the resolved path of the file."""
+
+
+class FileDigestCache:
+    def __init__(self, *, index_path: Path | None = None) -> None:
+        super().__init__()
+        self._index_path = get_default_cache_dir() / DIGEST_INDEX_FILE_NAME if index_path is None else index_path
+        self._lock = threading.Lock()
+        self._digests = self._read_index().digests
+
+    def _read_index(self) -> FileDigestIndex:
+        if not self._index_path.exists():
+            return FileDigestIndex()
+        try:
+            return FileDigestIndex.model_validate_json(self._index_path.read_text(encoding="utf-8"))
+        except ValueError:
+            logger.warning(f"Ignoring the unreadable file digest index at {self._index_path}")
+            return FileDigestIndex()
+
+    def _write_index(self) -> None:
+        # merged with whatever other runs recorded meanwhile, and replaced atomically
+        digests = {**self._read_index().digests, **self._digests}
+        digests = {path: digest for path, digest in digests.items() if Path(path).exists()}
+        self._index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self._index_path.with_name(f"{DIGEST_INDEX_FILE_NAME}.{os.getpid()}.tmp")
+        _ = temp_path.write_text(FileDigestIndex(digests=digests).model_dump_json(indent=2), encoding="utf-8")
+        _ = temp_path.replace(self._index_path)
+
+    def _remember(self, *, file_path: Path, stat_result: os.stat_result, sha256: str) -> bool:
+        if time.time_ns() - stat_result.st_mtime_ns < RACY_MTIME_WINDOW_NS:
+            return False
+        self._digests[str(file_path)] = FileDigest(
+            size_bytes=stat_result.st_size, mtime_ns=stat_result.st_mtime_ns, inode=stat_result.st_ino, sha256=sha256
+        )
+        return True
+
+    def _get_sha256(self, file_path: Path) -> tuple[str, bool]:
+        """Return the digest, and whether a new one was memoized."""
+        file_path = file_path.resolve()
+        stat_result = file_path.stat()
+        with self._lock:
+            cached = self._digests.get(str(file_path))
+        if cached is not None and cached.matches(stat_result):
+            return cached.sha256, False
+        sha256 = hash_file_contents(file_path)
+        if file_path.stat().st_mtime_ns != stat_result.st_mtime_ns:
+            return sha256, False  # it changed while being read
+        with self._lock:
+            return sha256, self._remember(file_path=file_path, stat_result=stat_result, sha256=sha256)
+
+    def get_sha256(self, file_path: Path) -> str:
+        sha256, is_new = self._get_sha256(file_path)
+        if is_new:
+            with self._lock:
+                self._write_index()
+        return sha256
+
+    def get_sha256_many(self, file_paths: Iterable[Path], *, max_workers: int = MAX_HASHING_WORKERS) -> dict[Path, str]:
+        """Hash all the files concurrently (at most max_workers at a time), and save the index once at the end."""
+        file_paths = list(file_paths)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._get_sha256, file_paths))
+        if any(is_new for _, is_new in results):
+            with self._lock:
+                self._write_index()
+        return {file_path: sha256 for file_path, (sha256, _) in zip(file_paths, results, strict=True)}
+
+
+@functools.cache
+def get_file_digest_cache() -> FileDigestCache:
+    return FileDigestCache()
+
+
+def get_sha256(file_path: Path) -> str:
+    return get_file_digest_cache().get_sha256(file_path)
+
+
+def get_sha256_many(file_paths: Iterable[Path]) -> dict[Path, str]:
+    return get_file_digest_cache().get_sha256_many(file_paths)
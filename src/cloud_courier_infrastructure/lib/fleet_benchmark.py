@@ -0,0 +1,347 @@
+"""Offline benchmark of the Pulumi program against synthetic fleets of lab computers.
+
+The program is run with Pulumi mocks, so no cloud credentials are needed. For each fleet size the wall time, peak
+memory, resource count and provider invoke count are measured, normalized per node, and compared against a stored
+baseline so that a change which makes every node cost more is caught before it reaches a real preview. Each opt-in
+setting in constants.py is also benchmarked on its own, since it changes which resources every node creates.
+
+Run the benchmark: `uv run python -m cloud_courier_infrastructure.lib.fleet_benchmark`
+Re-record the baseline: `uv run python -m cloud_courier_infrastructure.lib.fleet_benchmark --update-baseline`
+"""
+
+import argparse
+import logging
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+from typing import override
+
+import pulumi
+from pulumi.runtime import MockCallArgs
+from pulumi.runtime import MockResourceArgs
+from pulumi.runtime import Mocks
+from pulumi.runtime import set_all_config
+from pulumi.runtime import set_mocks
+from pydantic import BaseModel
+from pydantic import Field
+
+from . import program
+from .courier_config_models import FolderToWatch
+from .models import AlertingConfig
+from .models import ComputerLocation
+from .models import LabComputerConfig
+from .program import pulumi_program
+from .program_context import ProgramContext
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_MODULE_NAME = "cloud_courier_infrastructure.lib.fleet_benchmark"
+DEFAULT_FLEET_SIZES = (10, 100, 1000)
+DEFAULT_OPT_IN_FLEET_SIZES = (100,)
+OPT_IN_FLAG_NAMES = (
+    "USE_SHARED_NODE_ROLES",
+    "USE_SEARCH_EXPRESSION_DASHBOARD",
+    "USE_SHARED_ALERT_TOPICS",
+    "USE_LOCATION_COMPOSITE_ALARMS",
+    "PUBLISH_CONSOLIDATED_COMPUTER_CONFIG",
+    "DELIVER_CONFIG_WITH_APPCONFIG",
+    "GATHER_FLEET_INVENTORY",
+)
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "fleet_benchmark_baseline.json"
+BENCHMARK_PROJECT_NAME = "cloud-courier"
+BENCHMARK_STACK_NAME = "bench"
+BENCHMARK_AWS_ACCOUNT_ID = "123456789012"
+BENCHMARK_CONFIG = {
+    "proj:env": "dev",
+    "proj:pulumi_project_name": BENCHMARK_PROJECT_NAME,
+    "proj:aws_org_home_region": "us-east-1",
+    "proj:github_repo_name": "cloud-courier-infrastructure",
+    "proj:git_repository_url": "https://github.com/ejfine/cloud-courier-infrastructure",
+    "aws:region": "us-east-1",
+}
+BENCHMARK_PROGRAM_CONTEXT = ProgramContext(
+    aws_account_id=BENCHMARK_AWS_ACCOUNT_ID,
+    aws_org_id="o-benchmark",
+    aws_region="us-east-1",
+    central_infra_ssm_packages_bucket_name="benchmark-ssm-packages",
+)
+NUM_SYNTHETIC_LOCATIONS = 5
+BYTES_PER_MEBIBYTE = 1024 * 1024
+BYTES_PER_MAXRSS_UNIT = 1024  # on Linux, ru_maxrss is reported in KiB
+
+
+class FleetBenchmarkMocks(Mocks):
+    """Pulumi mocks that count every resource registration and provider invoke."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.resource_counts: Counter[str] = Counter()
+        self.invoke_counts: Counter[str] = Counter()
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[Any, Any]]:
+        self.resource_counts[args.typ] += 1
+        outputs: dict[str, Any] = {
+            **args.inputs,  # type: ignore[reportUnknownMemberType] # the mock args are untyped in the Pulumi SDK
+            "arn": f"arn:aws:mock:us-east-1:{BENCHMARK_AWS_ACCOUNT_ID}:{args.name}",
+        }
+        return f"{args.name}-id", outputs
+
+    @override
+    def call(self, args: MockCallArgs) -> tuple[dict[Any, Any], list[tuple[str, str]] | None]:
+        self.invoke_counts[args.token] += 1
+        return {}, []
+
+
+class FleetBenchmarkResult(BaseModel, frozen=True):
+    fleet_size: int
+    opt_in_flag: str | None = None
+    wall_seconds: float
+    peak_memory_bytes: int
+    resource_counts: dict[str, int] = Field(default_factory=dict)
+    invoke_counts: dict[str, int] = Field(default_factory=dict)
+
+    @property
+    def resource_count(self) -> int:
+        return sum(self.resource_counts.values())
+
+    @property
+    def invoke_count(self) -> int:
+        return sum(self.invoke_counts.values())
+
+    @property
+    def wall_seconds_per_node(self) -> float:
+        return self.wall_seconds / self.fleet_size
+
+    @property
+    def peak_memory_bytes_per_node(self) -> float:
+        return self.peak_memory_bytes / self.fleet_size
+
+    @property
+    def resources_per_node(self) -> float:
+        return self.resource_count / self.fleet_size
+
+    @property
+    def invokes_per_node(self) -> float:
+        return self.invoke_count / self.fleet_size
+
+
+class FleetBenchmarkBaseline(BaseModel):
+    results: dict[int, FleetBenchmarkResult] = Field(default_factory=dict[int, FleetBenchmarkResult])
+    opt_in_results: dict[str, dict[int, FleetBenchmarkResult]] = Field(
+        default_factory=dict[str, dict[int, FleetBenchmarkResult]]
+    )
+    """Keyed by the opt-in flag that was enabled, then by the fleet size."""
+
+
+def create_synthetic_fleet(fleet_size: int) -> list[LabComputerConfig]:
+    """Create lab computers spread evenly across a handful of locations, each watching a couple of folders."""
+    locations = [ComputerLocation(name=f"Site-{index}") for index in range(NUM_SYNTHETIC_LOCATIONS)]
+    return [
+        LabComputerConfig(
+            name=f"Instrument-{index}",
+            location=locations[index % NUM_SYNTHETIC_LOCATIONS],
+            alerting_config=AlertingConfig(emails=[f"owner-{index % 7}@example.com"]),
+            folders_to_watch={
+                "images": FolderToWatch(folder_path=rf"C:\data\instrument-{index}\images"),
+                "logs": FolderToWatch(folder_path=rf"C:\data\instrument-{index}\logs", recursive=False),
+            },
+        )
+        for index in range(fleet_size)
+    ]
+
+
+def run_program_with_mocks(
+    all_computer_configs: list[LabComputerConfig], *, mocks: FleetBenchmarkMocks | None = None
+) -> FleetBenchmarkMocks:
+    if mocks is None:
+        mocks = FleetBenchmarkMocks()
+    set_all_config(BENCHMARK_CONFIG)
+    set_mocks(mocks, project=BENCHMARK_PROJECT_NAME, stack=BENCHMARK_STACK_NAME, preview=True)
+
+    @pulumi.runtime.test  # type: ignore[reportUnknownMemberType,reportUntypedFunctionDecorator] # the decorator is untyped in the Pulumi SDK
+    def _run_program() -> None:
+        pulumi_program(
+            all_computer_configs=all_computer_configs,
+            include_agent_installer=False,
+            program_context=BENCHMARK_PROGRAM_CONTEXT,
+        )
+
+    _run_program()
+    return mocks
+
+
+def enable_opt_in_flag(flag_name: str) -> None:
+    """Turn on one of the opt-in settings from constants.py for every program run in the rest of this process."""
+    if flag_name not in OPT_IN_FLAG_NAMES:
+        msg = f"{flag_name} is not one of the opt-in flags: {', '.join(OPT_IN_FLAG_NAMES)}"
+        raise ValueError(msg)
+    setattr(program, flag_name, True)
+
+
+def run_fleet_benchmark_in_process(fleet_size: int, *, opt_in_flag: str | None = None) -> FleetBenchmarkResult:
+    """Run the benchmark in this process, which should not have run a Pulumi program before."""
+    if opt_in_flag is not None:
+        enable_opt_in_flag(opt_in_flag)
+    # warm up the lazily imported provider modules so they don't count against the measured run
+    _ = run_program_with_mocks(create_synthetic_fleet(1))
+    all_computer_configs = create_synthetic_fleet(fleet_size)
+    max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    mocks = run_program_with_mocks(all_computer_configs)
+    wall_seconds = time.perf_counter() - start_time
+    max_rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return FleetBenchmarkResult(
+        fleet_size=fleet_size,
+        opt_in_flag=opt_in_flag,
+        wall_seconds=wall_seconds,
+        peak_memory_bytes=(max_rss_after - max_rss_before) * BYTES_PER_MAXRSS_UNIT,
+        resource_counts=dict(mocks.resource_counts),
+        invoke_counts=dict(mocks.invoke_counts),
+    )
+
+
+def run_fleet_benchmark(fleet_size: int, *, opt_in_flag: str | None = None) -> FleetBenchmarkResult:
+    """Run the benchmark in a fresh interpreter, so peak memory and the Pulumi runtime state (and flags) are isolated."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result_path = Path(temp_dir) / "result.json"
+        _ = subprocess.run(  # noqa: S603 # the command is fully controlled here
+            [
+                sys.executable,
+                "-m",
+                BENCHMARK_MODULE_NAME,
+                f"--worker-fleet-size={fleet_size}",
+                f"--worker-result-path={result_path}",
+                *([] if opt_in_flag is None else [f"--worker-opt-in-flag={opt_in_flag}"]),
+            ],
+            check=True,
+        )
+        return FleetBenchmarkResult.model_validate_json(result_path.read_text(encoding="utf-8"))
+
+
+def find_regressions(
+    *,
+    result: FleetBenchmarkResult,
+    baseline: FleetBenchmarkResult,
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> list[str]:
+    """Compare a result against the baseline for the same fleet size.
+
+    Resource and invoke counts are deterministic, so any increase is a regression. Wall time and memory vary between
+    runs, so they only regress once they exceed the baseline by more than the given tolerance ratio.
+    """
+    regressions: list[str] = []
+    if result.resources_per_node > baseline.resources_per_node:
+        regressions.append(
+            f"resources per node rose from {baseline.resources_per_node:.2f} to {result.resources_per_node:.2f}"
+        )
+    if result.invokes_per_node > baseline.invokes_per_node:
+        regressions.append(
+            f"invokes per node rose from {baseline.invokes_per_node:.2f} to {result.invokes_per_node:.2f}"
+        )
+    if result.wall_seconds_per_node > baseline.wall_seconds_per_node * time_tolerance:
+        regressions.append(
+            f"wall time per node rose from {baseline.wall_seconds_per_node * 1000:.1f}ms to {result.wall_seconds_per_node * 1000:.1f}ms (tolerance x{time_tolerance})"
+        )
+    if result.peak_memory_bytes_per_node > baseline.peak_memory_bytes_per_node * memory_tolerance:
+        regressions.append(
+            f"peak memory per node rose from {baseline.peak_memory_bytes_per_node / BYTES_PER_MEBIBYTE:.3f}MiB to {result.peak_memory_bytes_per_node / BYTES_PER_MEBIBYTE:.3f}MiB (tolerance x{memory_tolerance})"
+        )
+    return regressions
+
+
+def format_result(result: FleetBenchmarkResult) -> str:
+    return (
+        f"{result.fleet_size:>6} nodes{'' if result.opt_in_flag is None else f' with {result.opt_in_flag}'}: "
+        f"{result.wall_seconds:8.2f}s total, {result.wall_seconds_per_node * 1000:8.1f}ms/node, "
+        f"{result.peak_memory_bytes_per_node / BYTES_PER_MEBIBYTE:7.3f}MiB/node peak, "
+        f"{result.resources_per_node:6.2f} resources/node, {result.invokes_per_node:6.2f} invokes/node"
+    )
+
+
+def load_baseline(baseline_path: Path) -> FleetBenchmarkBaseline:
+    if not baseline_path.exists():
+        return FleetBenchmarkBaseline()
+    return FleetBenchmarkBaseline.model_validate_json(baseline_path.read_text(encoding="utf-8"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Pulumi program offline against synthetic fleets.")
+    _ = parser.add_argument(
+        "--fleet-sizes",
+        type=int,
+        nargs="*",
+        default=list(DEFAULT_FLEET_SIZES),
+        help="The fleet sizes to benchmark with the defaults. Pass none to only benchmark the opt-in flags.",
+    )
+    _ = parser.add_argument(
+        "--opt-in-flags",
+        nargs="*",
+        choices=OPT_IN_FLAG_NAMES,
+        default=list(OPT_IN_FLAG_NAMES),
+        help="The opt-in flags to benchmark one at a time on top of the defaults. Pass none to skip them.",
+    )
+    _ = parser.add_argument("--opt-in-fleet-sizes", type=int, nargs="*", default=list(DEFAULT_OPT_IN_FLEET_SIZES))
+    _ = parser.add_argument("--baseline-path", type=Path, default=DEFAULT_BASELINE_PATH)
+    _ = parser.add_argument(
+        "--update-baseline", action="store_true", help="Record these results as the new baseline instead of comparing."
+    )
+    _ = parser.add_argument("--time-tolerance", type=float, default=1.5)
+    _ = parser.add_argument("--memory-tolerance", type=float, default=1.25)
+    _ = parser.add_argument("--worker-fleet-size", type=int, help=argparse.SUPPRESS)
+    _ = parser.add_argument("--worker-result-path", type=Path, help=argparse.SUPPRESS)
+    _ = parser.add_argument("--worker-opt-in-flag", choices=OPT_IN_FLAG_NAMES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker_fleet_size is not None:
+        result = run_fleet_benchmark_in_process(args.worker_fleet_size, opt_in_flag=args.worker_opt_in_flag)
+        _ = args.worker_result_path.write_text(result.model_dump_json(), encoding="utf-8")
+        return 0
+
+    baseline = load_baseline(args.baseline_path)
+    all_regressions: list[str] = []
+    runs: list[tuple[int, str | None]] = [
+        *((fleet_size, None) for fleet_size in args.fleet_sizes),
+        *((fleet_size, flag_name) for flag_name in args.opt_in_flags for fleet_size in args.opt_in_fleet_sizes),
+    ]
+    for fleet_size, opt_in_flag in runs:
+        result = run_fleet_benchmark(fleet_size, opt_in_flag=opt_in_flag)
+        print(format_result(result))  # noqa: T201 # this is a CLI report
+        baseline_results = (
+            baseline.results if opt_in_flag is None else baseline.opt_in_results.setdefault(opt_in_flag, {})
+        )
+        run_description = f"{fleet_size} nodes" if opt_in_flag is None else f"{fleet_size} nodes with {opt_in_flag}"
+        if args.update_baseline:
+            baseline_results[fleet_size] = result
+            continue
+        if fleet_size not in baseline_results:
+            logger.warning(f"No baseline recorded for {run_description}, skipping comparison")
+            continue
+        all_regressions.extend(
+            f"{run_description}: {regression}"
+            for regression in find_regressions(
+                result=result,
+                baseline=baseline_results[fleet_size],
+                time_tolerance=args.time_tolerance,
+                memory_tolerance=args.memory_tolerance,
+            )
+        )
+
+    if args.update_baseline:
+        _ = args.baseline_path.write_text(baseline.model_dump_json(indent=2) + "\n", encoding="utf-8")
+        return 0
+    for regression in all_regressions:
+        logger.error(regression)
+    return 1 if all_regressions else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Find watched folders on a computer that would see the same files, which would then be hashed and uploaded twice.
+
+The folders are inserted into a trie of their normalized (case-insensitive, Windows) path components, and a single walk
+of the trie compares each folder only with the recursive folders above it on its own path, instead of with every other
+folder.
+"""
+
+import fnmatch
+import ntpath
+
+from pydantic import BaseModel
+
+from .courier_config_models import FolderToWatch
+
+
+class FolderOverlap(BaseModel, frozen=True):
+    outer_descriptor: str
+    inner_descriptor: str
+    """Either the same folder as outer_descriptor, or one nested inside it."""
+
+    def describe(self) -> str:
+        return f"{self.inner_descriptor!r} is already watched by {self.outer_descriptor!r}"
+
+
+class _PathTrieNode:
+    def __init__(self) -> None:
+        super().__init__()
+        self.children: dict[str, _PathTrieNode] = {}
+        self.descriptors: list[str] = []
+
+
+def normalize_windows_path(folder_path: str) -> tuple[str, ...]:
+    """Split a Windows path into case-folded components, resolving separators, `.` and `..`."""
+    drive, rest = ntpath.splitdrive(ntpath.normpath(folder_path))
+    return (drive.casefold(), *(component.casefold() for component in rest.split("\\") if component))
+
+
+def _is_subtree_ignored(relative_path: tuple[str, ...], ignore_patterns: list[str]) -> bool:
+    """Check whether some ignore pattern skips every file under the relative path.
+
+    That's the case when the pattern ends with a `*` (which also matches across folders) and the rest of the pattern
+    matches the start of the relative folder path.
+    """
+    folder_prefix = "".join(f"{component}/" for component in relative_path)
+    for ignore_pattern in ignore_patterns:
+        if not ignore_pattern.endswith("*"):
+            continue
+        pattern_prefix = ignore_pattern[:-1].casefold()
+        if any(
+            fnmatch.fnmatchcase(folder_prefix[:prefix_length], pattern_prefix)
+            for prefix_length in range(len(folder_prefix) + 1)
+        ):
+            return True
+    return False
+
+
+def find_folder_overlaps(folders_to_watch: dict[str, FolderToWatch]) -> list[FolderOverlap]:
+    root = _PathTrieNode()
+    for descriptor, folder_to_watch in folders_to_watch.items():
+        node = root
+        for component in normalize_windows_path(folder_to_watch.folder_path):
+            node = node.children.setdefault(component, _PathTrieNode())
+        node.descriptors.append(descriptor)
+
+    overlaps: list[FolderOverlap] = []
+    # each entry is a node, its path from the root, and the recursive folders above it (with the depth they're at)
+    pending: list[tuple[_PathTrieNode, tuple[str, ...], tuple[tuple[str, int], ...]]] = [(root, (), ())]
+    while pending:
+        node, path, recursive_ancestors = pending.pop()
+        for index, descriptor in enumerate(node.descriptors):
+            overlaps.extend(
+                FolderOverlap(outer_descriptor=ancestor_descriptor, inner_descriptor=descriptor)
+                for ancestor_descriptor, ancestor_depth in recursive_ancestors
+                if not _is_subtree_ignored(path[ancestor_depth:], folders_to_watch[ancestor_descriptor].ignore_patterns)
+            )
+            overlaps.extend(
+                FolderOverlap(outer_descriptor=same_path_descriptor, inner_descriptor=descriptor)
+                for same_path_descriptor in node.descriptors[:index]
+            )
+        child_recursive_ancestors = (
+            *recursive_ancestors,
+            *((descriptor, len(path)) for descriptor in node.descriptors if folders_to_watch[descriptor].recursive),
+        )
+        pending.extend(
+            (child, (*path, component), child_recursive_ancestors) for component, child in node.children.items()
+        )
+    return overlaps
@@ -1,39 +1,43 @@
 import logging
 
-import pulumi_aws
 from ephemeral_pulumi_deploy import append_resource_suffix
 from ephemeral_pulumi_deploy import common_tags
 from ephemeral_pulumi_deploy import common_tags_native
-from ephemeral_pulumi_deploy import get_aws_account_id
 from pulumi import ComponentResource
 from pulumi import Output
 from pulumi import ResourceOptions
 from pulumi import export
-from pulumi_aws.iam import GetPolicyDocumentStatementArgs
-from pulumi_aws.iam import GetPolicyDocumentStatementConditionArgs
-from pulumi_aws.iam import GetPolicyDocumentStatementPrincipalArgs
 from pulumi_aws.iam import RolePolicy
-from pulumi_aws.iam import get_policy_document
 from pulumi_aws.ssm import Activation
-from pulumi_aws.ssm import GetInstancesFilterArgs
-from pulumi_aws.ssm import get_instances_output
 from pulumi_aws_native import TagArgs
 from pulumi_aws_native import iam
 from pulumi_aws_native import ssm
 
+from .courier_config_models import CLOUDWATCH_HEARTBEAT_NAMESPACE
+from .courier_config_models import CLOUDWATCH_HOST_LOAD_NAMESPACE
+from .courier_config_models import CONFIG_DIGEST_PARAMETER_NAME
+from .courier_config_models import CONFIG_DOCUMENT_PARAMETER_NAME
 from .courier_config_models import SSM_PARAMETER_PREFIX
 from .courier_config_models import SSM_PARAMETER_PREFIX_TO_ALIASES
+from .iam_policy import PolicyCondition
+from .iam_policy import PolicyPrincipal
+from .iam_policy import PolicyStatement
+from .iam_policy import build_policy_document
+from .models import ComputerLocation
 from .models import LabComputerConfig
+from .program_context import ProgramContext
 
 logger = logging.getLogger(__name__)
 
 
-def create_output_if_needed(*, has_been_activated: bool, original_resource_name: str, activation: Activation):
+def create_output_if_needed(
+    *, has_been_activated: bool, original_resource_name: str, activation: Activation, aws_region: str
+):
     if not has_been_activated:
         export(
             f"-{original_resource_name}-activation-script",
             Output.all(activation.id, activation.activation_code).apply(
-                lambda args: _generate_activation_script_contents(*args)
+                lambda args: _generate_activation_script_contents(*args, region=aws_region)
             ),
         )
 
@@ -41,9 +45,10 @@ def create_output_if_needed(*, has_been_activated: bool, original_resource_name:
 def _generate_activation_script_contents(
     activation_id: str,
     activation_code: str,
+    *,
+    region: str,
 ) -> str:
     version = "3.3.1345.0"  # Latest version can be obtained from https://github.com/aws/amazon-ssm-agent/blob/mainline/RELEASENOTES.md
-    region = pulumi_aws.config.region
     return (
         r"     $dir = $env:TEMP + '/ssm'; "
         r"New-Item -ItemType directory -Path $dir -Force; "
@@ -56,14 +61,259 @@ def _generate_activation_script_contents(
     )
 
 
-class OnPremNode(ComponentResource):
+ORIGINAL_COMPUTER_INFO_TAG_KEY = "original-computer-info"
+INSTALLED_AGENT_VERSION_TAG_KEY = "installed-cloud-courier-agent-version"  # Warning! This tag key is used in the Cloud Courier Agent, so changing it will require changes there as well
+NODE_LOCATION_TAG_KEY = "cloud-courier-location"
+NODE_NAME_TAG_KEY = "cloud-courier-node-name"  # Warning! When using shared node roles, the Cloud Courier Agent needs to read this tag from its managed instance to know which computer it is, since the role name no longer identifies it
+MAX_STANDARD_PARAMETER_VALUE_BYTES = 4096
+NODE_LOCATION_PRINCIPAL_TAG = f"${{aws:PrincipalTag/{NODE_LOCATION_TAG_KEY}}}"
+
+
+def _create_node_role_policies(  # noqa: PLR0913 # yes, this is a lot of arguments, but they're all kwargs
+    *,
+    role: iam.Role,
+    resource_name: str,
+    s3_key_prefix: str,
+    managed_instance_condition: PolicyCondition,
+    can_read_own_instance_tags: bool,
+    ssm_logs_bucket_name: Output[str],
+    data_bucket_name: Output[str],
+    program_context: ProgramContext,
+) -> None:
+    _ = RolePolicy(  # the native provider has some CloudControl error when the policy document had an output in it
+        append_resource_suffix(f"{resource_name}-upload-data", max_length=100),
+        role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+        name="upload-data",
+        policy=data_bucket_name.apply(
+            lambda bucket_name: build_policy_document(
+                PolicyStatement(
+                    sid="UploadData",
+                    actions=("s3:PutObject", "s3:PutObjectTagging", "s3:AbortMultipartUpload"),
+                    resources=(f"arn:aws:s3:::{bucket_name}/{s3_key_prefix}/*",),
+                ),
+                PolicyStatement(
+                    sid="ReadMetadata",  # this seems to be required to call head_object to read the ETag
+                    actions=("s3:ListBucket",),
+                    resources=(f"arn:aws:s3:::{bucket_name}",),
+                ),
+            )
+        ),
+        opts=ResourceOptions(parent=role),
+    )
+    _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
+        append_resource_suffix(f"{resource_name}-put-cloudwatch-metrics", max_length=100),
+        role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+        name="put-cloudwatch-metrics",
+        policy=build_policy_document(
+            PolicyStatement(
+                sid="Heartbeat",
+                actions=("cloudwatch:PutMetricData",),
+                resources=("*",),
+                conditions=(
+                    PolicyCondition(
+                        test="StringEquals", variable="cloudwatch:namespace", values=(CLOUDWATCH_HEARTBEAT_NAMESPACE,)
+                    ),
+                ),
+            ),
+            PolicyStatement(
+                sid="HostLoad",
+                actions=("cloudwatch:PutMetricData",),
+                resources=("*",),
+                conditions=(
+                    PolicyCondition(
+                        test="StringEquals", variable="cloudwatch:namespace", values=(CLOUDWATCH_HOST_LOAD_NAMESPACE,)
+                    ),
+                ),
+            ),
+        ),
+        opts=ResourceOptions(parent=role),
+    )
+    _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
+        append_resource_suffix(f"{resource_name}-ssm-params", max_length=100),
+        role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+        name="ssm-params",
+        policy=build_policy_document(
+            PolicyStatement(
+                sid="Read",
+                actions=("ssm:DescribeParameters",),
+                resources=("*",),
+                # does not appear to be a way to further lock this down
+            ),
+        ),
+        opts=ResourceOptions(parent=role),
+    )
+    managed_instance_arn = (
+        f"arn:aws:ssm:{program_context.aws_region}:{program_context.aws_account_id}:managed-instance/*"
+    )
+    instance_tag_statements = [
+        PolicyStatement(
+            sid="UpdateInstanceTag",
+            actions=("ssm:AddTagsToResource",),
+            resources=(managed_instance_arn,),
+            conditions=(
+                managed_instance_condition,
+                PolicyCondition(
+                    test="ForAllValues:StringEquals",
+                    variable="aws:TagKeys",
+                    values=(INSTALLED_AGENT_VERSION_TAG_KEY,),
+                ),
+            ),
+        ),
+        PolicyStatement(
+            sid="FindInstanceId",
+            actions=("ssm:DescribeInstanceInformation",),
+            resources=("*",),
+            # does not appear to be an easy way to lock this down further, although maybe tags might help. but seems generally low risk
+        ),
+    ]
+    if can_read_own_instance_tags:
+        instance_tag_statements.append(
+            PolicyStatement(
+                sid="ReadInstanceTags",
+                actions=("ssm:ListTagsForResource",),
+                resources=(managed_instance_arn,),
+                conditions=(managed_instance_condition,),
+            )
+        )
+    _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
+        append_resource_suffix(f"{resource_name}-update-instance-tag", max_length=100),
+        role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+        name="update-instance-tag",
+        policy=build_policy_document(*instance_tag_statements),
+        opts=ResourceOptions(parent=role),
+    )
+    _ = RolePolicy(  # the native provider has some CloudControl error when the policy document had an output in it
+        append_resource_suffix(f"{resource_name}-create-ssm-logs", max_length=100),
+        role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
+        name="create-ssm-logs",
+        policy=ssm_logs_bucket_name.apply(
+            lambda bucket_name: build_policy_document(
+                PolicyStatement(
+                    sid="CreateSSMLogs",
+                    actions=("s3:GetEncryptionConfiguration",),
+                    resources=(f"arn:aws:s3:::{bucket_name}",),
+                ),
+                PolicyStatement(
+                    sid="UploadSSMLogs",
+                    actions=("s3:PutObject",),
+                    resources=(f"arn:aws:s3:::{bucket_name}/*",),
+                ),
+            )
+        ),
+        opts=ResourceOptions(parent=role),
+    )
+
+
+def _publish_consolidated_config(
+    *, lab_computer_config: LabComputerConfig, alias: str, data_bucket_name: Output[str], parent: ComponentResource
+) -> None:
+    config_document = data_bucket_name.apply(
+        lambda bucket_name: lab_computer_config.create_config_document(bucket_name=bucket_name)
+    )
+    config_document_json = config_document.apply(lambda document: document.model_dump_json())
+    _ = ssm.Parameter(
+        append_resource_suffix(f"{lab_computer_config.resource_name}-config", max_length=100),
+        name=f"{SSM_PARAMETER_PREFIX}/{alias}/{CONFIG_DOCUMENT_PARAMETER_NAME}",
+        value=config_document_json,
+        type=ssm.ParameterType.STRING,
+        tier=config_document_json.apply(
+            lambda document_json: ssm.ParameterTier.STANDARD
+            if len(document_json.encode("utf-8")) <= MAX_STANDARD_PARAMETER_VALUE_BYTES
+            else ssm.ParameterTier.ADVANCED
+        ),
+        tags=common_tags(),
+        opts=ResourceOptions(parent=parent, delete_before_replace=True),
+    )
+    _ = ssm.Parameter(
+        append_resource_suffix(f"{lab_computer_config.resource_name}-config-digest", max_length=100),
+        name=f"{SSM_PARAMETER_PREFIX}/{alias}/{CONFIG_DIGEST_PARAMETER_NAME}",
+        value=config_document.apply(lambda document: document.digest),
+        type=ssm.ParameterType.STRING,
+        tags=common_tags(),
+        opts=ResourceOptions(parent=parent, delete_before_replace=True),
+    )
+
+
+def _create_node_role(*, resource_name: str, tags: list[TagArgs], parent: ComponentResource) -> iam.Role:
+    return iam.Role(
+        resource_name,
+        role_name=resource_name,
+        opts=ResourceOptions(parent=parent),
+        assume_role_policy_document=build_policy_document(
+            # TODO: add permission for infrastructure testing role to assume this role
+            PolicyStatement(
+                actions=("sts:AssumeRole",),
+                principals=(PolicyPrincipal(type="Service", identifiers=("ssm.amazonaws.com",)),),
+            )
+        ),
+        managed_policy_arns=["arn:aws:iam::aws:policy/AmazonSSMManagedInstanceCore"],
+        tags=tags,
+    )
+
+
+class SharedNodeRole(ComponentResource):
+    """One IAM role shared by every computer at a location, instead of a role and five inline policies per computer.
+
+    The policies are scoped with Attribute-Based Access Control: the role is tagged with its location, and the
+    policies compare that `aws:PrincipalTag` against the S3 key prefix and the `ssm:resourceTag` of the managed
+    instance. The trade-off is that a computer can write to the S3 prefix of any other computer at the same location.
+    """
+
     def __init__(
+        self,
+        *,
+        location: ComputerLocation,
+        ssm_logs_bucket_name: Output[str],
+        data_bucket_name: Output[str],
+        program_context: ProgramContext,
+    ):
+        unsuffixed_resource_name = f"{location.name.lower()}--shared-node"
+        resource_name = append_resource_suffix(unsuffixed_resource_name, max_length=64)
+        super().__init__(
+            "labauto:SharedOnPremComputerRole",
+            resource_name,
+            None,
+        )
+        self.location_tag_value = location.name.lower()
+        role = _create_node_role(
+            resource_name=resource_name,
+            tags=[TagArgs(key=NODE_LOCATION_TAG_KEY, value=self.location_tag_value), *common_tags_native()],
+            parent=self,
+        )
+        _create_node_role_policies(
+            role=role,
+            resource_name=unsuffixed_resource_name,  # the policies add the suffix themselves
+            s3_key_prefix=NODE_LOCATION_PRINCIPAL_TAG,
+            managed_instance_condition=PolicyCondition(
+                test="StringEquals",
+                variable=f"ssm:resourceTag/{NODE_LOCATION_TAG_KEY}",
+                values=(NODE_LOCATION_PRINCIPAL_TAG,),
+            ),
+            can_read_own_instance_tags=True,
+            ssm_logs_bucket_name=ssm_logs_bucket_name,
+            data_bucket_name=data_bucket_name,
+            program_context=program_context,
+        )
+        self.role = role
+
+
+class OnPremNode(ComponentResource):
+    def __init__(  # noqa: PLR0913 # yes, this is a lot of arguments, but they're all kwargs
         self,
         *,
         lab_computer_config: LabComputerConfig,
         ssm_logs_bucket_name: Output[str],
         data_bucket_name: Output[str],
+        program_context: ProgramContext,
+        shared_node_role: SharedNodeRole | None = None,
+        publish_consolidated_config: bool = False,
     ):
+        """Register a computer with SSM.
+
+        If a shared_node_role is given, the computer is activated with it instead of getting its own IAM role.
+        If publish_consolidated_config is True, the configuration is published as a single document plus its digest,
+        instead of a parameter for the app config and for each folder to watch.
+        """
         immutable_resource_name = lab_computer_config.immutable_full_resource_name
         resource_name = f"{lab_computer_config.location.name.lower()}--{lab_computer_config.name.lower()}"
         original_resource_name = lab_computer_config.original_resource_name
@@ -73,159 +323,35 @@ class OnPremNode(ComponentResource):
             immutable_resource_name,
             None,
         )
-        tags_native = [TagArgs(key="computer-info", value=resource_name), *common_tags_native()]
-
-        role = iam.Role(
-            immutable_resource_name,
-            role_name=immutable_resource_name,
-            opts=ResourceOptions(parent=self),
-            assume_role_policy_document=get_policy_document(
-                statements=[
-                    # TODO: add permission for infrastructure testing role to assume this role
-                    GetPolicyDocumentStatementArgs(
-                        effect="Allow",
-                        actions=["sts:AssumeRole"],
-                        principals=[
-                            GetPolicyDocumentStatementPrincipalArgs(type="Service", identifiers=["ssm.amazonaws.com"])
-                        ],
-                    )
-                ]
-            ).json,
-            managed_policy_arns=["arn:aws:iam::aws:policy/AmazonSSMManagedInstanceCore"],
-            tags=tags_native,
-        )
-        _ = RolePolicy(  # the native provider has some CloudControl error when the policy document had an output in it
-            append_resource_suffix(f"{resource_name}-upload-data", max_length=100),
-            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
-            name="upload-data",
-            policy=data_bucket_name.apply(
-                lambda bucket_name: get_policy_document(
-                    statements=[
-                        GetPolicyDocumentStatementArgs(
-                            sid="UploadData",
-                            effect="Allow",
-                            actions=["s3:PutObject", "s3:PutObjectTagging", "s3:AbortMultipartUpload"],
-                            resources=[
-                                f"arn:aws:s3:::{bucket_name}/{lab_computer_config.location.name.lower()}/{lab_computer_config.name.lower()}/*"
-                            ],
-                        ),
-                        GetPolicyDocumentStatementArgs(
-                            sid="ReadMetadata",  # this seems to be required to call head_object to read the ETag
-                            effect="Allow",
-                            actions=["s3:ListBucket"],
-                            resources=[f"arn:aws:s3:::{bucket_name}"],
-                        ),
-                    ]
-                )
-            ).json,
-            opts=ResourceOptions(parent=role),
-        )
-        _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
-            append_resource_suffix(f"{resource_name}-put-cloudwatch-metrics", max_length=100),
-            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
-            name="put-cloudwatch-metrics",
-            policy=get_policy_document(
-                statements=[
-                    GetPolicyDocumentStatementArgs(
-                        sid="Heartbeat",
-                        effect="Allow",
-                        actions=["cloudwatch:PutMetricData"],
-                        resources=["*"],
-                        conditions=[
-                            GetPolicyDocumentStatementConditionArgs(
-                                test="StringEquals",
-                                variable="cloudwatch:namespace",
-                                values=["CloudCourier/Heartbeat"],
-                            )
-                        ],
-                    ),
-                ]
-            ).json,
-            opts=ResourceOptions(parent=role),
-        )
-        _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
-            append_resource_suffix(f"{resource_name}-ssm-params", max_length=100),
-            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
-            name="ssm-params",
-            policy=get_policy_document(
-                statements=[
-                    GetPolicyDocumentStatementArgs(
-                        sid="Read",
-                        effect="Allow",
-                        actions=["ssm:DescribeParameters"],
-                        resources=["*"],
-                        # does not appear to be a way to further lock this down
-                    ),
-                ]
-            ).json,
-            opts=ResourceOptions(parent=role),
-        )
-        original_computer_info_tag_key = "original-computer-info"
-        installed_agent_version_tag_key = "installed-cloud-courier-agent-version"  # Warning! This tag key is used in the Cloud Courier Agent, so changing it will require changes there as well
-        _ = RolePolicy(  # the native provider gave some odd CloudControl error about the policy, even though it has no Outputs in it
-            append_resource_suffix(f"{resource_name}-update-instance-tag", max_length=100),
-            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
-            name="update-instance-tag",
-            policy=get_policy_document(
-                statements=[
-                    GetPolicyDocumentStatementArgs(
-                        sid="UpdateInstanceTag",
-                        effect="Allow",
-                        actions=["ssm:AddTagsToResource"],
-                        resources=[f"arn:aws:ssm:{pulumi_aws.config.region}:{get_aws_account_id()}:managed-instance/*"],
-                        conditions=[
-                            GetPolicyDocumentStatementConditionArgs(
-                                test="StringEquals",
-                                variable=f"aws:ResourceTag/{original_computer_info_tag_key}",
-                                values=[original_resource_name],
-                            ),
-                            GetPolicyDocumentStatementConditionArgs(
-                                test="ForAllValues:StringEquals",
-                                variable="aws:TagKeys",
-                                values=[installed_agent_version_tag_key],
-                            ),
-                        ],
-                    ),
-                    GetPolicyDocumentStatementArgs(
-                        sid="FindInstanceId",
-                        effect="Allow",
-                        actions=["ssm:DescribeInstanceInformation"],
-                        resources=["*"],
-                        # does not appear to be an easy way to lock this down further, although maybe tags might help. but seems generally low risk
-                    ),
-                ]
-            ).json,
-            opts=ResourceOptions(parent=role),
-        )
-        _ = RolePolicy(  # the native provider has some CloudControl error when the policy document had an output in it
-            append_resource_suffix(f"{resource_name}-create-ssm-logs", max_length=100),
-            role=role.role_name,  # type: ignore[reportArgumentType] # pyright somehow thinks that a role_name can be None...which cannot happen
-            name="create-ssm-logs",
-            policy=ssm_logs_bucket_name.apply(
-                lambda bucket_name: get_policy_document(
-                    statements=[
-                        GetPolicyDocumentStatementArgs(
-                            sid="CreateSSMLogs",
-                            effect="Allow",
-                            actions=["s3:GetEncryptionConfiguration"],
-                            resources=[f"arn:aws:s3:::{bucket_name}"],
-                        ),
-                        GetPolicyDocumentStatementArgs(
-                            sid="UploadSSMLogs",
-                            effect="Allow",
-                            actions=["s3:PutObject"],
-                            resources=[f"arn:aws:s3:::{bucket_name}/*"],
-                        ),
-                    ]
-                )
-            ).json,
-            opts=ResourceOptions(parent=role),
-        )
         fixed_tags = common_tags()  # changes to the tags of the Activation will trigger replacement
-        fixed_tags[original_computer_info_tag_key] = original_resource_name
-        fixed_tags[installed_agent_version_tag_key] = (
+        fixed_tags[ORIGINAL_COMPUTER_INFO_TAG_KEY] = original_resource_name
+        fixed_tags[INSTALLED_AGENT_VERSION_TAG_KEY] = (
             "N/A"  # leaving it blank doesn't let you use it as a filter for SSM Command targeting
         )
+        if shared_node_role is None:
+            role = _create_node_role(
+                resource_name=immutable_resource_name,
+                tags=[TagArgs(key="computer-info", value=resource_name), *common_tags_native()],
+                parent=self,
+            )
+            _create_node_role_policies(
+                role=role,
+                resource_name=resource_name,
+                s3_key_prefix=f"{lab_computer_config.location.name.lower()}/{lab_computer_config.name.lower()}",
+                managed_instance_condition=PolicyCondition(
+                    test="StringEquals",
+                    variable=f"aws:ResourceTag/{ORIGINAL_COMPUTER_INFO_TAG_KEY}",
+                    values=(original_resource_name,),
+                ),
+                can_read_own_instance_tags=False,
+                ssm_logs_bucket_name=ssm_logs_bucket_name,
+                data_bucket_name=data_bucket_name,
+                program_context=program_context,
+            )
+        else:
+            role = shared_node_role.role
+            fixed_tags[NODE_LOCATION_TAG_KEY] = shared_node_role.location_tag_value
+            fixed_tags[NODE_NAME_TAG_KEY] = immutable_resource_name
         activation = Activation(
             immutable_resource_name,
             description=f"For the computer originally named: {original_resource_name}.",
@@ -240,6 +366,7 @@ class OnPremNode(ComponentResource):
             tags=fixed_tags,
             name=original_resource_name,
         )
+        self.role = role
         self.role_name = role.role_name
 
         alias = append_resource_suffix(lab_computer_config.resource_name)
@@ -252,37 +379,48 @@ class OnPremNode(ComponentResource):
             opts=ResourceOptions(parent=self, delete_before_replace=True),
         )
 
-        for descriptor, folder_to_watch in lab_computer_config.folders_to_watch.items():
+        if publish_consolidated_config:
+            _publish_consolidated_config(
+                lab_computer_config=lab_computer_config, alias=alias, data_bucket_name=data_bucket_name, parent=self
+            )
+        else:
             _ = ssm.Parameter(
-                append_resource_suffix(f"{lab_computer_config.resource_name}-{descriptor}", max_length=100),
-                name=f"{SSM_PARAMETER_PREFIX}/{alias}/folders/{descriptor}",
-                value=Output.all(data_bucket_name, folder_to_watch).apply(  # TODO: make these kwargs not args
-                    lambda args: args[1]
-                    .model_copy(
-                        update={
-                            "s3_bucket_name": args[0],
-                            "s3_key_prefix": f"{lab_computer_config.location.name.lower()}/{lab_computer_config.name.lower()}",
-                        }
-                    )
-                    .model_dump_json()
-                ),
+                append_resource_suffix(f"{lab_computer_config.resource_name}-app-config", max_length=100),
+                name=f"{SSM_PARAMETER_PREFIX}/{alias}/app-config",
+                value=lab_computer_config.effective_app_config.model_dump_json(),
                 type=ssm.ParameterType.STRING,
                 tags=common_tags(),
                 opts=ResourceOptions(parent=self, delete_before_replace=True),
             )
 
-        has_been_activated = self.role_name.apply(
-            lambda role_name: get_instances_output(
-                filters=[
-                    GetInstancesFilterArgs(
-                        name="IamRole",
-                        values=[role_name],  # type: ignore[reportArgumentType] # pyright somehow thinks that a role name can be None...which cannot happen
+            for descriptor, folder_to_watch in lab_computer_config.folders_to_watch.items():
+                _ = ssm.Parameter(
+                    append_resource_suffix(f"{lab_computer_config.resource_name}-{descriptor}", max_length=100),
+                    name=f"{SSM_PARAMETER_PREFIX}/{alias}/folders/{descriptor}",
+                    value=data_bucket_name.apply(
+                        lambda bucket_name,
+                        folder_to_watch=folder_to_watch: lab_computer_config.fill_in_folder_to_watch(
+                            folder_to_watch, bucket_name=bucket_name
+                        ).model_dump_json()
                     ),
-                ],
+                    type=ssm.ParameterType.STRING,
+                    tags=common_tags(),
+                    opts=ResourceOptions(parent=self, delete_before_replace=True),
+                )
+
+        if shared_node_role is None:
+            create_output_if_needed(
+                has_been_activated=program_context.has_been_activated(iam_role_name=immutable_resource_name),
+                original_resource_name=original_resource_name,
+                activation=activation,
+                aws_region=program_context.aws_region,
             )
-        ).apply(lambda result: len(result.ids) > 0)
-        _ = has_been_activated.apply(
-            lambda been_activated: create_output_if_needed(  # it's a general anti-pattern to create resources inside an apply statement...but this is just a stack output, and I couldn't think of any other way
-                has_been_activated=been_activated, original_resource_name=original_resource_name, activation=activation
+        else:  # the shared role no longer identifies the computer, so look it up by its activation instead
+            _ = activation.id.apply(
+                lambda activation_id: create_output_if_needed(  # it's a general anti-pattern to create resources inside an apply statement...but this is just a stack output
+                    has_been_activated=program_context.has_activation_been_used(activation_id=activation_id),
+                    original_resource_name=original_resource_name,
+                    activation=activation,
+                    aws_region=program_context.aws_region,
+                )
             )
-        )
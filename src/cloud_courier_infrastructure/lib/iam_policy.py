@@ -0,0 +1,94 @@
+"""Build IAM policy documents locally instead of through the `aws:iam/getPolicyDocument` provider invoke.
+
+Each invoke is a synchronous round trip to the provider plugin, and every computer needed several of them. The JSON
+rendered here matches what the invoke returns (the Terraform `aws_iam_policy_document` data source), so switching
+over does not show up as a diff on existing policies:
+    - statement keys are in the order Sid, Effect, Action, Resource, Principal, Condition, and Sid is always present
+    - a list with a single entry collapses to a plain string, longer lists are sorted in reverse order
+    - principals and conditions are objects keyed (alphabetically) by principal type and by test then variable
+    - a single principal of type `*` collapses to `"Principal": "*"` (an `AWS` principal of `*` stays `{"AWS": "*"}`)
+    - the document is indented with two spaces
+"""
+
+import functools
+import json
+from typing import Any
+from typing import Literal
+
+from pydantic import BaseModel
+
+POLICY_VERSION = "2012-10-17"
+
+
+class PolicyPrincipal(BaseModel, frozen=True):
+    type: str
+    identifiers: tuple[str, ...]
+
+
+class PolicyCondition(BaseModel, frozen=True):
+    test: str
+    variable: str
+    values: tuple[str, ...]
+
+
+class PolicyStatement(BaseModel, frozen=True):
+    sid: str = ""
+    effect: Literal["Allow", "Deny"] = "Allow"
+    actions: tuple[str, ...] = ()
+    resources: tuple[str, ...] = ()
+    principals: tuple[PolicyPrincipal, ...] = ()
+    conditions: tuple[PolicyCondition, ...] = ()
+
+
+def _collapse_string_list(values: tuple[str, ...]) -> str | list[str]:
+    if len(values) == 1:
+        return values[0]
+    return sorted(values, reverse=True)
+
+
+def _render_principals(principals: tuple[PolicyPrincipal, ...]) -> str | dict[str, str | list[str]]:
+    if len(principals) == 1 and principals[0].type == "*" and principals[0].identifiers == ("*",):
+        return "*"
+    rendered: dict[str, list[str]] = {}
+    for principal in principals:
+        rendered.setdefault(principal.type, []).extend(sorted(principal.identifiers, reverse=True))
+    return {
+        principal_type: identifiers[0] if len(identifiers) == 1 else identifiers
+        for principal_type, identifiers in sorted(rendered.items())
+    }
+
+
+def _render_conditions(conditions: tuple[PolicyCondition, ...]) -> dict[str, dict[str, str | list[str]]]:
+    rendered: dict[str, dict[str, list[str]]] = {}
+    for condition in conditions:
+        rendered.setdefault(condition.test, {}).setdefault(condition.variable, []).extend(
+            sorted(condition.values, reverse=True)
+        )
+    return {
+        test: {variable: values[0] if len(values) == 1 else values for variable, values in sorted(variables.items())}
+        for test, variables in sorted(rendered.items())
+    }
+
+
+def _render_statement(statement: PolicyStatement) -> dict[str, Any]:
+    rendered: dict[str, Any] = {"Sid": statement.sid, "Effect": statement.effect}
+    if statement.actions:
+        rendered["Action"] = _collapse_string_list(statement.actions)
+    if statement.resources:
+        rendered["Resource"] = _collapse_string_list(statement.resources)
+    if statement.principals:
+        rendered["Principal"] = _render_principals(statement.principals)
+    if statement.conditions:
+        rendered["Condition"] = _render_conditions(statement.conditions)
+    return rendered
+
+
+@functools.cache
+def build_policy_document(*statements: PolicyStatement) -> str:
+    """Render the statements as an IAM policy document JSON string.
+
+    Results are memoized, since many computers share identical policies.
+    """
+    return json.dumps(
+        {"Version": POLICY_VERSION, "Statement": [_render_statement(statement) for statement in statements]}, indent=2
+    )
@@ -1,20 +1,73 @@
+import calendar
+import math
+from typing import Self
+
 from ephemeral_pulumi_deploy import append_resource_suffix
 from pydantic import BaseModel
 from pydantic import Field
+from pydantic import model_validator
 
+from .courier_config_models import HIGH_RESOLUTION_STORAGE_SECONDS
 from .courier_config_models import AppConfig
+from .courier_config_models import ComputerConfigDocument
 from .courier_config_models import FolderToWatch
+from .courier_config_models import UploadWindow
+from .folder_overlaps import find_folder_overlaps
+
+HIGH_RESOLUTION_ALARM_PERIODS_SECONDS = (10, 20, 30)
+STANDARD_ALARM_PERIOD_MULTIPLE_SECONDS = 60
+MAX_ALARM_EVALUATION_RANGE_SECONDS = 24 * 60 * 60
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+MIN_HEARTBEATS_PER_ALARM_PERIOD = 2  # so one late or dropped heartbeat doesn't leave a whole period empty
 
 
 class AlertingConfig(BaseModel, frozen=True):
     emails: list[str]  # TODO: validate email format
     timeout_seconds: int = 300
-    """How long to wait without seeing a heartbeat before alerting."""
+    """The target detection latency: how long to wait without seeing a heartbeat before alerting."""
+    datapoints_to_alarm: int = 1
+    """How many periods (the M in M-of-N) need to be missing heartbeats before alerting. The timeout is split evenly into this many periods, so e.g. a 30 second timeout with 3 datapoints uses high-resolution 10 second periods."""
+    evaluation_periods: int = 1
+    """How many of the most recent periods (the N in M-of-N) are considered, so an occasional late heartbeat doesn't reset detection."""
     # TODO: add periods not to alert during (e.g. at night when the computer is turned off)
 
+    @property
+    def period_seconds(self) -> int:
+        return self.timeout_seconds // self.datapoints_to_alarm
+
+    @property
+    def is_high_resolution(self) -> bool:
+        return self.period_seconds < STANDARD_ALARM_PERIOD_MULTIPLE_SECONDS
+
+    @model_validator(mode="after")
+    def validate_alarm_periods(self) -> Self:
+        if not 1 <= self.datapoints_to_alarm <= self.evaluation_periods:
+            msg = f"datapoints_to_alarm ({self.datapoints_to_alarm}) must be between 1 and evaluation_periods ({self.evaluation_periods})"
+            raise ValueError(msg)
+        if self.timeout_seconds % self.datapoints_to_alarm != 0:
+            msg = (
+                f"timeout_seconds ({self.timeout_seconds}) must split evenly into {self.datapoints_to_alarm} datapoints"
+            )
+            raise ValueError(msg)
+        if (
+            self.period_seconds not in HIGH_RESOLUTION_ALARM_PERIODS_SECONDS
+            and self.period_seconds % STANDARD_ALARM_PERIOD_MULTIPLE_SECONDS != 0
+        ):
+            msg = f"The alarm period of {self.period_seconds} seconds (timeout_seconds / datapoints_to_alarm) must be one of {HIGH_RESOLUTION_ALARM_PERIODS_SECONDS} or a multiple of {STANDARD_ALARM_PERIOD_MULTIPLE_SECONDS}"
+            raise ValueError(msg)
+        if self.period_seconds * self.evaluation_periods > MAX_ALARM_EVALUATION_RANGE_SECONDS:
+            msg = f"The alarm can't evaluate more than {MAX_ALARM_EVALUATION_RANGE_SECONDS} seconds of data, but {self.evaluation_periods} periods of {self.period_seconds} seconds were requested"
+            raise ValueError(msg)
+        return self
+
 
 class ComputerLocation(BaseModel, frozen=True):
     name: str
+    default_upload_windows: tuple[UploadWindow, ...] | None = None
+    """Used by every computer at the location that doesn't set its own upload windows."""
+    max_total_upload_bandwidth_bytes_per_second: int | None = None
+    """The share of the site uplink all the computers at the location together may use at any moment. If set, every computer there needs upload windows with a bandwidth limit."""
 
 
 class LabComputerConfig(BaseModel, frozen=True):
@@ -27,6 +80,33 @@ class LabComputerConfig(BaseModel, frozen=True):
     app_config: AppConfig = Field(default_factory=AppConfig)
     folders_to_watch: dict[str, FolderToWatch] = Field(default_factory=dict)
 
+    @model_validator(mode="after")
+    def validate_heartbeat_matches_alarm(self) -> Self:
+        # otherwise a healthy computer would leave some periods without a heartbeat and set off the alarm. A heartbeat
+        # exactly once per period isn't enough either: jitter in when it's sent and when the period boundary falls means
+        # a period can still end up empty
+        if (
+            self.app_config.heartbeat_frequency_seconds * MIN_HEARTBEATS_PER_ALARM_PERIOD
+            > self.alerting_config.period_seconds
+        ):
+            msg = f"{self.name} sends a heartbeat every {self.app_config.heartbeat_frequency_seconds} seconds, but needs to send at least {MIN_HEARTBEATS_PER_ALARM_PERIOD} within its alarm period of {self.alerting_config.period_seconds} seconds"
+            raise ValueError(msg)
+        if (
+            self.alerting_config.is_high_resolution
+            and self.app_config.heartbeat_storage_resolution_seconds != HIGH_RESOLUTION_STORAGE_SECONDS
+        ):
+            msg = f"{self.name} has a sub-minute alarm period, so its heartbeat must be published as a high-resolution metric (heartbeat_storage_resolution_seconds={HIGH_RESOLUTION_STORAGE_SECONDS})"
+            raise ValueError(msg)
+        return self
+
+    @model_validator(mode="after")
+    def validate_folders_do_not_overlap(self) -> Self:
+        overlaps = find_folder_overlaps(self.folders_to_watch)
+        if overlaps:
+            msg = f"{self.name} has overlapping folders to watch, so files would be uploaded twice: {'; '.join(overlap.describe() for overlap in overlaps)}"
+            raise ValueError(msg)
+        return self
+
     @property
     def resource_name(self) -> str:
         return f"{self.location.name.lower()}--{self.name.lower()}"
@@ -39,6 +119,111 @@ class LabComputerConfig(BaseModel, frozen=True):
             resource_name = f"{self.original_location.name.lower()}--{self.original_name.lower()}"
         return resource_name
 
+    @property
+    def original_location_name(self) -> str:
+        """The location the computer was first set up at, which its role name still starts with."""
+        if self.original_name is not None:
+            assert self.original_location is not None
+            return self.original_location.name.lower()
+        return self.location.name.lower()
+
     @property
     def immutable_full_resource_name(self) -> str:
         return append_resource_suffix(self.original_resource_name)
+
+    @property
+    def effective_app_config(self) -> AppConfig:
+        """The app config as published to the agent, with this computer's startup and refresh offsets and its location's default upload windows filled in."""
+        return self.app_config.model_copy(
+            update={"upload_windows": self.effective_upload_windows}
+        ).with_deterministic_offsets(seed=self.immutable_full_resource_name)
+
+    @property
+    def effective_upload_windows(self) -> list[UploadWindow] | None:
+        if self.app_config.upload_windows is None and self.location.default_upload_windows is not None:
+            return list(self.location.default_upload_windows)
+        return self.app_config.upload_windows
+
+    def fill_in_folder_to_watch(self, folder_to_watch: FolderToWatch, *, bucket_name: str) -> FolderToWatch:
+        return folder_to_watch.model_copy(
+            update={
+                "s3_bucket_name": bucket_name,
+                "s3_key_prefix": f"{self.location.name.lower()}/{self.name.lower()}",
+            }
+        )
+
+    def create_config_document(self, *, bucket_name: str) -> ComputerConfigDocument:
+        return ComputerConfigDocument(
+            app_config=self.effective_app_config,
+            folders_to_watch={
+                descriptor: self.fill_in_folder_to_watch(folder_to_watch, bucket_name=bucket_name)
+                for descriptor, folder_to_watch in self.folders_to_watch.items()
+            },
+        )
+
+
+def _get_weekly_upload_intervals(upload_windows: list[UploadWindow]) -> list[tuple[int, int, float]]:
+    """Convert the windows to (start, end, bandwidth) in minutes since the start of the week, splitting any that wrap around the end of the week."""
+    intervals: list[tuple[int, int, float]] = []
+    for upload_window in upload_windows:
+        start_minute = upload_window.start_time.hour * 60 + upload_window.start_time.minute
+        end_minute = upload_window.end_time.hour * 60 + upload_window.end_time.minute
+        duration_minutes = (end_minute - start_minute) % MINUTES_PER_DAY or MINUTES_PER_DAY
+        bandwidth = (
+            math.inf
+            if upload_window.max_bandwidth_bytes_per_second is None
+            else upload_window.max_bandwidth_bytes_per_second
+        )
+        for day in upload_window.days_of_week:
+            start = day * MINUTES_PER_DAY + start_minute
+            end = start + duration_minutes
+            intervals.append((start, min(end, MINUTES_PER_WEEK), bandwidth))
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK, bandwidth))
+    return intervals
+
+
+def validate_location_upload_bandwidth(all_computer_configs: list[LabComputerConfig]) -> None:
+    """Confirm that at no point in the week can the computers at a location together exceed its bandwidth cap.
+
+    The total only goes up when a window opens, so it's enough to check the moment each window starts. Every computer at
+    a location must define it identically, otherwise it would be ambiguous which cap and default windows apply.
+    """
+    computer_configs_by_location: dict[str, list[LabComputerConfig]] = {}
+    for computer_config in all_computer_configs:
+        computer_configs_by_location.setdefault(computer_config.location.name, []).append(computer_config)
+    for location_name, computer_configs in computer_configs_by_location.items():
+        mismatched_computer_names = [
+            computer_config.name
+            for computer_config in computer_configs
+            if computer_config.location != computer_configs[0].location
+        ]
+        if mismatched_computer_names:
+            msg = f"The computers {mismatched_computer_names} define the location {location_name} differently than {computer_configs[0].name} does"
+            raise ValueError(msg)
+        max_total_bandwidth = computer_configs[0].location.max_total_upload_bandwidth_bytes_per_second
+        if max_total_bandwidth is None:
+            continue
+        intervals_by_computer: dict[str, list[tuple[int, int, float]]] = {}
+        for computer_config in computer_configs:
+            upload_windows = computer_config.effective_upload_windows
+            if upload_windows is None or any(
+                upload_window.max_bandwidth_bytes_per_second is None for upload_window in upload_windows
+            ):
+                msg = f"{computer_config.name} needs upload windows that all limit bandwidth, since its location {location_name} has a total upload bandwidth cap"
+                raise ValueError(msg)
+            intervals_by_computer[computer_config.name] = _get_weekly_upload_intervals(upload_windows)
+        for check_minute in sorted(
+            {start for intervals in intervals_by_computer.values() for start, _, _ in intervals}
+        ):
+            total_bandwidth = sum(
+                max(
+                    (bandwidth for start, end, bandwidth in intervals if start <= check_minute < end),
+                    default=0,
+                )
+                for intervals in intervals_by_computer.values()
+            )
+            if total_bandwidth > max_total_bandwidth:
+                day, minute_of_day = divmod(check_minute, MINUTES_PER_DAY)
+                msg = f"The computers at {location_name} could upload at {total_bandwidth} bytes per second on {calendar.day_name[day]} at {minute_of_day // 60:02d}:{minute_of_day % 60:02d}, over the location cap of {max_total_bandwidth}"
+                raise ValueError(msg)
@@ -0,0 +1,168 @@
+"""Count and time provider invokes and component constructions while the Pulumi program runs.
+
+Set the CLOUD_COURIER_PROFILE_REPORT_PATH environment variable to write a JSON report of the run to that path, to see
+which invokes dominate preview time on a large fleet.
+"""
+
+import atexit
+import functools
+import logging
+import os
+import time
+from collections.abc import Callable
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+from pulumi import Output
+from pydantic import BaseModel
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REPORT_PATH_ENV_VAR = "CLOUD_COURIER_PROFILE_REPORT_PATH"
+FLEET_WIDE_RESOURCE_NAME = "fleet-wide"
+PROGRAM_COMPONENT_TYPE = "PulumiProgram"
+
+
+class ProfileScope(BaseModel, frozen=True):
+    component_type: str
+    resource_name: str
+
+
+class TimingStats(BaseModel):
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class InvokeProfile(BaseModel, frozen=True):
+    invoke_name: str
+    component_type: str
+    resource_name: str
+    stats: TimingStats
+
+
+class ComponentProfile(BaseModel, frozen=True):
+    component_type: str
+    resource_name: str
+    stats: TimingStats
+
+
+class ProfileReport(BaseModel, frozen=True):
+    invokes: list[InvokeProfile] = Field(default_factory=list[InvokeProfile])
+    components: list[ComponentProfile] = Field(default_factory=list[ComponentProfile])
+    invoke_totals: dict[str, TimingStats] = Field(default_factory=dict[str, TimingStats])
+    """Aggregated across all components, sorted with the most time-consuming invoke first."""
+
+
+class ProgramProfiler:
+    def __init__(self) -> None:
+        super().__init__()
+        self._invokes: dict[tuple[str, ProfileScope], TimingStats] = {}
+        self._components: dict[ProfileScope, TimingStats] = {}
+        self._report_path: Path | None = None
+
+    def reset(self) -> None:
+        self._invokes.clear()
+        self._components.clear()
+
+    def record_invoke(self, *, invoke_name: str, scope: ProfileScope, seconds: float) -> None:
+        self._invokes.setdefault((invoke_name, scope), TimingStats()).record(seconds)
+
+    def record_component(self, *, scope: ProfileScope, seconds: float) -> None:
+        self._components.setdefault(scope, TimingStats()).record(seconds)
+
+    def create_report(self) -> ProfileReport:
+        invoke_totals: dict[str, TimingStats] = {}
+        for (invoke_name, _), stats in self._invokes.items():
+            total = invoke_totals.setdefault(invoke_name, TimingStats())
+            total.count += stats.count
+            total.total_seconds += stats.total_seconds
+            total.max_seconds = max(total.max_seconds, stats.max_seconds)
+        return ProfileReport(
+            invokes=[
+                InvokeProfile(
+                    invoke_name=invoke_name,
+                    component_type=scope.component_type,
+                    resource_name=scope.resource_name,
+                    stats=stats,
+                )
+                for (invoke_name, scope), stats in self._invokes.items()
+            ],
+            components=[
+                ComponentProfile(component_type=scope.component_type, resource_name=scope.resource_name, stats=stats)
+                for scope, stats in self._components.items()
+            ],
+            invoke_totals=dict(sorted(invoke_totals.items(), key=lambda item: item[1].total_seconds, reverse=True)),
+        )
+
+    def emit_report(self) -> None:
+        """Write the report to the file requested by the environment when the process exits.
+
+        Waiting until exit means invokes made inside Output applies, which resolve after the program function itself
+        has returned, are included.
+        """
+        report_path = os.environ.get(PROFILE_REPORT_PATH_ENV_VAR)
+        if report_path is None:
+            return
+        if self._report_path is None:
+            _ = atexit.register(self._write_report)
+        self._report_path = Path(report_path)
+
+    def _write_report(self) -> None:
+        assert self._report_path is not None
+        _ = self._report_path.write_text(self.create_report().model_dump_json(indent=2), encoding="utf-8")
+        logger.info(f"Wrote the program profile report to {self._report_path}")
+
+
+PROFILER = ProgramProfiler()
+PROGRAM_SCOPE = ProfileScope(component_type=PROGRAM_COMPONENT_TYPE, resource_name=FLEET_WIDE_RESOURCE_NAME)
+_current_scope: ContextVar[ProfileScope | None] = ContextVar("_current_scope", default=None)
+
+
+@contextmanager
+def profile_component(component_type: str, *, resource_name: str = FLEET_WIDE_RESOURCE_NAME) -> Generator[None]:
+    """Time constructing a component and attribute any invokes made while constructing it to that component.
+
+    Applies registered while inside the block keep the scope, so invokes inside them are attributed correctly too.
+    """
+    scope = ProfileScope(component_type=component_type, resource_name=resource_name)
+    token = _current_scope.set(scope)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        PROFILER.record_component(scope=scope, seconds=time.perf_counter() - start_time)
+        _current_scope.reset(token)
+
+
+def profiled_invoke[**P, R](fn: Callable[P, R]) -> Callable[P, R]:
+    """Wrap a provider invoke function so each call is counted and timed against the current component.
+
+    For the `_output` flavor of invokes, the latency is measured until the returned Output resolves.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        scope = _current_scope.get() or PROGRAM_SCOPE
+        start_time = time.perf_counter()
+        result = fn(*args, **kwargs)
+        if isinstance(result, Output):
+
+            def _record(value: Any) -> Any:  # noqa: ANN401 # the resolved value is passed through untouched
+                PROFILER.record_invoke(invoke_name=fn.__name__, scope=scope, seconds=time.perf_counter() - start_time)
+                return value
+
+            return result.apply(_record)  # type: ignore[reportUnknownMemberType,reportReturnType] # it is the same Output type the wrapped function returns
+        PROFILER.record_invoke(invoke_name=fn.__name__, scope=scope, seconds=time.perf_counter() - start_time)
+        return result
+
+    return wrapper
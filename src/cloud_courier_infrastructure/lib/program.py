@@ -1,54 +1,226 @@
 import logging
+from collections import Counter
+from typing import TYPE_CHECKING
 
-from ephemeral_pulumi_deploy import get_aws_account_id
 from ephemeral_pulumi_deploy import get_config
 from pulumi import export
 
 from ..computers import create_all_computer_configs
+from . import AlertRouting
+from . import AppConfigDelivery
 from . import CloudCourierAgentInstaller
 from . import CloudCourierSsmCommands
 from . import Dashboard
 from . import DistributorFileToPackage
+from . import FleetInventory
+from . import LocationAlert
 from . import NodeAlert
+from . import NodeAppConfig
 from . import OnPremNode
 from . import RawDataBucket
+from . import SharedNodeRole
 from . import SsmLogsBucket
+from .alerting import MIN_COMPUTERS_FOR_LOCATION_ALERT
+from .capacity_planner import validate_api_quotas
+from .constants import DELIVER_CONFIG_WITH_APPCONFIG
+from .constants import DISTRIBUTOR_PACKAGE_COMPRESSION_LEVEL
 from .constants import DOWNLOAD_EXE_FROM_GITHUB
+from .constants import GATHER_FLEET_INVENTORY
+from .constants import MAX_NODES_PER_DASHBOARD
+from .constants import PUBLISH_CONSOLIDATED_COMPUTER_CONFIG
+from .constants import USE_LOCATION_COMPOSITE_ALARMS
+from .constants import USE_SEARCH_EXPRESSION_DASHBOARD
+from .constants import USE_SHARED_ALERT_TOPICS
+from .constants import USE_SHARED_NODE_ROLES
+from .hybrid_activation import NODE_LOCATION_PRINCIPAL_TAG
+from .hybrid_activation import NODE_LOCATION_TAG_KEY
+from .iam_policy import PolicyCondition
+from .models import ComputerLocation
+from .models import LabComputerConfig
+from .models import validate_location_upload_bandwidth
+from .profiling import PROFILER
+from .profiling import profile_component
+from .program_context import ProgramContext
+from .program_context import get_program_context
+
+if TYPE_CHECKING:
+    from pulumi_aws_native import appconfig
 
 logger = logging.getLogger(__name__)
 
 
-def pulumi_program() -> None:
-    """Execute creating the stack."""
+def _get_or_create_shared_node_role(  # noqa: PLR0913 # yes, this is a lot of arguments, but they're all kwargs
+    *,
+    shared_node_roles: dict[str, SharedNodeRole],
+    location: ComputerLocation,
+    raw_data_bucket: RawDataBucket,
+    ssm_logs_bucket: SsmLogsBucket,
+    appconfig_delivery: AppConfigDelivery | None,
+    program_context: ProgramContext,
+) -> SharedNodeRole:
+    if location.name not in shared_node_roles:
+        with profile_component("SharedNodeRole", resource_name=location.name):
+            shared_node_role = SharedNodeRole(
+                location=location,
+                ssm_logs_bucket_name=ssm_logs_bucket.bucket_name,
+                data_bucket_name=raw_data_bucket.bucket_name,
+                program_context=program_context,
+            )
+            if appconfig_delivery is not None:
+                _ = appconfig_delivery.create_read_policy(
+                    role=shared_node_role.role,
+                    resource_name=f"{location.name.lower()}--shared-node",
+                    environment_id="*",  # computers that moved here still read from the environment of their original location
+                    configuration_profile_id="*",
+                    conditions=(
+                        PolicyCondition(
+                            test="StringEquals",
+                            variable=f"aws:ResourceTag/{NODE_LOCATION_TAG_KEY}",
+                            values=(NODE_LOCATION_PRINCIPAL_TAG,),
+                        ),
+                    ),
+                )
+        shared_node_roles[location.name] = shared_node_role
+    return shared_node_roles[location.name]
+
+
+def _create_nodes(
+    *,
+    all_computer_configs: list[LabComputerConfig],
+    raw_data_bucket: RawDataBucket,
+    ssm_logs_bucket: SsmLogsBucket,
+    program_context: ProgramContext,
+) -> None:
+    appconfig_delivery: AppConfigDelivery | None = None
+    if DELIVER_CONFIG_WITH_APPCONFIG:
+        with profile_component("AppConfigDelivery"):
+            appconfig_delivery = AppConfigDelivery(program_context=program_context)
+    previous_deployments_by_location: dict[str, appconfig.Deployment] = {}
+    shared_node_roles: dict[str, SharedNodeRole] = {}
+    for computer_config in all_computer_configs:
+        shared_node_role: SharedNodeRole | None = None
+        if USE_SHARED_NODE_ROLES:
+            shared_node_role = _get_or_create_shared_node_role(
+                shared_node_roles=shared_node_roles,
+                location=computer_config.location,
+                raw_data_bucket=raw_data_bucket,
+                ssm_logs_bucket=ssm_logs_bucket,
+                appconfig_delivery=appconfig_delivery,
+                program_context=program_context,
+            )
+        with profile_component("OnPremNode", resource_name=computer_config.resource_name):
+            on_prem_node = OnPremNode(
+                lab_computer_config=computer_config,
+                ssm_logs_bucket_name=ssm_logs_bucket.bucket_name,
+                data_bucket_name=raw_data_bucket.bucket_name,
+                program_context=program_context,
+                shared_node_role=shared_node_role,
+                publish_consolidated_config=PUBLISH_CONSOLIDATED_COMPUTER_CONFIG,
+            )
+        if appconfig_delivery is not None:
+            with profile_component("NodeAppConfig", resource_name=computer_config.resource_name):
+                node_appconfig = NodeAppConfig(
+                    lab_computer_config=computer_config,
+                    appconfig_delivery=appconfig_delivery,
+                    data_bucket_name=raw_data_bucket.bucket_name,
+                    node_role=on_prem_node.role if shared_node_role is None else None,
+                    previous_deployment=previous_deployments_by_location.get(computer_config.original_location_name),
+                )
+            previous_deployments_by_location[computer_config.original_location_name] = node_appconfig.deployment
+
+
+def _create_alerts(*, all_computer_configs: list[LabComputerConfig], program_context: ProgramContext) -> None:
+    alert_routing: AlertRouting | None = None
+    if USE_SHARED_ALERT_TOPICS:
+        with profile_component("AlertRouting"):
+            alert_routing = AlertRouting(lab_computer_configs=all_computer_configs)
+    locations_by_name = {
+        computer_config.location.name: computer_config.location for computer_config in all_computer_configs
+    }
+    computer_counts_by_location = Counter(computer_config.location.name for computer_config in all_computer_configs)
+    all_node_alerts: list[NodeAlert] = []
+    node_alerts_by_location: dict[str, list[NodeAlert]] = {}
+    for computer_config in all_computer_configs:
+        with profile_component("NodeAlert", resource_name=computer_config.resource_name):
+            node_alert = NodeAlert(
+                lab_computer_config=computer_config,
+                alert_routing=alert_routing,
+                notify_directly=not USE_LOCATION_COMPOSITE_ALARMS
+                or computer_counts_by_location[computer_config.location.name] < MIN_COMPUTERS_FOR_LOCATION_ALERT,
+            )
+        all_node_alerts.append(node_alert)
+        if not node_alert.notify_directly:
+            node_alerts_by_location.setdefault(computer_config.location.name, []).append(node_alert)
+    for location_name, location_node_alerts in node_alerts_by_location.items():
+        with profile_component("LocationAlert", resource_name=location_name):
+            _ = LocationAlert(
+                location=locations_by_name[location_name],
+                node_alerts=location_node_alerts,
+                alert_routing=alert_routing,
+            )
+    with profile_component("Dashboard"):
+        _ = Dashboard(
+            node_alerts=all_node_alerts,
+            program_context=program_context,
+            use_search_expressions=USE_SEARCH_EXPRESSION_DASHBOARD,
+            max_nodes_per_dashboard=MAX_NODES_PER_DASHBOARD,
+        )
+
+
+def pulumi_program(
+    *,
+    all_computer_configs: list[LabComputerConfig] | None = None,
+    include_agent_installer: bool = True,
+    program_context: ProgramContext | None = None,
+) -> None:
+    """Execute creating the stack.
+
+    The keyword arguments exist so the fleet benchmark can run the program offline against synthetic fleets; a real
+    deployment uses the defaults.
+    """
+    PROFILER.reset()
     env = get_config("proj:env")
     export("env", env)
-    aws_account_id = get_aws_account_id()
-    export("aws-account-id", aws_account_id)
+    if program_context is None:
+        program_context = get_program_context()
+    export("aws-account-id", program_context.aws_account_id)
 
     # Create Resources Here
     # TODO: add ability for custom bucket lifecycle policy
     # TODO: add ability for customization of the bucket policy
-    raw_data_bucket = RawDataBucket()
-    ssm_logs_bucket = SsmLogsBucket()
-    _ = CloudCourierSsmCommands()
-    all_computer_configs = create_all_computer_configs()
-    all_node_alerts: list[NodeAlert] = []
-    for computer_config in all_computer_configs:
-        _ = OnPremNode(
-            lab_computer_config=computer_config,
-            ssm_logs_bucket_name=ssm_logs_bucket.bucket_name,
-            data_bucket_name=raw_data_bucket.bucket_name,
-        )
-        all_node_alerts.append(NodeAlert(lab_computer_config=computer_config))
-    _ = Dashboard(node_alerts=all_node_alerts)
-    cloud_courier_agent_version = "0.0.4"
-    _ = CloudCourierAgentInstaller(
-        version=cloud_courier_agent_version,
-        files_to_package=[
-            DistributorFileToPackage(
-                source_path=f"s3://manual-artifacts--artifact-stores--prod-82ba004/cloud-courier/v{cloud_courier_agent_version}/exe-windows-2022-3.12.7.zip",
-                local_name=f"exe-v{cloud_courier_agent_version}.zip",
-            )
-        ],
-        download_exe_from_github=DOWNLOAD_EXE_FROM_GITHUB,
+    with profile_component("RawDataBucket"):
+        raw_data_bucket = RawDataBucket(program_context=program_context)
+    with profile_component("SsmLogsBucket"):
+        ssm_logs_bucket = SsmLogsBucket()
+    with profile_component("CloudCourierSsmCommands"):
+        _ = CloudCourierSsmCommands(program_context=program_context)
+    if all_computer_configs is None:
+        all_computer_configs = create_all_computer_configs()
+    validate_location_upload_bandwidth(all_computer_configs)
+    _ = validate_api_quotas(all_computer_configs)
+    _create_nodes(
+        all_computer_configs=all_computer_configs,
+        raw_data_bucket=raw_data_bucket,
+        ssm_logs_bucket=ssm_logs_bucket,
+        program_context=program_context,
     )
+    _create_alerts(all_computer_configs=all_computer_configs, program_context=program_context)
+    if GATHER_FLEET_INVENTORY:
+        with profile_component("FleetInventory"):
+            _ = FleetInventory()
+    if include_agent_installer:
+        cloud_courier_agent_version = "0.0.4"
+        with profile_component("CloudCourierAgentInstaller"):
+            _ = CloudCourierAgentInstaller(
+                version=cloud_courier_agent_version,
+                program_context=program_context,
+                files_to_package=[
+                    DistributorFileToPackage(
+                        source_path=f"s3://manual-artifacts--artifact-stores--prod-82ba004/cloud-courier/v{cloud_courier_agent_version}/exe-windows-2022-3.12.7.zip",
+                        local_name=f"exe-v{cloud_courier_agent_version}.zip",
+                    )
+                ],
+                download_exe_from_github=DOWNLOAD_EXE_FROM_GITHUB,
+                compression_level=DISTRIBUTOR_PACKAGE_COMPRESSION_LEVEL,
+            )
+    PROFILER.emit_report()
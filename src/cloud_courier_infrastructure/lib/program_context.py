@@ -0,0 +1,122 @@
+"""Identity and lookup values that are the same for every resource in a program run.
+
+They used to be looked up by each component that needed them (an STS call per computer, a fresh SSM client per
+lookup, etc.). They are now resolved once per process and passed to the components that need them.
+"""
+
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pulumi_aws
+from ephemeral_pulumi_deploy import get_config_str
+from pydantic import BaseModel
+from pydantic import Field
+
+from .profiling import profiled_invoke
+
+logger = logging.getLogger(__name__)
+
+CENTRAL_INFRA_SSM_PACKAGES_BUCKET_NAME_PARAMETER = "/org-managed/ssm-distributor-packages-bucket-name"
+DESCRIBE_INSTANCE_INFORMATION_PAGE_SIZE = 50  # the maximum the API allows
+
+
+class ManagedInstanceIndex(BaseModel, frozen=True):
+    """Every instance registered with SSM in the account, keyed by how it was activated."""
+
+    instance_ids_by_iam_role: dict[str, tuple[str, ...]] = Field(default_factory=dict[str, tuple[str, ...]])
+    instance_ids_by_activation_id: dict[str, tuple[str, ...]] = Field(default_factory=dict[str, tuple[str, ...]])
+    """Needed when several computers share an IAM role, since the role then no longer identifies the computer."""
+
+
+class ProgramContext(BaseModel, frozen=True):
+    aws_account_id: str
+    aws_org_id: str
+    aws_region: str
+    central_infra_ssm_packages_bucket_name: str
+    managed_instances: ManagedInstanceIndex = Field(default_factory=ManagedInstanceIndex)
+
+    def has_been_activated(self, *, iam_role_name: str) -> bool:
+        return len(self.managed_instances.instance_ids_by_iam_role.get(iam_role_name, ())) > 0
+
+    def has_activation_been_used(self, *, activation_id: str) -> bool:
+        return len(self.managed_instances.instance_ids_by_activation_id.get(activation_id, ())) > 0
+
+
+def get_aws_account_id(*, aws_region: str) -> str:
+    return boto3.Session().client("sts", region_name=aws_region).get_caller_identity()["Account"]
+
+
+def get_aws_org_id(*, aws_region: str) -> str:
+    organization = (
+        boto3.Session().client("organizations", region_name=aws_region).describe_organization()["Organization"]
+    )
+    assert "Id" in organization, f"Expected 'Id' in {organization}"
+    return organization["Id"]
+
+
+def get_central_infra_ssm_packages_bucket_name(*, org_home_region: str) -> str:
+    ssm_client = boto3.Session().client("ssm", region_name=org_home_region)
+    bucket_param = ssm_client.get_parameter(Name=CENTRAL_INFRA_SSM_PACKAGES_BUCKET_NAME_PARAMETER)["Parameter"]
+    assert "Value" in bucket_param, f"Expected 'Value' in {bucket_param}"
+    return bucket_param["Value"]
+
+
+def get_managed_instance_index(*, aws_region: str) -> ManagedInstanceIndex:
+    """List every instance registered with SSM in one paginated pass, rather than filtering per computer."""
+    ssm_client = boto3.Session().client("ssm", region_name=aws_region)
+    instance_ids_by_iam_role: dict[str, list[str]] = {}
+    instance_ids_by_activation_id: dict[str, list[str]] = {}
+    for page in ssm_client.get_paginator("describe_instance_information").paginate(
+        PaginationConfig={"PageSize": DESCRIBE_INSTANCE_INFORMATION_PAGE_SIZE}
+    ):
+        for instance_info in page["InstanceInformationList"]:
+            if "InstanceId" not in instance_info:
+                continue
+            if "IamRole" in instance_info:
+                instance_ids_by_iam_role.setdefault(instance_info["IamRole"], []).append(instance_info["InstanceId"])
+            if "ActivationId" in instance_info:
+                instance_ids_by_activation_id.setdefault(instance_info["ActivationId"], []).append(
+                    instance_info["InstanceId"]
+                )
+    return ManagedInstanceIndex(
+        instance_ids_by_iam_role={key: tuple(value) for key, value in instance_ids_by_iam_role.items()},
+        instance_ids_by_activation_id={key: tuple(value) for key, value in instance_ids_by_activation_id.items()},
+    )
+
+
+def resolve_program_context(*, parallel: bool = True) -> ProgramContext:
+    """Look up all the values from AWS, by default concurrently since they are independent of each other.
+
+    Each lookup creates its own boto3 Session, since Sessions are not thread-safe.
+    """
+    aws_region = pulumi_aws.config.region
+    if not aws_region:  # it ends up in ARNs, the activation script and the agent's arguments, so don't guess it
+        msg = "The AWS region is not configured for the stack, set it with `pulumi config set aws:region <region>`"
+        raise ValueError(msg)
+    org_home_region = get_config_str("proj:aws_org_home_region")
+    with ThreadPoolExecutor(max_workers=4 if parallel else 1) as executor:
+        aws_account_id = executor.submit(profiled_invoke(get_aws_account_id), aws_region=aws_region)
+        aws_org_id = executor.submit(profiled_invoke(get_aws_org_id), aws_region=aws_region)
+        bucket_name = executor.submit(
+            profiled_invoke(get_central_infra_ssm_packages_bucket_name), org_home_region=org_home_region
+        )
+        managed_instances = executor.submit(profiled_invoke(get_managed_instance_index), aws_region=aws_region)
+        program_context = ProgramContext(
+            aws_account_id=aws_account_id.result(),
+            aws_org_id=aws_org_id.result(),
+            aws_region=aws_region,
+            central_infra_ssm_packages_bucket_name=bucket_name.result(),
+            managed_instances=managed_instances.result(),
+        )
+    logger.info(
+        f"Resolved the program context for account {program_context.aws_account_id} in {aws_region}, with {len(program_context.managed_instances.instance_ids_by_activation_id)} used activations"
+    )
+    return program_context
+
+
+@functools.cache
+def get_program_context() -> ProgramContext:
+    """Resolve the context the first time it is needed in this process, and reuse it after that."""
+    return resolve_program_context()
@@ -0,0 +1,167 @@
+"""Upload local files to S3 from a Pulumi dynamic resource, using boto3's managed (parallel multipart) transfer.
+
+The SHA-256 of the file is stored in the object's metadata. Before uploading, a HEAD request compares it with the
+local file's, and the upload is skipped when the bytes already match, e.g. when a stack is recreated or a second stack
+publishes the same installer package. Multipart uploads don't have a full-object SHA-256 checksum in S3, which is why
+the metadata is used instead of the checksum fields.
+
+boto3 reads the standard AWS_ENDPOINT_URL_S3 environment variable, so the uploads can be pointed at a local S3
+stand-in such as moto server.
+"""
+
+import logging
+from http import HTTPStatus
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import override
+from urllib.parse import urlencode
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from pulumi import Input
+from pulumi import ResourceOptions
+from pulumi.dynamic import CreateResult
+from pulumi.dynamic import DiffResult
+from pulumi.dynamic import Resource
+from pulumi.dynamic import ResourceProvider
+from pulumi.dynamic import UpdateResult
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MULTIPART_CHUNKSIZE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_UPLOAD_CONCURRENCY = 8
+UPLOAD_MAX_ATTEMPTS = 10
+SHA256_METADATA_KEY = "sha256"
+REPLACE_ON_CHANGES = ("bucket_name", "s3_key", "bucket_region")
+UPDATE_ON_CHANGES = (
+    "sha256",
+    "tags",
+    "delete_on_destroy",
+)  # the local path and transfer settings don't affect the object itself
+
+
+class S3UploadArgs(BaseModel, frozen=True):
+    bucket_name: str
+    s3_key: str
+    bucket_region: str
+    local_file_path: str
+    sha256: str
+    tags: dict[str, str]
+    delete_on_destroy: bool
+    multipart_chunksize_bytes: int = DEFAULT_MULTIPART_CHUNKSIZE_BYTES
+    max_concurrency: int = DEFAULT_MAX_UPLOAD_CONCURRENCY
+
+
+def create_s3_client(bucket_region: str) -> "S3Client":
+    return boto3.Session().client(
+        "s3",
+        region_name=bucket_region,
+        config=Config(retries={"max_attempts": UPLOAD_MAX_ATTEMPTS, "mode": "adaptive"}),
+    )
+
+
+def is_object_identical(*, s3_client: "S3Client", bucket_name: str, s3_key: str, sha256: str) -> bool:
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+    except ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == HTTPStatus.NOT_FOUND:
+            return False
+        raise
+    return head.get("Metadata", {}).get(SHA256_METADATA_KEY) == sha256
+
+
+def upload_file_if_changed(args: S3UploadArgs, *, s3_client: "S3Client | None" = None) -> bool:
+    """Upload the file unless the object already has the same contents (then just update its tags).
+
+    Returns whether the file was uploaded.
+    """
+    if s3_client is None:
+        s3_client = create_s3_client(args.bucket_region)
+    if is_object_identical(s3_client=s3_client, bucket_name=args.bucket_name, s3_key=args.s3_key, sha256=args.sha256):
+        logger.info(f"s3://{args.bucket_name}/{args.s3_key} already has the same contents, skipping the upload")
+        _ = s3_client.put_object_tagging(
+            Bucket=args.bucket_name,
+            Key=args.s3_key,
+            Tagging={"TagSet": [{"Key": key, "Value": value} for key, value in args.tags.items()]},
+        )
+        return False
+    logger.info(f"Uploading {args.local_file_path} to s3://{args.bucket_name}/{args.s3_key}")
+    s3_client.upload_file(
+        args.local_file_path,
+        args.bucket_name,
+        args.s3_key,
+        ExtraArgs={"Metadata": {SHA256_METADATA_KEY: args.sha256}, "Tagging": urlencode(args.tags)},
+        Config=TransferConfig(
+            multipart_threshold=args.multipart_chunksize_bytes,
+            multipart_chunksize=args.multipart_chunksize_bytes,
+            max_concurrency=args.max_concurrency,
+        ),
+    )
+    return True
+
+
+class S3UploadProvider(ResourceProvider):
+    @override
+    def create(self, props: dict[str, Any]) -> CreateResult:
+        args = S3UploadArgs.model_validate(props)
+        _ = upload_file_if_changed(args)
+        return CreateResult(id_=f"s3://{args.bucket_name}/{args.s3_key}", outs=props)
+
+    @override
+    def diff(self, _id: str, _olds: dict[str, Any], _news: dict[str, Any]) -> DiffResult:
+        return DiffResult(
+            changes=any(_olds.get(name) != _news.get(name) for name in (*REPLACE_ON_CHANGES, *UPDATE_ON_CHANGES)),
+            replaces=[name for name in REPLACE_ON_CHANGES if _olds.get(name) != _news.get(name)],
+            delete_before_replace=True,  # the old object is removed first, so it can't delete a replacement written to the same key
+        )
+
+    @override
+    def update(self, _id: str, _olds: dict[str, Any], _news: dict[str, Any]) -> UpdateResult:
+        _ = upload_file_if_changed(S3UploadArgs.model_validate(_news))
+        return UpdateResult(outs=_news)
+
+    @override
+    def delete(self, _id: str, _props: dict[str, Any]) -> None:
+        args = S3UploadArgs.model_validate(_props)
+        if args.delete_on_destroy:
+            _ = create_s3_client(args.bucket_region).delete_object(Bucket=args.bucket_name, Key=args.s3_key)
+
+
+class S3FileUpload(Resource):
+    def __init__(  # noqa: PLR0913 # yes, this is a lot of arguments, but they're all kwargs
+        self,
+        resource_name: str,
+        *,
+        bucket_name: Input[str],
+        s3_key: str,
+        bucket_region: str,
+        local_file_path: str,
+        sha256: str,
+        tags: dict[str, str],
+        delete_on_destroy: bool,
+        multipart_chunksize_bytes: int = DEFAULT_MULTIPART_CHUNKSIZE_BYTES,
+        max_concurrency: int = DEFAULT_MAX_UPLOAD_CONCURRENCY,
+        opts: ResourceOptions | None = None,
+    ) -> None:
+        super().__init__(
+            S3UploadProvider(),
+            resource_name,
+            {
+                "bucket_name": bucket_name,
+                "s3_key": s3_key,
+                "bucket_region": bucket_region,
+                "local_file_path": local_file_path,
+                "sha256": sha256,
+                "tags": tags,
+                "delete_on_destroy": delete_on_destroy,
+                "multipart_chunksize_bytes": multipart_chunksize_bytes,
+                "max_concurrency": max_concurrency,
+            },
+            opts,
+        )
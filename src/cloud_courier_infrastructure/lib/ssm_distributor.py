@@ -1,46 +1,51 @@
 import hashlib
 import inspect
 import json
-import os
+import logging
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import gettempdir
-from urllib.parse import urlparse
+from typing import BinaryIO
+from zipfile import ZIP_DEFLATED
 from zipfile import ZipFile
+from zipfile import ZipInfo
 
-import boto3
 import pulumi
-import pulumi_aws
 from ephemeral_pulumi_deploy import append_resource_suffix
+from ephemeral_pulumi_deploy import common_tags
 from ephemeral_pulumi_deploy import common_tags_native
-from ephemeral_pulumi_deploy import get_aws_account_id
 from ephemeral_pulumi_deploy import get_config_str
 from pulumi import ComponentResource
 from pulumi import Output
 from pulumi import ResourceOptions
 from pulumi_aws_native import ssm
-from pulumi_command import local
 from pydantic import BaseModel
 
+from .artifact_cache import ArtifactCache
+from .file_hashing import get_sha256
+from .file_hashing import get_sha256_many
+from .program_context import ProgramContext
+from .s3_upload import DEFAULT_MAX_UPLOAD_CONCURRENCY
+from .s3_upload import DEFAULT_MULTIPART_CHUNKSIZE_BYTES
+from .s3_upload import S3FileUpload
 from .ssm_lib import FOLDER_SUBPATH
 from .ssm_lib import LOGS_DIR
 from .ssm_lib import STOP_FLAG_DIR
 from .ssm_lib import add_boilerplate_to_ps_script
 
+logger = logging.getLogger(__name__)
 
-def get_central_infra_ssm_packages_bucket_name() -> str:
-    org_home_region = get_config_str("proj:aws_org_home_region")
-    ssm_client = boto3.client("ssm", region_name=org_home_region)
-    bucket_param = ssm_client.get_parameter(Name="/org-managed/ssm-distributor-packages-bucket-name")["Parameter"]
-    assert "Value" in bucket_param, f"Expected 'Value' in {bucket_param}"
-    return bucket_param["Value"]
-
-
-def get_sha256(file_path: Path) -> str:
-    sha = hashlib.sha256()
-    with file_path.open("rb") as file:
-        for byte_block in iter(lambda: file.read(4096), b""):
-            sha.update(byte_block)
-    return sha.hexdigest()
+MAX_PACKAGE_DOWNLOAD_WORKERS = 4
+REPRODUCIBLE_ZIP_DATE_TIME = (2025, 2, 18, 15, 37, 22)  # arbitrary, it just needs to stay the same between builds
+REPRODUCIBLE_ZIP_FILE_MODE = 0o644
+ZIP_COPY_CHUNK_BYTES = 1024 * 1024
+MIN_ZLIB_COMPRESSION_LEVEL = 0
+MAX_ZLIB_COMPRESSION_LEVEL = 9
+EXE_ZIP_FILE_HASHES_NAME = "file-hashes.json"
+PACKAGE_FORMAT_VERSION = (
+    "2"  # bump whenever write_reproducible_zip changes how it lays out the bytes, so old builds aren't reused
+)
 
 
 class UploadFileToS3Command(ComponentResource):
@@ -54,39 +59,33 @@ class UploadFileToS3Command(ComponentResource):
         s3_key: str,
         bucket_region: str,
         local_file_path: Path,
+        local_file_sha256: str | None = None,
         delete_on_destroy: bool = True,
+        multipart_chunksize_bytes: int = DEFAULT_MULTIPART_CHUNKSIZE_BYTES,
+        max_concurrency: int = DEFAULT_MAX_UPLOAD_CONCURRENCY,
         parent: ComponentResource,
     ) -> None:
+        """Upload the file with a parallel multipart transfer, which runs again whenever the file's hash changes.
+
+        Pass local_file_sha256 if the hash is already known, to skip reading the file again to compute it.
+        """
         super().__init__(
             "labauto:UploadFileToS3",
             append_resource_suffix(resource_name, max_length=100),
             None,
         )
-        file_hash = get_sha256(
-            local_file_path
-        )  # include the file hash in the create command so that if the local file changes, then it will be recognized and trigger an update of the resource
-        self.upload_command = local.Command(
+        self.upload = S3FileUpload(
             append_resource_suffix(resource_name, max_length=100),
-            create=bucket_name.apply(  # TODO: add tags to object
-                lambda bucket_name: (
-                    f"echo file hash: {file_hash} && aws s3api put-object --bucket {bucket_name} --key {s3_key} --body {local_file_path} --region {bucket_region}"
-                )
-            ),
-            delete=bucket_name.apply(
-                lambda bucket_name: (
-                    f"aws s3api delete-object --bucket {bucket_name} --key {s3_key} --region {bucket_region}"
-                    if delete_on_destroy
-                    else ""
-                )
-            ),
-            opts=ResourceOptions(
-                parent=parent,
-                replace_on_changes=[
-                    "create",
-                    "delete",
-                ],  # Ensure that file is removed if anything changes.  otherwise it can be left in bucket which prevents deletion
-                delete_before_replace=True,  # Since the file name is the same, ensure that it doesn't get deleted after being recreated during an update
-            ),
+            bucket_name=bucket_name,
+            s3_key=s3_key,
+            bucket_region=bucket_region,
+            local_file_path=str(local_file_path),
+            sha256=get_sha256(local_file_path) if local_file_sha256 is None else local_file_sha256,
+            tags=common_tags(),
+            delete_on_destroy=delete_on_destroy,
+            multipart_chunksize_bytes=multipart_chunksize_bytes,
+            max_concurrency=max_concurrency,
+            opts=ResourceOptions(parent=parent),
         )
 
 
@@ -99,21 +98,181 @@ class DistributorFileToPackage(BaseModel):
         return self.source_path.startswith("s3://")
 
 
-def download_s3_file(*, file_to_package: DistributorFileToPackage, local_file_dir: Path, aws_region: str) -> Path:
-    boto_session = boto3.Session()
-    s3_client = boto_session.client("s3", region_name=aws_region)
-    parsed_url = urlparse(
-        file_to_package.source_path, allow_fragments=False
-    )  # based on https://stackoverflow.com/questions/42641315/s3-urls-get-bucket-name-and-path
+class DownloadedFile(BaseModel, frozen=True):
+    local_path: Path
+    sha256: str
+
+
+def _place_file(*, source_path: Path, local_path: Path) -> None:
+    local_path.unlink(missing_ok=True)
+    try:
+        local_path.hardlink_to(source_path)
+    except OSError:  # e.g. the source is on a different filesystem
+        _ = shutil.copyfile(source_path, local_path)
+
+
+def download_s3_file(
+    *,
+    file_to_package: DistributorFileToPackage,
+    local_file_dir: Path,
+    aws_region: str,
+    artifact_cache: ArtifactCache | None = None,
+) -> DownloadedFile:
+    """Place the file in the local directory, only downloading it if the artifact cache doesn't have a current copy."""
+    if artifact_cache is None:
+        artifact_cache = ArtifactCache()
+    cached = artifact_cache.fetch_s3_artifact(source_url=file_to_package.source_path, aws_region=aws_region)
     local_path = local_file_dir / file_to_package.local_name
-    s3_client.download_file(parsed_url.netloc, parsed_url.path.lstrip("/"), str(local_path))
-    return local_path
+    _place_file(source_path=artifact_cache.get_blob_path(cached.sha256), local_path=local_path)
+    return DownloadedFile(local_path=local_path, sha256=cached.sha256)
+
+
+def download_files_to_package(
+    *, files_to_package: list[DistributorFileToPackage], local_file_dir: Path, aws_region: str
+) -> list[DownloadedFile]:
+    """Gather all the files into the local directory, returning them in the same order they were given.
+
+    S3 files are downloaded concurrently through the artifact cache. Local files are hashed concurrently through the
+    file digest cache, so unchanged ones are never read again.
+    """
+    artifact_cache = ArtifactCache()
+    local_sha256s = get_sha256_many(
+        Path(file_to_package.source_path) for file_to_package in files_to_package if not file_to_package.is_s3_url
+    )
+
+    def download(file_to_package: DistributorFileToPackage) -> DownloadedFile:
+        if file_to_package.is_s3_url:
+            return download_s3_file(
+                file_to_package=file_to_package,
+                local_file_dir=local_file_dir,
+                aws_region=aws_region,
+                artifact_cache=artifact_cache,
+            )
+        source_path = Path(file_to_package.source_path)
+        local_path = local_file_dir / file_to_package.local_name
+        _place_file(source_path=source_path, local_path=local_path)
+        return DownloadedFile(local_path=local_path, sha256=local_sha256s[source_path])
+
+    with ThreadPoolExecutor(max_workers=MAX_PACKAGE_DOWNLOAD_WORKERS) as executor:
+        return list(executor.map(download, files_to_package))
+
+
+class _HashingWriter:
+    """A write-only, unseekable file wrapper that hashes everything written through it.
+
+    ZipFile writes to an unseekable file in a single forward pass (using data descriptors instead of going back to
+    patch the local headers), so the hash of the finished archive is known without reading it back.
+    """
+
+    def __init__(self, file: BinaryIO) -> None:
+        super().__init__()
+        self._file = file
+        self._position = 0
+        self.sha = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.sha.update(data)
+        self._position += len(data)
+        return self._file.write(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        self._file.flush()
+
+
+def validate_compression_level(compression_level: int | None) -> None:
+    if compression_level is not None and not (
+        MIN_ZLIB_COMPRESSION_LEVEL <= compression_level <= MAX_ZLIB_COMPRESSION_LEVEL
+    ):
+        msg = f"The compression level ({compression_level}) must be between {MIN_ZLIB_COMPRESSION_LEVEL} and {MAX_ZLIB_COMPRESSION_LEVEL}, or None to store the files uncompressed"
+        raise ValueError(msg)
+
+
+def write_reproducible_zip(
+    *, zip_file_path: Path, files_to_zip: list[Path], compression_level: int | None = None
+) -> str:
+    """Stream the files into a zip whose bytes only depend on their names and contents, and return its SHA-256.
+
+    The timestamps and permissions of every entry are fixed, so rebuilding an unchanged package gives the same
+    checksum. Each file is stored at the root of the archive under its own name. With a compression_level (0-9) the
+    entries are deflated, otherwise they are stored uncompressed.
+    """
+    validate_compression_level(compression_level)
+    with zip_file_path.open("wb") as file:
+        writer = _HashingWriter(file)
+        with ZipFile(writer, "w") as archive:  # type: ignore[reportArgumentType] # ZipFile only needs write, tell and flush
+            for file_path in files_to_zip:
+                zip_info = ZipInfo(file_path.name, date_time=REPRODUCIBLE_ZIP_DATE_TIME)
+                zip_info.external_attr = REPRODUCIBLE_ZIP_FILE_MODE << 16
+                if compression_level is not None:
+                    zip_info.compress_type = ZIP_DEFLATED
+                    zip_info._compresslevel = compression_level  # type: ignore[reportAttributeAccessIssue] # noqa: SLF001 # the only way to set the level when streaming an entry, and still works (as an alias of compress_level) in Python 3.13+
+                zip_info.file_size = file_path.stat().st_size  # lets ZipFile decide up front if it needs ZIP64
+                with file_path.open("rb") as source, archive.open(zip_info, "w") as destination:
+                    shutil.copyfileobj(source, destination, ZIP_COPY_CHUNK_BYTES)
+    return writer.sha.hexdigest()
+
+
+def write_zip_entry_hashes(*, zip_file_path: Path, hashes_file_path: Path) -> None:
+    """Write the SHA-256 of every file in the zip, so the installer can extract only the ones that changed.
+
+    The entries are keyed by their name exactly as stored in the archive, which is what .NET's ZipArchiveEntry.FullName
+    gives the install script.
+    """
+    hashes: dict[str, str] = {}
+    with ZipFile(zip_file_path) as archive:
+        for zip_info in archive.infolist():
+            if zip_info.is_dir():
+                continue
+            sha = hashlib.sha256()
+            with archive.open(zip_info) as entry:
+                for chunk in iter(lambda: entry.read(ZIP_COPY_CHUNK_BYTES), b""):
+                    sha.update(chunk)
+            hashes[zip_info.orig_filename] = sha.hexdigest()
+    _ = hashes_file_path.write_text(json.dumps({"files": dict(sorted(hashes.items()))}, indent=2), encoding="utf-8")
+
+
+def compute_package_fingerprint(
+    *, version: str, scripts: dict[str, str], downloaded_files: list[DownloadedFile], compression_level: int | None
+) -> str:
+    """Hash everything that determines the bytes of the package, so an unchanged package doesn't need to be rebuilt."""
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "package_format_version": PACKAGE_FORMAT_VERSION,
+                "version": version,
+                "compression_level": compression_level,
+                "scripts": {
+                    script_name: hashlib.sha256(script.encode("utf-8")).hexdigest()
+                    for script_name, script in scripts.items()
+                },
+                "files": [
+                    [downloaded_file.local_path.name, downloaded_file.sha256] for downloaded_file in downloaded_files
+                ],
+            }
+        ).encode("utf-8")
+    ).hexdigest()
 
 
 class CloudCourierAgentInstaller(ComponentResource):
     def __init__(
-        self, *, files_to_package: list[DistributorFileToPackage], version: str, download_exe_from_github: bool = False
+        self,
+        *,
+        files_to_package: list[DistributorFileToPackage],
+        version: str,
+        program_context: ProgramContext,
+        download_exe_from_github: bool = False,
+        compression_level: int | None = None,
     ):
+        """Build the SSM Distributor package for the agent and upload it.
+
+        The package is only rebuilt when one of its inputs (the scripts, the packaged files, the compression level or
+        the version) changed since the last build on this machine. With a compression_level (0-9) the zip is
+        deflated, otherwise its entries are stored uncompressed.
+        """
+        validate_compression_level(compression_level)  # before spending time downloading the files to package
         super().__init__(
             "labauto:cloud-courier-agent-package",
             append_resource_suffix(),
@@ -121,6 +280,7 @@ class CloudCourierAgentInstaller(ComponentResource):
         )
         del download_exe_from_github  # TODO: implement this if the requested version is not present in S3 already
         self._files_to_package = files_to_package
+        self._program_context = program_context
         self._task_name = "CloudCourierUploadAgent"
         package_base_name = "cloud-courier-agent"
         resource_name = f"{package_base_name}-{version}"
@@ -128,46 +288,55 @@ class CloudCourierAgentInstaller(ComponentResource):
         temp_dir = Path(gettempdir()) / pulumi.get_project() / pulumi.get_stack() / resource_name
         temp_dir.mkdir(parents=True, exist_ok=True)
         zip_file_path = temp_dir / f"{resource_name}_WINDOWS.zip"
-        pkg_install_file = temp_dir / "install.ps1"
-        pkg_uninstall_file = temp_dir / "uninstall.ps1"
-        files_to_zip: list[Path] = [pkg_install_file, pkg_uninstall_file]
-
-        with pkg_install_file.open("w", encoding="utf-8") as file:
-            _ = file.write(add_boilerplate_to_ps_script(self._generate_install_script()))
-        with pkg_uninstall_file.open("w", encoding="utf-8") as file:
-            _ = file.write(add_boilerplate_to_ps_script(self._generate_uninstall_script()))
-
-        for file_to_package in files_to_package:
-            if file_to_package.is_s3_url:
-                files_to_zip.append(
-                    download_s3_file(
-                        file_to_package=file_to_package, local_file_dir=temp_dir, aws_region=org_home_region
-                    )
-                )
-            else:
-                raise NotImplementedError("Only S3 URLs are supported for now")
-
-        with ZipFile(zip_file_path, "w") as archive:
-            for file_path in files_to_zip:
-                # Hard-code file timestamps so the final zip file/metadata remains the same checksum between builds
-                os.utime(file_path, (1739893042, 1739893042))  # arbitrary timestamp
-                os.chdir(file_path.parent)
-                archive.write(file_path.name)
-
-        pkg_manifest = {
-            "schemaVersion": "2.0",
-            "version": version,
-            "packages": {"windows": {"_any": {"x86_64": {"file": zip_file_path.name}}}},
-            "files": {zip_file_path.name: {"checksums": {"sha256": get_sha256(zip_file_path)}}},
-        }
-
         dist_pkg_manifest_file_path = temp_dir / "manifest.json"
-        with dist_pkg_manifest_file_path.open("w", encoding="utf-8") as file:
-            _ = file.write(json.dumps(pkg_manifest))
-        s3_key_prefix = f"{get_aws_account_id()}/{append_resource_suffix(package_base_name)}/v{version}"
+        fingerprint_file_path = temp_dir / "fingerprint.txt"
+        scripts = {
+            "install.ps1": add_boilerplate_to_ps_script(self._generate_install_script()),
+            "uninstall.ps1": add_boilerplate_to_ps_script(self._generate_uninstall_script()),
+        }
+        downloaded_files = download_files_to_package(
+            files_to_package=files_to_package, local_file_dir=temp_dir, aws_region=org_home_region
+        )
+        fingerprint = compute_package_fingerprint(
+            version=version, scripts=scripts, downloaded_files=downloaded_files, compression_level=compression_level
+        )
+        if (
+            fingerprint_file_path.exists()
+            and fingerprint_file_path.read_text(encoding="utf-8") == fingerprint
+            and zip_file_path.exists()
+            and dist_pkg_manifest_file_path.exists()
+        ):
+            logger.info(f"Reusing the previously built {zip_file_path.name}, since none of its inputs changed")
+            pkg_manifest_json = dist_pkg_manifest_file_path.read_text(encoding="utf-8")
+            zip_sha256: str = json.loads(pkg_manifest_json)["files"][zip_file_path.name]["checksums"]["sha256"]
+        else:
+            fingerprint_file_path.unlink(missing_ok=True)  # so an interrupted build is never reused
+            files_to_zip: list[Path] = []
+            for script_name, script in scripts.items():
+                script_path = temp_dir / script_name
+                _ = script_path.write_text(script, encoding="utf-8")
+                files_to_zip.append(script_path)
+            files_to_zip.extend(downloaded_file.local_path for downloaded_file in downloaded_files)
+            exe_zip_hashes_path = temp_dir / EXE_ZIP_FILE_HASHES_NAME
+            write_zip_entry_hashes(zip_file_path=downloaded_files[0].local_path, hashes_file_path=exe_zip_hashes_path)
+            files_to_zip.append(exe_zip_hashes_path)
+            zip_sha256 = write_reproducible_zip(
+                zip_file_path=zip_file_path, files_to_zip=files_to_zip, compression_level=compression_level
+            )
+            pkg_manifest_json = json.dumps(
+                {
+                    "schemaVersion": "2.0",
+                    "version": version,
+                    "packages": {"windows": {"_any": {"x86_64": {"file": zip_file_path.name}}}},
+                    "files": {zip_file_path.name: {"checksums": {"sha256": zip_sha256}}},
+                }
+            )
+            _ = dist_pkg_manifest_file_path.write_text(pkg_manifest_json, encoding="utf-8")
+            _ = fingerprint_file_path.write_text(fingerprint, encoding="utf-8")
+        s3_key_prefix = f"{program_context.aws_account_id}/{append_resource_suffix(package_base_name)}/v{version}"
         manifest_s3_key = f"{s3_key_prefix}/{dist_pkg_manifest_file_path.name}"
         pkg_s3_key = f"{s3_key_prefix}/{zip_file_path.name}"
-        ssm_bucket_name = get_central_infra_ssm_packages_bucket_name()
+        ssm_bucket_name = program_context.central_infra_ssm_packages_bucket_name
 
         upload_manifest_command = UploadFileToS3Command(
             resource_name=f"{resource_name}-manifest",
@@ -184,6 +353,7 @@ class CloudCourierAgentInstaller(ComponentResource):
             s3_key=pkg_s3_key,
             bucket_region=org_home_region,
             local_file_path=zip_file_path,
+            local_file_sha256=zip_sha256,
             delete_on_destroy=False,
             parent=self,
         )
@@ -191,13 +361,13 @@ class CloudCourierAgentInstaller(ComponentResource):
             append_resource_suffix(package_base_name),
             name=append_resource_suffix(package_base_name),
             opts=ResourceOptions(
-                parent=self, depends_on=[upload_manifest_command.upload_command, upload_package_command.upload_command]
+                parent=self, depends_on=[upload_manifest_command.upload, upload_package_command.upload]
             ),
             document_type=ssm.DocumentType.PACKAGE,
             update_method=ssm.DocumentUpdateMethod.NEW_VERSION,
             version_name=version,
             tags=common_tags_native(),
-            content=json.dumps(pkg_manifest),
+            content=pkg_manifest_json,
             attachments=[
                 ssm.DocumentAttachmentsSourceArgs(
                     key=ssm.DocumentAttachmentsSourceKey.SOURCE_URL, values=[f"s3://{ssm_bucket_name}/{s3_key_prefix}"]
@@ -213,6 +383,9 @@ class CloudCourierAgentInstaller(ComponentResource):
                     # Specify the path to your ZIP file
                     $zipFile = "{self._files_to_package[0].local_name}"
 
+                    # The SHA-256 of every file in the ZIP, so only the ones that changed need to be extracted
+                    $fileHashesFile = "{EXE_ZIP_FILE_HASHES_NAME}"
+
                     # Define the destination as the Program Files directory
                     $destination = "$env:ProgramFiles\{FOLDER_SUBPATH}"
                     """,
@@ -223,10 +396,37 @@ class CloudCourierAgentInstaller(ComponentResource):
                         exit 1
                     }
 
-                    # Attempt to extract the contents of the ZIP file
+                    # Attempt to extract the files in the ZIP that differ from the ones already installed
                     try {
-                        Expand-Archive -LiteralPath $zipFile -DestinationPath $destination -Force
-                        Write-Host "Successfully extracted '$zipFile' to '$destination'."
+                        Add-Type -AssemblyName System.IO.Compression, System.IO.Compression.FileSystem
+                        $expectedHashes = (Get-Content -LiteralPath $fileHashesFile -Raw | ConvertFrom-Json).files
+                        $destinationRoot = [System.IO.Path]::GetFullPath($destination).TrimEnd('\') + '\'
+                        $archive = [System.IO.Compression.ZipFile]::OpenRead((Resolve-Path -LiteralPath $zipFile).Path)
+                        $extractedCount = 0
+                        $unchangedCount = 0
+                        try {
+                            foreach ($entry in $archive.Entries) {
+                                if ($entry.FullName.EndsWith('/') -or $entry.FullName.EndsWith('\')) {
+                                    continue  # a folder
+                                }
+                                $targetPath = [System.IO.Path]::GetFullPath((Join-Path $destination ($entry.FullName -replace '/', '\')))
+                                if (-Not $targetPath.StartsWith($destinationRoot, [System.StringComparison]::OrdinalIgnoreCase)) {
+                                    throw "The ZIP entry '$($entry.FullName)' would be extracted outside of '$destination'."
+                                }
+                                $expectedHash = $expectedHashes.($entry.FullName)
+                                if ($expectedHash -and (Test-Path -LiteralPath $targetPath -PathType Leaf) -and ((Get-FileHash -LiteralPath $targetPath -Algorithm SHA256).Hash -eq $expectedHash)) {
+                                    $unchangedCount++
+                                    continue
+                                }
+                                New-Item -ItemType Directory -Force -Path (Split-Path -Parent $targetPath) | Out-Null
+                                [System.IO.Compression.ZipFileExtensions]::ExtractToFile($entry, $targetPath, $true)
+                                $extractedCount++
+                            }
+                        }
+                        finally {
+                            $archive.Dispose()
+                        }
+                        Write-Host "Successfully extracted $extractedCount changed files from '$zipFile' to '$destination' ($unchangedCount were already up to date)."
                     }
                     catch {
                         Write-Error "An error occurred during extraction: $_"
@@ -240,7 +440,7 @@ class CloudCourierAgentInstaller(ComponentResource):
                     $logsDir = "{LOGS_DIR}"
                     New-Item -ItemType Directory -Force -Path $stopFlagDir
                     New-Item -ItemType Directory -Force -Path $logsDir
-                    $arguments = "--aws-region={pulumi_aws.config.region} --stop-flag-dir=$stopFlagDir --log-folder=$logsDir --no-console-logging"
+                    $arguments = "--aws-region={self._program_context.aws_region} --stop-flag-dir=$stopFlagDir --log-folder=$logsDir --no-console-logging"
 
                     # Build the command string.
                     # This command uses tasklist and find to check if cloud-courier.exe is already running.
@@ -0,0 +1,45 @@
+from ephemeral_pulumi_deploy import append_resource_suffix
+from pulumi import ComponentResource
+from pulumi import ResourceOptions
+from pulumi_aws_native import ssm
+
+from .hybrid_activation import ORIGINAL_COMPUTER_INFO_TAG_KEY
+
+INVENTORY_SCHEDULE_EXPRESSION = "rate(12 hours)"
+
+
+class FleetInventory(ComponentResource):
+    def __init__(self) -> None:
+        """Gather SSM Inventory from every lab computer with a State Manager association.
+
+        Inventory lists the installed applications, services and hardware details of each computer, so when the host
+        load metrics show high CPU it's possible to see what instrument software is installed alongside the agent.
+        SSM only allows one inventory association per managed instance, so this can't be used in accounts that already
+        gather inventory for every instance (e.g. through Quick Setup).
+        """
+        super().__init__(
+            "labauto:FleetInventory",
+            append_resource_suffix("fleet-inventory", max_length=100),
+            None,
+        )
+        _ = ssm.Association(
+            append_resource_suffix("gather-inventory", max_length=100),
+            association_name=append_resource_suffix("cloud-courier-gather-inventory", max_length=100),
+            name="AWS-GatherSoftwareInventory",
+            targets=[
+                # every computer's Activation tags its managed instance with this
+                ssm.AssociationTargetArgs(key="tag-key", values=[ORIGINAL_COMPUTER_INFO_TAG_KEY])
+            ],
+            schedule_expression=INVENTORY_SCHEDULE_EXPRESSION,
+            parameters={
+                "applications": ["Enabled"],
+                "awsComponents": ["Enabled"],
+                "instanceDetailedInformation": ["Enabled"],
+                "services": ["Enabled"],
+                "networkConfig": ["Disabled"],
+                "windowsUpdates": ["Disabled"],
+                "windowsRoles": ["Disabled"],
+                "customInventory": ["Disabled"],
+            },
+            opts=ResourceOptions(parent=self),
+        )
@@ -1,13 +1,13 @@
 import inspect
 import json
 
-import pulumi_aws
 from ephemeral_pulumi_deploy import append_resource_suffix
 from ephemeral_pulumi_deploy import common_tags_native
 from pulumi import ComponentResource
 from pulumi import ResourceOptions
 from pulumi_aws_native import ssm
 
+from .program_context import ProgramContext
 from .ssm_lib import FOLDER_SUBPATH
 from .ssm_lib import LOGS_DIR
 from .ssm_lib import STOP_FLAG_DIR
@@ -17,6 +17,8 @@ from .ssm_lib import add_boilerplate_to_ps_command_lines
 class CloudCourierSsmCommands(ComponentResource):
     def __init__(
         self,
+        *,
+        program_context: ProgramContext,
     ):
         super().__init__(
             "labauto:cloud-courier",
@@ -58,7 +60,7 @@ class CloudCourierSsmCommands(ComponentResource):
                                                     $exePath = "$destination\cloud-courier\cloud-courier.exe"
                                                     $stopFlagDir = "{STOP_FLAG_DIR}"
                                                     $logsDir = "{LOGS_DIR}"
-                                                    $arguments = "--aws-region={pulumi_aws.config.region} --stop-flag-dir=$stopFlagDir --log-folder=$logsDir --no-console-logging"
+                                                    $arguments = "--aws-region={program_context.aws_region} --stop-flag-dir=$stopFlagDir --log-folder=$logsDir --no-console-logging"
                                                 """,
                                                 # console logging causes weird problems with SSM Run command interpreting it as a Powershell command to try and execute somehow
                                                 r"""
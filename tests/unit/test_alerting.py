@@ -0,0 +1,164 @@
+import json
+import re
+from typing import Any
+from typing import override
+
+import pytest
+from pulumi.runtime import MockResourceArgs
+
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.alerting import MAX_ALARMS_PER_COMPOSITE_RULE
+from cloud_courier_infrastructure.lib.alerting import MAX_SEARCH_EXPRESSION_LENGTH
+from cloud_courier_infrastructure.lib.alerting import _create_node_search_expressions
+from cloud_courier_infrastructure.lib.courier_config_models import AppConfig
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_program_with_mocks
+from cloud_courier_infrastructure.lib.models import AlertingConfig
+from cloud_courier_infrastructure.lib.models import ComputerLocation
+from cloud_courier_infrastructure.lib.models import LabComputerConfig
+
+SNS_TOPIC_NAME_REGEX = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+class AlertRecordingMocks(FleetBenchmarkMocks):
+    def __init__(self) -> None:
+        super().__init__()
+        self.topic_names: list[str] = []
+        self.composite_alarm_rules: dict[str, str] = {}
+        self.dashboard_bodies: dict[str, dict[str, Any]] = {}
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[Any, Any]]:
+        inputs: dict[str, Any] = args.inputs  # type: ignore[reportUnknownMemberType] # the mock args are untyped in the Pulumi SDK
+        if args.typ == "aws-native:sns:Topic":
+            self.topic_names.append(args.name)
+        elif args.typ == "aws-native:cloudwatch:CompositeAlarm":
+            self.composite_alarm_rules[inputs["alarmName"]] = inputs["alarmRule"]
+        elif args.typ == "aws-native:cloudwatch:Dashboard":
+            self.dashboard_bodies[inputs["dashboardName"]] = json.loads(inputs["dashboardBody"])
+        return super().new_resource(args)
+
+
+def test_Given_email_addresses_with_symbols__When_shared_topics_are_created__Then_topic_names_are_sns_legal(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(program, "USE_SHARED_ALERT_TOPICS", True)
+    computers = [
+        computer.model_copy(update={"alerting_config": AlertingConfig(emails=[email_address])})
+        for computer, email_address in zip(
+            create_synthetic_fleet(3),
+            ["first+lab@example.org", "o'brien@example.org", "first+lab@example.org"],
+            strict=True,
+        )
+    ]
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(computers, mocks=mocks)
+
+    assert len(mocks.topic_names) == len({computer.alerting_config.emails[0] for computer in computers})
+    assert all(SNS_TOPIC_NAME_REGEX.match(topic_name) for topic_name in mocks.topic_names), mocks.topic_names
+
+
+def _create_fleet_at_one_location(fleet_size: int) -> list[LabComputerConfig]:
+    return [
+        computer.model_copy(update={"location": ComputerLocation(name="Site-0")})
+        for computer in create_synthetic_fleet(fleet_size)
+    ]
+
+
+def test_Given_shared_topics_and_location_alarms__When_program_is_run__Then_location_alarm_notifies_a_shared_topic(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(program, "USE_SHARED_ALERT_TOPICS", True)
+    monkeypatch.setattr(program, "USE_LOCATION_COMPOSITE_ALARMS", True)
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(create_synthetic_fleet(10), mocks=mocks)
+
+    assert "site-0-outage--cloud-courier--bench" in mocks.composite_alarm_rules
+    assert all(topic_name.startswith("alert-") for topic_name in mocks.topic_names), mocks.topic_names
+
+
+def test_Given_location_with_more_computers_than_a_rule_allows__When_program_is_run__Then_location_alarm_is_split(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(program, "USE_LOCATION_COMPOSITE_ALARMS", True)
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(_create_fleet_at_one_location(MAX_ALARMS_PER_COMPOSITE_RULE + 1), mocks=mocks)
+
+    assert mocks.composite_alarm_rules["site-0-outage--cloud-courier--bench"] == (
+        'ALARM("site-0-outage-0--cloud-courier--bench") AND ALARM("site-0-outage-1--cloud-courier--bench")'
+    )
+    assert mocks.composite_alarm_rules["site-0-outage-1--cloud-courier--bench"] == (
+        f'ALARM("site-0--instrument-{MAX_ALARMS_PER_COMPOSITE_RULE}--cloud-courier--bench")'
+    )
+
+
+def test_Given_no_computers__When_search_expressions_created__Then_none():
+    assert (
+        _create_node_search_expressions(
+            [], namespace="CloudCourier/Heartbeat", metric_names=("Heartbeat",), stat="Sum", period_seconds=60
+        )
+        == []
+    )
+
+
+@pytest.mark.parametrize(
+    ("max_nodes_per_dashboard", "expected_dashboard_names"),
+    [
+        pytest.param(10, ["agent-status"], id="whole-fleet"),
+        pytest.param(3, [f"agent-status-site-{index}" for index in range(5)], id="per-location"),
+        pytest.param(
+            1,
+            [f"agent-status-site-{index}-{dashboard_index}" for index in range(5) for dashboard_index in range(2)],
+            id="split-locations",
+        ),
+    ],
+)
+def test_Given_search_expression_dashboards__When_program_is_run__Then_dashboards_never_exceed_the_max_nodes(
+    monkeypatch: pytest.MonkeyPatch, max_nodes_per_dashboard: int, expected_dashboard_names: list[str]
+):
+    monkeypatch.setattr(program, "USE_SEARCH_EXPRESSION_DASHBOARD", True)
+    monkeypatch.setattr(program, "MAX_NODES_PER_DASHBOARD", max_nodes_per_dashboard)
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(create_synthetic_fleet(10), mocks=mocks)
+
+    assert sorted(mocks.dashboard_bodies) == sorted(
+        f"{dashboard_name}--cloud-courier--bench" for dashboard_name in expected_dashboard_names
+    )
+
+
+def test_Given_many_computers_at_a_location__When_search_dashboard_created__Then_expressions_fit_the_length_limit(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(program, "USE_SEARCH_EXPRESSION_DASHBOARD", True)
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(_create_fleet_at_one_location(50), mocks=mocks)
+
+    heartbeat_widget = mocks.dashboard_bodies["agent-status--cloud-courier--bench"]["widgets"][0]
+    expressions = [metric[0]["expression"] for metric in heartbeat_widget["properties"]["metrics"]]
+    assert len(expressions) > 1
+    assert all(len(expression) <= MAX_SEARCH_EXPRESSION_LENGTH for expression in expressions)
+    assert sum(expression.count("instrument-") for expression in expressions) == 50  # noqa: PLR2004 # every computer
+
+
+@pytest.mark.parametrize("use_search_expressions", [True, False])
+def test_Given_computers_not_publishing_host_load__When_dashboard_created__Then_no_cpu_metrics(
+    monkeypatch: pytest.MonkeyPatch, use_search_expressions: bool
+):
+    monkeypatch.setattr(program, "USE_SEARCH_EXPRESSION_DASHBOARD", use_search_expressions)
+    computers = [
+        computer.model_copy(update={"app_config": AppConfig(host_load_metric_frequency_seconds=None)})
+        for computer in create_synthetic_fleet(2)
+    ]
+    mocks = AlertRecordingMocks()
+
+    _ = run_program_with_mocks(computers, mocks=mocks)
+
+    dashboard_body = json.dumps(mocks.dashboard_bodies["agent-status--cloud-courier--bench"])
+    assert "CloudCourier/Heartbeat" in dashboard_body
+    assert "CPU" not in dashboard_body
@@ -0,0 +1,99 @@
+from typing import Any
+from typing import override
+
+import pytest
+from pulumi.runtime import MockResourceArgs
+
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.appconfig_delivery import MAX_ENVIRONMENTS_PER_APPLICATION
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_program_with_mocks
+from cloud_courier_infrastructure.lib.models import ComputerLocation
+
+SYNTHETIC_FLEET_SIZE = 10
+SYNTHETIC_LOCATION_NAMES = {f"site-{index}" for index in range(5)}
+
+
+class AppConfigRecordingMocks(FleetBenchmarkMocks):
+    def __init__(self) -> None:
+        super().__init__()
+        self.application_names: list[str] = []
+        self.environment_names_by_id: dict[str, str] = {}
+        self.deployment_environment_ids: dict[str, str] = {}
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[Any, Any]]:
+        inputs: dict[str, Any] = args.inputs  # type: ignore[reportUnknownMemberType] # the mock args are untyped in the Pulumi SDK
+        resource_id, outputs = super().new_resource(args)
+        if args.typ == "aws-native:appconfig:Application":
+            self.application_names.append(inputs["name"])
+        elif args.typ == "aws-native:appconfig:Environment":
+            assert resource_id is not None
+            self.environment_names_by_id[resource_id] = inputs["name"]
+            outputs = {**outputs, "environmentId": resource_id}
+        elif args.typ == "aws-native:appconfig:Deployment":
+            self.deployment_environment_ids[args.name] = inputs["environmentId"]
+        return resource_id, outputs
+
+    def get_deployment_environment_name(self, resource_name: str) -> str:
+        return self.environment_names_by_id[
+            self.deployment_environment_ids[f"{resource_name}-config-deployment--cloud-courier--bench"]
+        ]
+
+
+@pytest.fixture(autouse=True)
+def deliver_config_with_appconfig(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(program, "DELIVER_CONFIG_WITH_APPCONFIG", True)
+
+
+def test_When_program_is_run__Then_application_name_has_the_resource_suffix():
+    mocks = AppConfigRecordingMocks()
+
+    _ = run_program_with_mocks(create_synthetic_fleet(1), mocks=mocks)
+
+    assert mocks.application_names == ["cloud-courier--cloud-courier--bench"]
+
+
+def test_Given_computers_at_several_locations__When_program_is_run__Then_one_environment_per_location():
+    mocks = AppConfigRecordingMocks()
+
+    _ = run_program_with_mocks(create_synthetic_fleet(SYNTHETIC_FLEET_SIZE), mocks=mocks)
+
+    assert sorted(mocks.environment_names_by_id.values()) == sorted(SYNTHETIC_LOCATION_NAMES)
+
+
+def test_Given_computers_at_several_locations__When_program_is_run__Then_each_deploys_to_its_location_environment():
+    mocks = AppConfigRecordingMocks()
+    computers = create_synthetic_fleet(SYNTHETIC_FLEET_SIZE)
+
+    _ = run_program_with_mocks(computers, mocks=mocks)
+
+    for computer in computers:
+        assert mocks.get_deployment_environment_name(computer.resource_name) == computer.location.name.lower()
+
+
+def test_Given_computer_moved_to_another_location__When_program_is_run__Then_it_deploys_to_its_original_location_environment():
+    mocks = AppConfigRecordingMocks()
+    computer = create_synthetic_fleet(1)[0]
+    moved_computer = computer.model_copy(
+        update={
+            "location": ComputerLocation(name="Site-1"),
+            "original_name": computer.name,
+            "original_location": computer.location,
+        }
+    )
+
+    _ = run_program_with_mocks([moved_computer], mocks=mocks)
+
+    assert mocks.get_deployment_environment_name(moved_computer.resource_name) == "site-0"
+
+
+def test_Given_more_locations_than_environments_allowed__When_program_is_run__Then_error():
+    computers = [
+        computer.model_copy(update={"location": ComputerLocation(name=f"Site-{index}")})
+        for index, computer in enumerate(create_synthetic_fleet(MAX_ENVIRONMENTS_PER_APPLICATION + 1))
+    ]
+
+    with pytest.raises(ValueError, match=rf"at most {MAX_ENVIRONMENTS_PER_APPLICATION} environments"):
+        _ = run_program_with_mocks(computers)
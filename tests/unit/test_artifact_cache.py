@@ -0,0 +1,224 @@
+import hashlib
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import override
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from cloud_courier_infrastructure.lib.artifact_cache import INDEX_FILE_NAME
+from cloud_courier_infrastructure.lib.artifact_cache import ArtifactCache
+from cloud_courier_infrastructure.lib.artifact_cache import ArtifactCacheIndex
+from cloud_courier_infrastructure.lib.artifact_cache import CachedArtifact
+from cloud_courier_infrastructure.lib.file_hashing import ARTIFACT_CACHE_DIR_ENV_VAR
+from cloud_courier_infrastructure.lib.ssm_distributor import DistributorFileToPackage
+from cloud_courier_infrastructure.lib.ssm_distributor import download_s3_file
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+BUCKET_NAME = "central-artifacts"
+S3_KEY = "cloud-courier-agent/v1.0.0/cloud-courier-agent.zip"
+OTHER_S3_KEY = "cloud-courier-agent/v1.0.1/cloud-courier-agent.zip"
+BUCKET_REGION = "us-east-1"
+
+
+def _s3_url(key: str = S3_KEY) -> str:
+    return f"s3://{BUCKET_NAME}/{key}"
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator["S3Client"]:
+    for env_var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(env_var, "testing")
+    with mock_aws():
+        client = boto3.Session().client("s3", region_name=BUCKET_REGION)
+        _ = client.create_bucket(Bucket=BUCKET_NAME)
+        _ = client.put_bucket_versioning(Bucket=BUCKET_NAME, VersioningConfiguration={"Status": "Enabled"})
+        yield client
+
+
+class RecordingArtifactCache(ArtifactCache):
+    def __init__(self, *, cache_dir: Path, max_bytes: int | None = None) -> None:
+        super().__init__(cache_dir=cache_dir, max_bytes=max_bytes)
+        self.num_downloads = 0
+        self.contents_uploaded_after_head: bytes | None = None
+        """Uploaded as a new version right after the download's HEAD, to race it."""
+
+    @override
+    def _download(self, *, s3_client: "S3Client", bucket: str, key: str, source_url: str) -> CachedArtifact:
+        self.num_downloads += 1
+        contents = self.contents_uploaded_after_head
+        if contents is not None:
+            self.contents_uploaded_after_head = None
+
+            def upload_new_version(**kwargs: object) -> None:  # noqa: ARG001 # botocore passes the details of the call as kwargs
+                s3_client.meta.events.unregister("after-call.s3.HeadObject", upload_new_version)
+                _ = s3_client.put_object(Bucket=bucket, Key=key, Body=contents)
+
+            s3_client.meta.events.register("after-call.s3.HeadObject", upload_new_version)
+        return super()._download(s3_client=s3_client, bucket=bucket, key=key, source_url=source_url)
+
+    def read_cached_contents(self, artifact: CachedArtifact) -> bytes:
+        return self.get_blob_path(artifact.sha256).read_bytes()
+
+
+def _read_index(cache_dir: Path) -> ArtifactCacheIndex:
+    return ArtifactCacheIndex.model_validate_json((cache_dir / INDEX_FILE_NAME).read_text(encoding="utf-8"))
+
+
+def test_Given_cached_copy_is_current__When_fetched_again__Then_not_downloaded_again(
+    s3_client: "S3Client", tmp_path: Path
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+    first_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    second_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert cache.num_downloads == 1
+    assert second_fetch.sha256 == first_fetch.sha256 == hashlib.sha256(b"agent v1").hexdigest()
+    assert second_fetch.last_used >= first_fetch.last_used
+    assert _read_index(tmp_path).artifacts == {_s3_url(): second_fetch}
+
+
+def test_Given_object_changed_in_s3__When_fetched_again__Then_downloaded_again_and_old_blob_deleted(
+    s3_client: "S3Client", tmp_path: Path
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+    first_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v2")
+
+    second_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert cache.num_downloads == 2  # noqa: PLR2004 # once for each version
+    assert second_fetch.etag != first_fetch.etag
+    assert cache.read_cached_contents(second_fetch) == b"agent v2"
+    assert not cache.get_blob_path(first_fetch.sha256).exists()
+
+
+def test_Given_cached_blob_deleted__When_fetched_again__Then_downloaded_again(s3_client: "S3Client", tmp_path: Path):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+    first_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+    cache.get_blob_path(first_fetch.sha256).unlink()
+
+    second_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert cache.num_downloads == 2  # noqa: PLR2004 # the blob was gone, so it had to be downloaded again
+    assert cache.read_cached_contents(second_fetch) == b"agent v1"
+
+
+def test_Given_cache_over_size_limit__When_fetched__Then_least_recently_used_blob_evicted(
+    s3_client: "S3Client", tmp_path: Path
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1.0.0")
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=OTHER_S3_KEY, Body=b"agent v1.0.1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path, max_bytes=len(b"agent v1.0.0") + 1)
+    older_fetch = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    newer_fetch = cache.fetch_s3_artifact(source_url=_s3_url(OTHER_S3_KEY), aws_region=BUCKET_REGION)
+
+    assert not cache.get_blob_path(older_fetch.sha256).exists()
+    assert cache.read_cached_contents(newer_fetch) == b"agent v1.0.1"
+    assert _read_index(tmp_path).artifacts == {_s3_url(OTHER_S3_KEY): newer_fetch}
+
+
+def test_Given_new_version_uploaded_during_download__When_fetched__Then_version_seen_by_head_is_downloaded(
+    s3_client: "S3Client", tmp_path: Path
+):
+    first_version_id = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")["VersionId"]
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+    cache.contents_uploaded_after_head = b"agent v2"
+
+    fetched = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key=S3_KEY)["Body"].read() == b"agent v2"
+    assert fetched.version_id == first_version_id
+    assert cache.read_cached_contents(fetched) == b"agent v1"  # matching the ETag it was recorded with
+
+
+def test_Given_cache_limit_smaller_than_the_artifact__When_fetched__Then_artifact_is_kept(
+    s3_client: "S3Client", tmp_path: Path
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path, max_bytes=1)
+
+    fetched = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert cache.read_cached_contents(fetched) == b"agent v1"  # it's about to be packaged, so it can't be evicted
+    assert _read_index(tmp_path).artifacts == {_s3_url(): fetched}
+
+
+def test_Given_unreadable_index__When_fetched__Then_index_ignored_and_rewritten(
+    s3_client: "S3Client", tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    _ = (tmp_path / INDEX_FILE_NAME).write_text("{not json", encoding="utf-8")
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+
+    with caplog.at_level(logging.WARNING):
+        fetched = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+    assert "Ignoring the unreadable artifact cache index" in caplog.text
+    assert _read_index(tmp_path).artifacts == {_s3_url(): fetched}
+
+
+def test_Given_object_deleted_from_s3__When_fetched_again__Then_error(s3_client: "S3Client", tmp_path: Path):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path)
+    _ = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+    _ = s3_client.delete_object(Bucket=BUCKET_NAME, Key=S3_KEY)
+
+    with pytest.raises(ClientError, match="Not Found"):
+        _ = cache.fetch_s3_artifact(source_url=_s3_url(), aws_region=BUCKET_REGION)
+
+
+@pytest.mark.parametrize("can_hardlink", [True, False])
+def test_When_s3_file_downloaded__Then_placed_in_local_dir_with_its_checksum(
+    s3_client: "S3Client", tmp_path: Path, monkeypatch: pytest.MonkeyPatch, can_hardlink: bool
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    cache = RecordingArtifactCache(cache_dir=tmp_path / "cache")
+    local_file_dir = tmp_path / "package"
+    local_file_dir.mkdir()
+    if not can_hardlink:
+
+        def fail_to_hardlink(*_: object) -> None:
+            raise OSError("Invalid cross-device link")
+
+        monkeypatch.setattr(Path, "hardlink_to", fail_to_hardlink)
+
+    downloaded_file = download_s3_file(
+        file_to_package=DistributorFileToPackage(source_path=_s3_url(), local_name="agent.zip"),
+        local_file_dir=local_file_dir,
+        aws_region=BUCKET_REGION,
+        artifact_cache=cache,
+    )
+
+    assert downloaded_file.local_path == local_file_dir / "agent.zip"
+    assert downloaded_file.local_path.read_bytes() == b"agent v1"
+    assert downloaded_file.sha256 == hashlib.sha256(b"agent v1").hexdigest()
+    assert downloaded_file.local_path.samefile(cache.get_blob_path(downloaded_file.sha256)) is can_hardlink
+
+
+def test_Given_no_artifact_cache__When_s3_file_downloaded__Then_default_cache_is_used(
+    s3_client: "S3Client", tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    _ = s3_client.put_object(Bucket=BUCKET_NAME, Key=S3_KEY, Body=b"agent v1")
+    monkeypatch.setenv(ARTIFACT_CACHE_DIR_ENV_VAR, str(tmp_path / "cache"))
+    local_file_dir = tmp_path / "package"
+    local_file_dir.mkdir()
+
+    downloaded_file = download_s3_file(
+        file_to_package=DistributorFileToPackage(source_path=_s3_url(), local_name="agent.zip"),
+        local_file_dir=local_file_dir,
+        aws_region=BUCKET_REGION,
+    )
+
+    assert _read_index(tmp_path / "cache").artifacts[_s3_url()].sha256 == downloaded_file.sha256
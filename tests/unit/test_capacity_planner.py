@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+
+from cloud_courier_infrastructure.lib import capacity_planner
+from cloud_courier_infrastructure.lib.capacity_planner import DEFAULT_QUOTAS
+from cloud_courier_infrastructure.lib.capacity_planner import DESCRIBE_PARAMETERS
+from cloud_courier_infrastructure.lib.capacity_planner import GET_PARAMETER
+from cloud_courier_infrastructure.lib.capacity_planner import PUT_METRIC_DATA
+from cloud_courier_infrastructure.lib.capacity_planner import ApiQuota
+from cloud_courier_infrastructure.lib.capacity_planner import count_computer_api_calls
+from cloud_courier_infrastructure.lib.capacity_planner import main
+from cloud_courier_infrastructure.lib.capacity_planner import validate_api_quotas
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+
+
+def test_Given_fleet_within_default_quotas__When_validated__Then_rates_are_returned():
+    api_rates = validate_api_quotas(create_synthetic_fleet(100))
+
+    assert len(api_rates) == len(DEFAULT_QUOTAS)
+    assert not any(api_rate.is_exceeded for api_rate in api_rates)
+
+
+def test_Given_quota_the_fleet_exceeds__When_validated__Then_error_names_the_api():
+    with pytest.raises(ValueError, match=rf"{PUT_METRIC_DATA} would reach .* over the quota of 1"):
+        _ = validate_api_quotas(
+            create_synthetic_fleet(100), quotas=(ApiQuota(api_name=PUT_METRIC_DATA, requests_per_second=1),)
+        )
+
+
+@pytest.mark.parametrize(
+    ("publish_consolidated_config", "deliver_config_with_appconfig", "expected_startup_calls"),
+    [
+        pytest.param(
+            False,
+            False,
+            {PUT_METRIC_DATA: 1, DESCRIBE_PARAMETERS: 1, GET_PARAMETER: 4},  # the app config, 2 folders and the alias
+            id="ssm-parameters",
+        ),
+        pytest.param(
+            True,
+            False,
+            {PUT_METRIC_DATA: 1, GET_PARAMETER: 3},  # the digest, the alias and the document
+            id="consolidated-document",
+        ),
+        pytest.param(False, True, {PUT_METRIC_DATA: 1}, id="appconfig"),
+    ],
+)
+def test_Given_config_delivery__When_computer_calls_counted__Then_startup_reads_match_it(
+    monkeypatch: pytest.MonkeyPatch,
+    publish_consolidated_config: bool,
+    deliver_config_with_appconfig: bool,
+    expected_startup_calls: dict[str, float],
+):
+    monkeypatch.setattr(capacity_planner, "PUBLISH_CONSOLIDATED_COMPUTER_CONFIG", publish_consolidated_config)
+    monkeypatch.setattr(capacity_planner, "DELIVER_CONFIG_WITH_APPCONFIG", deliver_config_with_appconfig)
+
+    calls = count_computer_api_calls(create_synthetic_fleet(1)[0], files_per_hour_per_folder=0)
+
+    assert calls.startup_calls == expected_startup_calls
+
+
+@pytest.fixture
+def synthetic_fleet(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(capacity_planner, "create_all_computer_configs", lambda: create_synthetic_fleet(10))
+
+
+@pytest.mark.usefixtures("synthetic_fleet")
+def test_Given_fleet_within_quotas__When_run__Then_every_rate_is_reported(capsys: pytest.CaptureFixture[str]):
+    exit_code = main([])
+
+    report_lines = capsys.readouterr().out.splitlines()
+    assert exit_code == 0
+    assert report_lines[0] == "10 computers across 5 locations (largest: 2)"
+    assert len(report_lines) == 1 + len(DEFAULT_QUOTAS)
+    assert all("headroom" in line for line in report_lines[1:])
+
+
+@pytest.mark.usefixtures("synthetic_fleet")
+def test_Given_file_rate_over_the_s3_quota__When_run__Then_failure(caplog: pytest.LogCaptureFixture):
+    with caplog.at_level(logging.ERROR):
+        exit_code = main(["--files-per-hour-per-folder", "1e9"])
+
+    assert exit_code == 1
+    assert "The fleet would exceed an AWS API quota" in caplog.text
@@ -0,0 +1,191 @@
+import re
+
+import pytest
+
+from cloud_courier_infrastructure.lib.courier_config_models import AppConfig
+from cloud_courier_infrastructure.lib.courier_config_models import FolderToWatch
+from cloud_courier_infrastructure.lib.courier_config_models import UploadWindow
+
+FOLDER_PATH = r"C:\data"
+
+
+@pytest.mark.parametrize("file_pattern", ["a][", "*.csv]", "data[0-9"])
+def test_Given_misordered_or_unclosed_brackets__When_validated__Then_error(file_pattern: str):
+    with pytest.raises(ValueError, match="character set|without a matching"):
+        _ = FolderToWatch(folder_path=FOLDER_PATH, file_pattern=file_pattern)
+
+
+@pytest.mark.parametrize(
+    ("file_pattern", "error_match"),
+    [
+        pytest.param(" ", "can't be empty", id="empty"),
+        pytest.param("/data/*.csv", "must be relative", id="absolute"),
+        pytest.param(r"D:\data\*.csv", "must be relative", id="other drive"),
+        pytest.param(r"..\*.csv", "parent folder", id="parent folder"),
+    ],
+)
+def test_Given_pattern_outside_the_watched_folder__When_validated__Then_error(file_pattern: str, error_match: str):
+    with pytest.raises(ValueError, match=error_match):
+        _ = FolderToWatch(folder_path=FOLDER_PATH, file_pattern=file_pattern)
+
+
+@pytest.mark.parametrize("settle_seconds", [-1, 24 * 60 * 60 + 1])
+def test_Given_settle_seconds_out_of_range__When_validated__Then_error(settle_seconds: int):
+    with pytest.raises(ValueError, match="settle_seconds"):
+        _ = FolderToWatch(folder_path=FOLDER_PATH, settle_seconds=settle_seconds)
+
+
+@pytest.mark.parametrize(("file_pattern", "path"), [("run[]]*.csv", "run].csv"), ("run[!]]*.csv", "runA.csv")])
+def test_Given_close_bracket_as_first_set_member__When_validated__Then_valid(file_pattern: str, path: str):
+    folder = FolderToWatch(folder_path=FOLDER_PATH, file_pattern=file_pattern)
+
+    assert re.match(folder.path_matcher_regex, path) is not None
+
+
+@pytest.mark.parametrize(
+    ("file_pattern", "ignore_pattern"),
+    [("*.csv", "**"), ("*.csv", "*.CSV"), ("data/*.csv", "*.csv"), ("data/*.csv", "Data/*"), ("*.tmp.csv", "*csv")],
+)
+def test_Given_ignore_pattern_covering_file_pattern__When_validated__Then_error(file_pattern: str, ignore_pattern: str):
+    with pytest.raises(ValueError, match="would skip every file"):
+        _ = FolderToWatch(folder_path=FOLDER_PATH, file_pattern=file_pattern, ignore_patterns=[ignore_pattern])
+
+
+@pytest.mark.parametrize(
+    ("file_pattern", "ignore_pattern"), [("*.csv", "*.tmp.csv"), ("data/*.csv", "data/raw/*"), ("*[ab]", "*b")]
+)
+def test_Given_ignore_pattern_covering_part_of_file_pattern__When_validated__Then_valid(
+    file_pattern: str, ignore_pattern: str
+):
+    folder = FolderToWatch(folder_path=FOLDER_PATH, file_pattern=file_pattern, ignore_patterns=[ignore_pattern])
+
+    assert folder.ignore_patterns == [ignore_pattern]
+
+
+@pytest.mark.parametrize("upload_cpu_idle_threshold_percent", [0, -5, 100.5])
+def test_Given_cpu_idle_threshold_outside_percentage__When_validated__Then_error(
+    upload_cpu_idle_threshold_percent: float,
+):
+    with pytest.raises(ValueError, match="upload_cpu_idle_threshold_percent"):
+        _ = AppConfig(upload_cpu_idle_threshold_percent=upload_cpu_idle_threshold_percent)
+
+
+@pytest.mark.parametrize("upload_cpu_idle_lookback_minutes", [0, -1])
+def test_Given_cpu_idle_lookback_below_one_minute__When_validated__Then_error(upload_cpu_idle_lookback_minutes: int):
+    with pytest.raises(ValueError, match="upload_cpu_idle_lookback_minutes"):
+        _ = AppConfig(upload_cpu_idle_lookback_minutes=upload_cpu_idle_lookback_minutes)
+
+
+@pytest.mark.parametrize("host_load_metric_frequency_seconds", [0, -300])
+def test_Given_host_load_frequency_below_one_second__When_validated__Then_error(
+    host_load_metric_frequency_seconds: int,
+):
+    with pytest.raises(ValueError, match="host_load_metric_frequency_seconds"):
+        _ = AppConfig(host_load_metric_frequency_seconds=host_load_metric_frequency_seconds)
+
+
+def test_Given_cpu_gating_without_host_load_publishing__When_validated__Then_valid():
+    app_config = AppConfig(
+        upload_cpu_idle_threshold_percent=100,
+        upload_cpu_idle_lookback_minutes=1,
+        host_load_metric_frequency_seconds=None,
+    )
+
+    assert app_config.host_load_metric_frequency_seconds is None
+
+
+@pytest.mark.parametrize(
+    ("timing", "error_match"),
+    [
+        pytest.param({"startup_delay_max_seconds": -3}, "startup_delay_max_seconds", id="negative startup delay"),
+        pytest.param(
+            {"config_refresh_jitter_seconds": -5}, "config_refresh_jitter_seconds", id="negative refresh jitter"
+        ),
+        pytest.param(
+            {"startup_delay_max_seconds": 10, "startup_delay_offset_seconds": 11},
+            "startup_delay_offset_seconds",
+            id="startup offset past max",
+        ),
+        pytest.param(
+            {"startup_delay_max_seconds": 10, "startup_delay_offset_seconds": -1},
+            "startup_delay_offset_seconds",
+            id="negative startup offset",
+        ),
+        pytest.param(
+            {"config_refresh_frequency_minutes": 1, "config_refresh_jitter_seconds": 60},
+            "shorter than the config refresh period",
+            id="jitter as long as refresh period",
+        ),
+        pytest.param(
+            {"config_refresh_jitter_seconds": 30, "config_refresh_offset_seconds": 31},
+            "config_refresh_offset_seconds",
+            id="refresh offset past jitter",
+        ),
+        pytest.param({"retry_backoff_base_seconds": 0}, "retry_backoff_base_seconds", id="zero backoff base"),
+        pytest.param(
+            {"retry_backoff_base_seconds": 10, "retry_backoff_max_seconds": 5},
+            "retry_backoff_base_seconds",
+            id="backoff base past max",
+        ),
+    ],
+)
+def test_Given_invalid_timing__When_validated__Then_error(timing: dict[str, float], error_match: str):
+    with pytest.raises(ValueError, match=error_match):
+        _ = AppConfig.model_validate(timing)
+
+
+def test_Given_same_seed__When_filling_offsets__Then_offsets_are_stable_and_within_range():
+    app_config = AppConfig(startup_delay_max_seconds=30, config_refresh_jitter_seconds=600)
+
+    first = app_config.with_deterministic_offsets(seed="site--instrument-1")
+    second = app_config.with_deterministic_offsets(seed="site--instrument-1")
+
+    assert first == second
+    assert first.startup_delay_offset_seconds is not None
+    assert 0 <= first.startup_delay_offset_seconds <= app_config.startup_delay_max_seconds
+    assert first.config_refresh_offset_seconds is not None
+    assert 0 <= first.config_refresh_offset_seconds <= app_config.config_refresh_jitter_seconds
+
+
+def test_Given_many_seeds__When_filling_offsets__Then_offsets_spread_across_the_range():
+    app_config = AppConfig(startup_delay_max_seconds=30)
+
+    offsets = {
+        app_config.with_deterministic_offsets(seed=f"site--instrument-{index}").startup_delay_offset_seconds
+        for index in range(200)
+    }
+
+    assert offsets == set(range(app_config.startup_delay_max_seconds + 1))
+
+
+def test_Given_explicit_offsets__When_filling_offsets__Then_explicit_offsets_are_kept():
+    app_config = AppConfig(
+        startup_delay_max_seconds=30,
+        startup_delay_offset_seconds=7,
+        config_refresh_jitter_seconds=600,
+        config_refresh_offset_seconds=42,
+    )
+
+    assert app_config.with_deterministic_offsets(seed="site--instrument-1") == app_config
+
+
+def test_Given_no_delay_or_jitter__When_filling_offsets__Then_offsets_stay_unset():
+    app_config = AppConfig().with_deterministic_offsets(seed="site--instrument-1")
+
+    assert app_config.startup_delay_offset_seconds is None
+    assert app_config.config_refresh_offset_seconds is None
+
+
+@pytest.mark.parametrize(
+    ("upload_window", "error_match"),
+    [
+        pytest.param({"days_of_week": []}, "days_of_week", id="no days"),
+        pytest.param({"days_of_week": [7]}, "days_of_week", id="day past sunday"),
+        pytest.param({"max_bandwidth_bytes_per_second": 0}, "max_bandwidth_bytes_per_second", id="no bandwidth"),
+        pytest.param({"max_concurrent_uploads": 0}, "max_concurrent_uploads", id="no concurrent uploads"),
+        pytest.param({"multipart_part_size_bytes": 1024}, "multipart_part_size_bytes", id="part too small"),
+    ],
+)
+def test_Given_invalid_upload_window__When_validated__Then_error(upload_window: dict[str, object], error_match: str):
+    with pytest.raises(ValueError, match=error_match):
+        _ = UploadWindow.model_validate(upload_window)
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from cloud_courier_infrastructure.lib import file_hashing
+from cloud_courier_infrastructure.lib.file_hashing import DIGEST_INDEX_FILE_NAME
+from cloud_courier_infrastructure.lib.file_hashing import FileDigestCache
+from cloud_courier_infrastructure.lib.file_hashing import hash_file_contents
+
+OLD_MTIME_NS = 1_000_000_000_000_000_000  # far enough in the past that the digest isn't considered racily clean
+
+
+def _write_old_file(file_path: Path, contents: bytes) -> None:
+    _ = file_path.write_bytes(contents)
+    os.utime(file_path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+
+
+def test_Given_empty_file__When_hashed__Then_buffered_fallback_gives_sha256(tmp_path: Path):
+    file_path = tmp_path / "empty.txt"
+    _ = file_path.write_bytes(b"")
+
+    assert hash_file_contents(file_path) == hashlib.sha256(b"").hexdigest()
+
+
+def test_Given_filesystem_without_memory_maps__When_hashed__Then_buffered_fallback_gives_sha256(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    file_path = tmp_path / "agent.zip"
+    _ = file_path.write_bytes(b"agent executable")
+
+    def fail_to_map(*_: object, **__: object) -> None:
+        raise OSError("No such device")
+
+    monkeypatch.setattr(file_hashing.mmap, "mmap", fail_to_map)
+
+    assert hash_file_contents(file_path) == hashlib.sha256(b"agent executable").hexdigest()
+
+
+def test_Given_memoized_digest__When_cache_is_reopened__Then_digest_is_read_from_index(tmp_path: Path):
+    file_path = tmp_path / "manifest.json"
+    index_path = tmp_path / "cache" / "file-digests.json"
+    _write_old_file(file_path, b"manifest")
+    _ = FileDigestCache(index_path=index_path).get_sha256(file_path)
+
+    reopened = FileDigestCache(index_path=index_path)
+
+    assert str(file_path.resolve()) in reopened._digests  # noqa: SLF001 # the index is what makes the next run skip hashing
+    assert reopened.get_sha256(file_path) == hashlib.sha256(b"manifest").hexdigest()
+
+
+def test_Given_file_changed_after_memoizing__When_hashed__Then_new_digest_is_returned(tmp_path: Path):
+    file_path = tmp_path / "manifest.json"
+    cache = FileDigestCache(index_path=tmp_path / "file-digests.json")
+    _write_old_file(file_path, b"old manifest")
+    _ = cache.get_sha256(file_path)
+
+    _write_old_file(file_path, b"new manifest, with a different size")
+
+    assert cache.get_sha256(file_path) == hashlib.sha256(b"new manifest, with a different size").hexdigest()
+
+
+def test_Given_several_files__When_hashed_in_bulk__Then_every_digest_is_returned_and_memoized(tmp_path: Path):
+    contents_by_path = {tmp_path / f"file-{index}.bin": f"contents {index}".encode() for index in range(10)}
+    for file_path, contents in contents_by_path.items():
+        _write_old_file(file_path, contents)
+    index_path = tmp_path / "file-digests.json"
+
+    sha256s = FileDigestCache(index_path=index_path).get_sha256_many(contents_by_path, max_workers=3)
+
+    assert sha256s == {
+        file_path: hashlib.sha256(contents).hexdigest() for file_path, contents in contents_by_path.items()
+    }
+    assert set(FileDigestCache(index_path=index_path)._digests) == {  # noqa: SLF001 # the index is what makes the next run skip hashing
+        str(file_path.resolve()) for file_path in contents_by_path
+    }
+
+
+def test_Given_unreadable_index__When_hashed__Then_index_ignored_and_rewritten(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    file_path = tmp_path / "manifest.json"
+    index_path = tmp_path / DIGEST_INDEX_FILE_NAME
+    _write_old_file(file_path, b"manifest")
+    _ = index_path.write_text("{not json", encoding="utf-8")
+
+    with caplog.at_level(logging.WARNING):
+        sha256 = FileDigestCache(index_path=index_path).get_sha256(file_path)
+
+    assert sha256 == hashlib.sha256(b"manifest").hexdigest()
+    assert "Ignoring the unreadable file digest index" in caplog.text
+    assert str(file_path.resolve()) in FileDigestCache(index_path=index_path)._digests  # noqa: SLF001 # the rewritten index is readable again
+
+
+def test_Given_file_modified_while_being_hashed__When_hashed__Then_digest_not_memoized(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    file_path = tmp_path / "manifest.json"
+    _write_old_file(file_path, b"manifest")
+
+    def hash_then_modify(file_path: Path) -> str:
+        sha256 = hashlib.sha256(file_path.read_bytes()).hexdigest()
+        _write_old_file(file_path, b"modified manifest")
+        os.utime(file_path, ns=(OLD_MTIME_NS + 1, OLD_MTIME_NS + 1))
+        return sha256
+
+    monkeypatch.setattr(file_hashing, "hash_file_contents", hash_then_modify)
+    cache = FileDigestCache(index_path=tmp_path / DIGEST_INDEX_FILE_NAME)
+
+    sha256 = cache.get_sha256(file_path)
+
+    assert sha256 == hashlib.sha256(b"manifest").hexdigest()
+    assert cache._digests == {}  # noqa: SLF001 # a digest of contents that no longer exist must not be reused
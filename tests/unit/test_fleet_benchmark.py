@@ -0,0 +1,257 @@
+import logging
+from pathlib import Path
+
+import pytest
+from pulumi.runtime import MockCallArgs
+
+from cloud_courier_infrastructure.lib import fleet_benchmark
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.fleet_benchmark import DEFAULT_BASELINE_PATH
+from cloud_courier_infrastructure.lib.fleet_benchmark import DEFAULT_OPT_IN_FLEET_SIZES
+from cloud_courier_infrastructure.lib.fleet_benchmark import OPT_IN_FLAG_NAMES
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkBaseline
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkResult
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+from cloud_courier_infrastructure.lib.fleet_benchmark import enable_opt_in_flag
+from cloud_courier_infrastructure.lib.fleet_benchmark import find_regressions
+from cloud_courier_infrastructure.lib.fleet_benchmark import load_baseline
+from cloud_courier_infrastructure.lib.fleet_benchmark import main
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_fleet_benchmark
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_fleet_benchmark_in_process
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_program_with_mocks
+
+SMALL_FLEET_SIZE = 10
+TIME_TOLERANCE = 1.5
+MEMORY_TOLERANCE = 1.25
+
+
+# Only the deterministic counts are compared. Wall time and memory depend on the machine, so they are left to the
+# benchmark CLI.
+@pytest.mark.parametrize("fleet_size", [10, 100])
+def test_When_fleet_is_previewed_with_mocks__Then_resource_and_invoke_counts_match_the_baseline(fleet_size: int):
+    baseline = load_baseline(DEFAULT_BASELINE_PATH).results[fleet_size]
+
+    result = run_fleet_benchmark(fleet_size)
+
+    assert result.resource_counts == baseline.resource_counts, (
+        "Per-node resource count changed; if intentional, re-record with `--update-baseline`"
+    )
+    assert result.invoke_counts == baseline.invoke_counts, (
+        "Provider invoke count changed; if intentional, re-record with `--update-baseline`"
+    )
+
+
+# Run in this process (with the flag patched) rather than through the worker, so the opt-in code paths count towards
+# coverage. The counts don't depend on the process they're measured in.
+@pytest.mark.parametrize("opt_in_flag", OPT_IN_FLAG_NAMES)
+def test_Given_opt_in_flag_enabled__When_fleet_is_previewed_with_mocks__Then_counts_match_the_baseline(
+    monkeypatch: pytest.MonkeyPatch, opt_in_flag: str
+):
+    fleet_size = DEFAULT_OPT_IN_FLEET_SIZES[0]
+    baseline = load_baseline(DEFAULT_BASELINE_PATH).opt_in_results[opt_in_flag][fleet_size]
+    monkeypatch.setattr(program, opt_in_flag, True)
+
+    mocks = run_program_with_mocks(create_synthetic_fleet(fleet_size))
+
+    assert dict(mocks.resource_counts) == baseline.resource_counts, (
+        "Per-node resource count changed; if intentional, re-record with `--update-baseline`"
+    )
+    assert dict(mocks.invoke_counts) == baseline.invoke_counts, (
+        "Provider invoke count changed; if intentional, re-record with `--update-baseline`"
+    )
+
+
+def test_Given_unknown_flag__When_enabled__Then_error():
+    with pytest.raises(ValueError, match="not one of the opt-in flags"):
+        enable_opt_in_flag("DOWNLOAD_EXE_FROM_GITHUB")
+
+
+def test_When_run_in_process_with_opt_in_flag__Then_flag_is_recorded_with_the_counts(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(program, "GATHER_FLEET_INVENTORY", program.GATHER_FLEET_INVENTORY)  # restored afterwards
+
+    result = run_fleet_benchmark_in_process(SMALL_FLEET_SIZE, opt_in_flag="GATHER_FLEET_INVENTORY")
+
+    assert result.opt_in_flag == "GATHER_FLEET_INVENTORY"
+    assert result.resource_counts["aws-native:ssm:Association"] == 1
+
+
+def test_When_run_in_process_without_opt_in_flag__Then_defaults_are_measured():
+    result = run_fleet_benchmark_in_process(SMALL_FLEET_SIZE)
+
+    assert result.opt_in_flag is None
+    assert result.resource_counts["labauto:OnPremComputer"] == SMALL_FLEET_SIZE
+    assert "aws-native:ssm:Association" not in result.resource_counts
+
+
+def test_When_provider_function_is_invoked__Then_counted():
+    mocks = FleetBenchmarkMocks()
+
+    _ = mocks.call(
+        MockCallArgs(token="aws:index/getRegion:getRegion", args={}, provider="")  # noqa: S106 # a provider function, not a password
+    )
+
+    assert mocks.invoke_counts == {"aws:index/getRegion:getRegion": 1}
+
+
+def _create_result(
+    *,
+    fleet_size: int = SMALL_FLEET_SIZE,
+    wall_seconds: float = 1.0,
+    peak_memory_bytes: int = 1_000_000,
+    num_resources: int = 170,
+    num_invokes: int = 0,
+) -> FleetBenchmarkResult:
+    return FleetBenchmarkResult(
+        fleet_size=fleet_size,
+        wall_seconds=wall_seconds,
+        peak_memory_bytes=peak_memory_bytes,
+        resource_counts={"aws-native:ssm:Parameter": num_resources},
+        invoke_counts={"aws:index/getRegion:getRegion": num_invokes} if num_invokes else {},
+    )
+
+
+def test_Given_result_within_tolerances__When_compared__Then_no_regressions():
+    baseline = _create_result()
+
+    regressions = find_regressions(
+        result=_create_result(wall_seconds=1.4, peak_memory_bytes=1_200_000, num_resources=160),
+        baseline=baseline,
+        time_tolerance=TIME_TOLERANCE,
+        memory_tolerance=MEMORY_TOLERANCE,
+    )
+
+    assert regressions == []
+
+
+@pytest.mark.parametrize(
+    ("result", "expected_regression"),
+    [
+        pytest.param(_create_result(num_resources=171), "resources per node rose", id="resources"),
+        pytest.param(_create_result(num_invokes=1), "invokes per node rose", id="invokes"),
+        pytest.param(_create_result(wall_seconds=1.6), "wall time per node rose", id="wall-time"),
+        pytest.param(_create_result(peak_memory_bytes=1_300_000), "peak memory per node rose", id="memory"),
+    ],
+)
+def test_Given_result_past_baseline__When_compared__Then_regression(
+    result: FleetBenchmarkResult, expected_regression: str
+):
+    regressions = find_regressions(
+        result=result, baseline=_create_result(), time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE
+    )
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith(expected_regression)
+
+
+@pytest.fixture
+def measured_results(monkeypatch: pytest.MonkeyPatch) -> list[FleetBenchmarkResult]:
+    """Stand in for the worker processes, so the CLI can be tested without measuring anything."""
+    results: list[FleetBenchmarkResult] = []
+
+    def run_fleet_benchmark(fleet_size: int, *, opt_in_flag: str | None = None) -> FleetBenchmarkResult:
+        result = _create_result(fleet_size=fleet_size).model_copy(update={"opt_in_flag": opt_in_flag})
+        results.append(result)
+        return result
+
+    monkeypatch.setattr(fleet_benchmark, "run_fleet_benchmark", run_fleet_benchmark)
+    return results
+
+
+def test_When_baseline_updated__Then_results_and_opt_in_results_are_recorded(
+    measured_results: list[FleetBenchmarkResult], tmp_path: Path
+):
+    baseline_path = tmp_path / "baseline.json"
+
+    exit_code = main(
+        [
+            "--fleet-sizes",
+            "10",
+            "--opt-in-flags",
+            "USE_SHARED_NODE_ROLES",
+            "--opt-in-fleet-sizes",
+            "10",
+            "--baseline-path",
+            str(baseline_path),
+            "--update-baseline",
+        ]
+    )
+
+    assert exit_code == 0
+    assert load_baseline(baseline_path) == FleetBenchmarkBaseline(
+        results={SMALL_FLEET_SIZE: measured_results[0]},
+        opt_in_results={"USE_SHARED_NODE_ROLES": {SMALL_FLEET_SIZE: measured_results[1]}},
+    )
+
+
+def test_Given_no_baseline__When_run__Then_comparison_skipped(
+    measured_results: list[FleetBenchmarkResult], tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    with caplog.at_level(logging.WARNING):
+        exit_code = main(["--fleet-sizes", "10", "--opt-in-flags", "--baseline-path", str(tmp_path / "missing.json")])
+
+    assert exit_code == 0
+    assert len(measured_results) == 1
+    assert "No baseline recorded for 10 nodes" in caplog.text
+
+
+@pytest.mark.parametrize(
+    ("baseline", "expected_exit_code"),
+    [
+        pytest.param(
+            FleetBenchmarkBaseline(
+                opt_in_results={"USE_SHARED_NODE_ROLES": {SMALL_FLEET_SIZE: _create_result(num_resources=170)}}
+            ),
+            0,
+            id="unchanged",
+        ),
+        pytest.param(
+            FleetBenchmarkBaseline(
+                opt_in_results={"USE_SHARED_NODE_ROLES": {SMALL_FLEET_SIZE: _create_result(num_resources=100)}}
+            ),
+            1,
+            id="regressed",
+        ),
+    ],
+)
+def test_Given_opt_in_baseline__When_run__Then_exit_code_reflects_regressions(
+    measured_results: list[FleetBenchmarkResult],
+    tmp_path: Path,
+    baseline: FleetBenchmarkBaseline,
+    expected_exit_code: int,
+):
+    baseline_path = tmp_path / "baseline.json"
+    _ = baseline_path.write_text(baseline.model_dump_json(), encoding="utf-8")
+
+    exit_code = main(
+        [
+            "--fleet-sizes",
+            "--opt-in-flags",
+            "USE_SHARED_NODE_ROLES",
+            "--opt-in-fleet-sizes",
+            "10",
+            "--baseline-path",
+            str(baseline_path),
+        ]
+    )
+
+    assert exit_code == expected_exit_code
+    assert [result.opt_in_flag for result in measured_results] == ["USE_SHARED_NODE_ROLES"]
+
+
+def test_When_run_as_worker__Then_result_is_written(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    result_path = tmp_path / "result.json"
+    monkeypatch.setattr(program, "USE_SHARED_NODE_ROLES", program.USE_SHARED_NODE_ROLES)  # restored afterwards
+
+    exit_code = main(
+        [
+            f"--worker-fleet-size={SMALL_FLEET_SIZE}",
+            f"--worker-result-path={result_path}",
+            "--worker-opt-in-flag=USE_SHARED_NODE_ROLES",
+        ]
+    )
+
+    assert exit_code == 0
+    result = FleetBenchmarkResult.model_validate_json(result_path.read_text(encoding="utf-8"))
+    assert result.fleet_size == SMALL_FLEET_SIZE
+    assert result.opt_in_flag == "USE_SHARED_NODE_ROLES"
@@ -0,0 +1,48 @@
+import pytest
+
+from cloud_courier_infrastructure.lib import fleet_benchmark
+from cloud_courier_infrastructure.lib import hybrid_activation
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_PROGRAM_CONTEXT
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_program_with_mocks
+from cloud_courier_infrastructure.lib.hybrid_activation import _generate_activation_script_contents
+from cloud_courier_infrastructure.lib.program_context import ManagedInstanceIndex
+
+REGISTERED_RESOURCE_NAME = "site-0--instrument-0--cloud-courier--bench"
+
+
+@pytest.mark.parametrize("use_shared_node_roles", [True, False])
+def test_Given_computer_already_registered__When_program_is_run__Then_only_unregistered_computers_get_a_script(
+    monkeypatch: pytest.MonkeyPatch, use_shared_node_roles: bool
+):
+    monkeypatch.setattr(program, "USE_SHARED_NODE_ROLES", use_shared_node_roles)
+    monkeypatch.setattr(
+        fleet_benchmark,
+        "BENCHMARK_PROGRAM_CONTEXT",
+        BENCHMARK_PROGRAM_CONTEXT.model_copy(
+            update={
+                "managed_instances": ManagedInstanceIndex(
+                    instance_ids_by_iam_role={REGISTERED_RESOURCE_NAME: ("mi-0",)},
+                    instance_ids_by_activation_id={f"{REGISTERED_RESOURCE_NAME}-id": ("mi-0",)},  # the mocked ID
+                )
+            }
+        ),
+    )
+    export_names: list[str] = []
+
+    def record_export(name: str, value: object) -> None:  # noqa: ARG001 # the value is an Output that's never resolved in a preview
+        export_names.append(name)
+
+    monkeypatch.setattr(hybrid_activation, "export", record_export)
+
+    _ = run_program_with_mocks(create_synthetic_fleet(2))
+
+    assert export_names == ["-site-1--instrument-1-activation-script"]
+
+
+def test_When_activation_script_generated__Then_it_registers_the_agent_with_the_activation():
+    script = _generate_activation_script_contents("activation-id", "activation-code", region="us-east-1")
+
+    assert "'CODE=activation-code', 'ID=activation-id', 'REGION=us-east-1'" in script
+    assert "https://amazon-ssm-us-east-1.s3.us-east-1.amazonaws.com/" in script
@@ -0,0 +1,113 @@
+import json
+from pathlib import Path
+from typing import Any
+from typing import override
+
+import pytest
+from pulumi.runtime import MockResourceArgs
+
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.fleet_benchmark import create_synthetic_fleet
+from cloud_courier_infrastructure.lib.fleet_benchmark import run_program_with_mocks
+from cloud_courier_infrastructure.lib.iam_policy import PolicyPrincipal
+from cloud_courier_infrastructure.lib.iam_policy import PolicyStatement
+from cloud_courier_infrastructure.lib.iam_policy import build_policy_document
+
+# The JSON that the `aws:iam/getPolicyDocument` invoke (Terraform's `aws_iam_policy_document`) renders for the
+# statements of a single node, so a change in rendering shows up here instead of as a diff on every deployed policy.
+GOLDEN_POLICIES_DIR = Path(__file__).parent / "golden_iam_policies"
+NODE_ROLE_POLICY_NAMES = (
+    "upload-data",
+    "put-cloudwatch-metrics",
+    "ssm-params",
+    "update-instance-tag",
+    "create-ssm-logs",
+)
+# the IDs that AppConfig assigns, which the mocks need to return for the read policies to be rendered
+APPCONFIG_ID_OUTPUT_NAMES = {
+    "aws-native:appconfig:Application": "applicationId",
+    "aws-native:appconfig:Environment": "environmentId",
+    "aws-native:appconfig:ConfigurationProfile": "configurationProfileId",
+}
+
+
+class PolicyRecordingMocks(FleetBenchmarkMocks):
+    def __init__(self) -> None:
+        super().__init__()
+        self.policy_documents: dict[str, str] = {}
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[Any, Any]]:
+        inputs: dict[str, Any] = args.inputs  # type: ignore[reportUnknownMemberType] # the mock args are untyped in the Pulumi SDK
+        if args.typ == "aws:iam/rolePolicy:RolePolicy":
+            self.policy_documents[inputs["name"]] = inputs["policy"]
+        elif args.typ == "aws-native:s3:BucketPolicy":
+            self.policy_documents["raw-data-bucket"] = inputs["policyDocument"]
+        elif args.typ == "aws-native:iam:Role":
+            self.policy_documents["node-role-trust"] = inputs["assumeRolePolicyDocument"]
+        resource_id, outputs = super().new_resource(args)
+        if args.typ in APPCONFIG_ID_OUTPUT_NAMES:
+            outputs = {**outputs, APPCONFIG_ID_OUTPUT_NAMES[args.typ]: resource_id}
+        return resource_id, outputs
+
+
+def _record_policy_documents(*, deliver_config_with_appconfig: bool, use_shared_node_roles: bool) -> dict[str, str]:
+    mocks = PolicyRecordingMocks()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(program, "DELIVER_CONFIG_WITH_APPCONFIG", deliver_config_with_appconfig)
+        monkeypatch.setattr(program, "USE_SHARED_NODE_ROLES", use_shared_node_roles)
+        _ = run_program_with_mocks(create_synthetic_fleet(1), mocks=mocks)
+    return mocks.policy_documents
+
+
+@pytest.fixture(scope="module")
+def policy_documents() -> dict[str, str]:
+    return _record_policy_documents(deliver_config_with_appconfig=False, use_shared_node_roles=False)
+
+
+@pytest.mark.parametrize("policy_name", [*NODE_ROLE_POLICY_NAMES, "node-role-trust", "raw-data-bucket"])
+def test_When_program_is_run__Then_policy_json_matches_golden_file(policy_documents: dict[str, str], policy_name: str):
+    expected = (GOLDEN_POLICIES_DIR / f"{policy_name}.json").read_text(encoding="utf-8").rstrip("\n")
+
+    assert policy_documents[policy_name] == expected
+
+
+@pytest.mark.parametrize(
+    ("use_shared_node_roles", "golden_file_name"),
+    [
+        pytest.param(False, "read-appconfig", id="node-role"),
+        pytest.param(True, "shared-node-read-appconfig", id="shared-node-role"),
+    ],
+)
+def test_Given_config_delivered_with_appconfig__When_program_is_run__Then_read_policy_json_matches_golden_file(
+    *, use_shared_node_roles: bool, golden_file_name: str
+):
+    policy_documents = _record_policy_documents(
+        deliver_config_with_appconfig=True, use_shared_node_roles=use_shared_node_roles
+    )
+    expected = (GOLDEN_POLICIES_DIR / f"{golden_file_name}.json").read_text(encoding="utf-8").rstrip("\n")
+
+    assert policy_documents["read-appconfig"] == expected
+
+
+def test_Given_aws_principal_of_wildcard__When_rendered__Then_principal_is_kept_as_object():
+    statement = PolicyStatement(
+        actions=("s3:GetObject",), principals=(PolicyPrincipal(type="AWS", identifiers=("*",)),)
+    )
+
+    assert '"Principal": {\n        "AWS": "*"\n      }' in build_policy_document(statement)
+
+
+def test_Given_wildcard_principal__When_rendered__Then_principal_collapses_to_wildcard():
+    statement = PolicyStatement(actions=("s3:GetObject",), principals=(PolicyPrincipal(type="*", identifiers=("*",)),))
+
+    assert '"Principal": "*"' in build_policy_document(statement)
+
+
+def test_Given_statement_without_actions__When_rendered__Then_only_set_keys_are_present():
+    statement = PolicyStatement(effect="Deny", resources=("arn:aws:s3:::raw-data/*",))
+
+    assert json.loads(build_policy_document(statement))["Statement"] == [
+        {"Sid": "", "Effect": "Deny", "Resource": "arn:aws:s3:::raw-data/*"}
+    ]
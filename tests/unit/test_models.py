@@ -0,0 +1,235 @@
+import datetime
+
+import pytest
+
+from cloud_courier_infrastructure.lib.courier_config_models import AppConfig
+from cloud_courier_infrastructure.lib.courier_config_models import FolderToWatch
+from cloud_courier_infrastructure.lib.courier_config_models import UploadWindow
+from cloud_courier_infrastructure.lib.models import AlertingConfig
+from cloud_courier_infrastructure.lib.models import ComputerLocation
+from cloud_courier_infrastructure.lib.models import LabComputerConfig
+from cloud_courier_infrastructure.lib.models import validate_location_upload_bandwidth
+
+ALARM_PERIOD_SECONDS = 120
+UPLOAD_BANDWIDTH_BYTES_PER_SECOND = 1_000_000
+
+
+def _create_computer(
+    *,
+    heartbeat_frequency_seconds: int = 60,
+    name: str = "Instrument",
+    location: ComputerLocation | None = None,
+    folders_to_watch: dict[str, FolderToWatch] | None = None,
+) -> LabComputerConfig:
+    return LabComputerConfig(
+        name=name,
+        location=ComputerLocation(name="Site") if location is None else location,
+        alerting_config=AlertingConfig(emails=["owner@example.com"], timeout_seconds=ALARM_PERIOD_SECONDS),
+        app_config=AppConfig(heartbeat_frequency_seconds=heartbeat_frequency_seconds),
+        folders_to_watch={} if folders_to_watch is None else folders_to_watch,
+    )
+
+
+def test_Given_heartbeat_once_per_alarm_period__When_validated__Then_error():
+    with pytest.raises(ValueError, match="needs to send at least 2"):
+        _ = _create_computer(heartbeat_frequency_seconds=ALARM_PERIOD_SECONDS)
+
+
+def test_Given_heartbeat_twice_per_alarm_period__When_validated__Then_valid():
+    computer = _create_computer(heartbeat_frequency_seconds=ALARM_PERIOD_SECONDS // 2)
+
+    assert computer.app_config.heartbeat_frequency_seconds * 2 == computer.alerting_config.period_seconds
+
+
+def _create_capped_location(max_total_upload_bandwidth_bytes_per_second: int) -> ComputerLocation:
+    return ComputerLocation(
+        name="Site",
+        default_upload_windows=(UploadWindow(max_bandwidth_bytes_per_second=UPLOAD_BANDWIDTH_BYTES_PER_SECOND),),
+        max_total_upload_bandwidth_bytes_per_second=max_total_upload_bandwidth_bytes_per_second,
+    )
+
+
+def test_Given_computers_defining_same_location_with_different_caps__When_validated__Then_error():
+    computers = [
+        _create_computer(name="Big", location=_create_capped_location(UPLOAD_BANDWIDTH_BYTES_PER_SECOND * 10)),
+        _create_computer(name="Small", location=_create_capped_location(UPLOAD_BANDWIDTH_BYTES_PER_SECOND)),
+    ]
+
+    with pytest.raises(ValueError, match=r"\['Small'\] define the location Site differently than Big"):
+        validate_location_upload_bandwidth(computers)
+
+
+def test_Given_computers_defining_same_location_identically__When_within_cap__Then_valid():
+    location = _create_capped_location(UPLOAD_BANDWIDTH_BYTES_PER_SECOND * 2)
+    computers = [_create_computer(name="First", location=location), _create_computer(name="Second", location=location)]
+
+    validate_location_upload_bandwidth(computers)
+
+
+def test_Given_capped_location_without_default_windows__When_validated__Then_error():
+    location = ComputerLocation(
+        name="Site", max_total_upload_bandwidth_bytes_per_second=UPLOAD_BANDWIDTH_BYTES_PER_SECOND
+    )
+
+    with pytest.raises(ValueError, match="Instrument needs upload windows that all limit bandwidth"):
+        validate_location_upload_bandwidth([_create_computer(location=location)])
+
+
+def test_Given_window_running_past_the_end_of_the_week__When_over_cap_on_monday__Then_error():
+    location = ComputerLocation(
+        name="Site",
+        default_upload_windows=(
+            UploadWindow(
+                days_of_week=[6],  # Sunday
+                start_time=datetime.time(22, 0),
+                end_time=datetime.time(2, 0),
+                max_bandwidth_bytes_per_second=UPLOAD_BANDWIDTH_BYTES_PER_SECOND,
+            ),
+        ),
+        max_total_upload_bandwidth_bytes_per_second=UPLOAD_BANDWIDTH_BYTES_PER_SECOND,
+    )
+    computers = [
+        _create_computer(name="Overnight", location=location),
+        _create_computer(name="Monday", location=location).model_copy(
+            update={
+                "app_config": AppConfig(
+                    upload_windows=[
+                        UploadWindow(
+                            days_of_week=[0],
+                            end_time=datetime.time(1, 0),
+                            max_bandwidth_bytes_per_second=UPLOAD_BANDWIDTH_BYTES_PER_SECOND,
+                        )
+                    ]
+                )
+            }
+        ),
+    ]
+
+    with pytest.raises(ValueError, match="upload at 2000000 bytes per second on Monday at 00:00"):
+        validate_location_upload_bandwidth(computers)
+
+
+@pytest.mark.parametrize(
+    ("alerting_config", "error_match"),
+    [
+        pytest.param(
+            {"datapoints_to_alarm": 2, "evaluation_periods": 1},
+            "datapoints_to_alarm",
+            id="more datapoints than periods",
+        ),
+        pytest.param(
+            {"timeout_seconds": 300, "datapoints_to_alarm": 7, "evaluation_periods": 7},
+            "split evenly",
+            id="uneven split",
+        ),
+        pytest.param({"timeout_seconds": 45}, "must be one of", id="unsupported period"),
+        pytest.param({"timeout_seconds": 3600, "evaluation_periods": 25}, "more than 86400 seconds", id="too long"),
+    ],
+)
+def test_Given_invalid_alarm_periods__When_validated__Then_error(alerting_config: dict[str, int], error_match: str):
+    with pytest.raises(ValueError, match=error_match):
+        _ = AlertingConfig(emails=["owner@example.com"], **alerting_config)
+
+
+def test_Given_sub_minute_alarm_period__When_heartbeat_is_standard_resolution__Then_error():
+    with pytest.raises(ValueError, match="must be published as a high-resolution metric"):
+        _ = LabComputerConfig(
+            name="Instrument",
+            location=ComputerLocation(name="Site"),
+            alerting_config=AlertingConfig(
+                emails=["owner@example.com"], timeout_seconds=30, datapoints_to_alarm=3, evaluation_periods=3
+            ),
+            app_config=AppConfig(heartbeat_frequency_seconds=5),
+        )
+
+
+@pytest.mark.parametrize(
+    ("first_folder_path", "second_folder_path"),
+    [
+        (r"C:\Data\Images", r"c:\data\images"),
+        (r"C:\data\images", "C:/data/images"),
+        (r"C:\data\images", "C:\\data\\images\\"),
+        (r"\\lab-server\share\images", "\\\\LAB-SERVER\\Share\\images\\"),
+    ],
+)
+def test_Given_same_folder_written_differently__When_validated__Then_error(
+    first_folder_path: str, second_folder_path: str
+):
+    with pytest.raises(ValueError, match="'second' is already watched by 'first'"):
+        _ = _create_computer(
+            folders_to_watch={
+                "first": FolderToWatch(folder_path=first_folder_path),
+                "second": FolderToWatch(folder_path=second_folder_path, recursive=False),
+            }
+        )
+
+
+def test_Given_folder_nested_under_recursive_parent__When_validated__Then_error():
+    with pytest.raises(ValueError, match="'nested' is already watched by 'parent'"):
+        _ = _create_computer(
+            folders_to_watch={
+                "parent": FolderToWatch(folder_path=r"C:\data"),
+                "nested": FolderToWatch(folder_path=r"C:\data\instrument\images"),
+            }
+        )
+
+
+@pytest.mark.parametrize(
+    "folders_to_watch",
+    [
+        pytest.param(
+            {
+                "parent": FolderToWatch(folder_path=r"C:\data", recursive=False),
+                "nested": FolderToWatch(folder_path=r"C:\data\images"),
+            },
+            id="non-recursive parent",
+        ),
+        pytest.param(
+            {"c-drive": FolderToWatch(folder_path=r"C:\data"), "d-drive": FolderToWatch(folder_path=r"D:\data")},
+            id="different drives",
+        ),
+        pytest.param(
+            {
+                "c-drive": FolderToWatch(folder_path=r"C:\data"),
+                "share": FolderToWatch(folder_path=r"\\lab-server\data"),
+            },
+            id="local drive and UNC share",
+        ),
+        pytest.param(
+            {
+                "first-share": FolderToWatch(folder_path=r"\\lab-server\first\data"),
+                "second-share": FolderToWatch(folder_path=r"\\lab-server\second\data"),
+            },
+            id="different UNC shares",
+        ),
+        pytest.param(
+            {
+                "parent": FolderToWatch(folder_path=r"C:\data", ignore_patterns=["Images/*"]),
+                "nested": FolderToWatch(folder_path=r"C:\data\images"),
+            },
+            id="nested subtree ignored by parent",
+        ),
+        pytest.param(
+            {
+                "parent": FolderToWatch(folder_path=r"C:\data"),
+                "sibling": FolderToWatch(folder_path=r"C:\data-archive"),
+            },
+            id="sibling sharing a name prefix",
+        ),
+    ],
+)
+def test_Given_folders_that_see_different_files__When_validated__Then_valid(folders_to_watch: dict[str, FolderToWatch]):
+    computer = _create_computer(folders_to_watch=folders_to_watch)
+
+    assert computer.folders_to_watch == folders_to_watch
+
+
+@pytest.mark.parametrize("ignore_pattern", ["images/*.tmp", "logs/*"])
+def test_Given_ignore_pattern_not_covering_whole_nested_subtree__When_validated__Then_error(ignore_pattern: str):
+    with pytest.raises(ValueError, match="'nested' is already watched by 'parent'"):
+        _ = _create_computer(
+            folders_to_watch={
+                "parent": FolderToWatch(folder_path=r"C:\data", ignore_patterns=[ignore_pattern]),
+                "nested": FolderToWatch(folder_path=r"C:\data\images"),
+            }
+        )
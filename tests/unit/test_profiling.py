@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pulumi
+import pytest
+from pulumi import Output
+from pulumi.runtime import set_mocks
+
+from cloud_courier_infrastructure.lib import profiling
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_PROJECT_NAME
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_STACK_NAME
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.profiling import FLEET_WIDE_RESOURCE_NAME
+from cloud_courier_infrastructure.lib.profiling import PROFILE_REPORT_PATH_ENV_VAR
+from cloud_courier_infrastructure.lib.profiling import PROFILER
+from cloud_courier_infrastructure.lib.profiling import PROGRAM_COMPONENT_TYPE
+from cloud_courier_infrastructure.lib.profiling import ProfileReport
+from cloud_courier_infrastructure.lib.profiling import ProfileScope
+from cloud_courier_infrastructure.lib.profiling import ProgramProfiler
+from cloud_courier_infrastructure.lib.profiling import profile_component
+from cloud_courier_infrastructure.lib.profiling import profiled_invoke
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def get_region() -> str:
+    return "us-east-1"
+
+
+def get_region_output() -> Output[str]:
+    return Output.from_input("us-east-1")
+
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    PROFILER.reset()
+
+
+def test_Given_invokes_inside_and_outside_components__When_reported__Then_attributed_to_their_scope():
+    with profile_component("OnPremNode", resource_name="site-0--instrument-0"):
+        _ = profiled_invoke(get_region)()
+        _ = profiled_invoke(get_region)()
+    _ = profiled_invoke(get_region)()
+
+    report = PROFILER.create_report()
+
+    assert {(invoke.component_type, invoke.resource_name, invoke.stats.count) for invoke in report.invokes} == {
+        ("OnPremNode", "site-0--instrument-0", 2),
+        (PROGRAM_COMPONENT_TYPE, FLEET_WIDE_RESOURCE_NAME, 1),
+    }
+    assert report.invoke_totals["get_region"].count == 3  # noqa: PLR2004 # every call, whichever the scope
+    assert [(component.component_type, component.stats.count) for component in report.components] == [("OnPremNode", 1)]
+
+
+def test_Given_invokes_of_differing_cost__When_reported__Then_totals_sorted_by_time_spent():
+    profiler = ProgramProfiler()
+    scope = ProfileScope(component_type="OnPremNode", resource_name="site-0--instrument-0")
+    profiler.record_invoke(invoke_name="get_region", scope=scope, seconds=0.1)
+    profiler.record_invoke(invoke_name="get_policy_document", scope=scope, seconds=0.2)
+    profiler.record_invoke(invoke_name="get_policy_document", scope=scope, seconds=0.3)
+
+    invoke_totals = profiler.create_report().invoke_totals
+
+    assert list(invoke_totals) == ["get_policy_document", "get_region"]
+    assert invoke_totals["get_policy_document"].max_seconds == pytest.approx(0.3)
+
+
+def test_Given_invoke_returning_output__When_resolved__Then_recorded():
+    set_mocks(FleetBenchmarkMocks(), project=BENCHMARK_PROJECT_NAME, stack=BENCHMARK_STACK_NAME, preview=True)
+
+    @pulumi.runtime.test  # type: ignore[reportUnknownMemberType,reportUntypedFunctionDecorator] # the decorator is untyped in the Pulumi SDK
+    def resolve_invoke() -> Output[str]:
+        with profile_component("RawDataBucket"):
+            return profiled_invoke(get_region_output)()
+
+    _ = resolve_invoke()
+
+    assert [(invoke.invoke_name, invoke.component_type) for invoke in PROFILER.create_report().invokes] == [
+        ("get_region_output", "RawDataBucket")
+    ]
+
+
+def test_Given_no_report_path__When_report_emitted__Then_nothing_is_registered(monkeypatch: pytest.MonkeyPatch):
+    registered: list[Callable[[], None]] = []
+    monkeypatch.setattr(profiling.atexit, "register", registered.append)
+    monkeypatch.delenv(PROFILE_REPORT_PATH_ENV_VAR, raising=False)
+
+    ProgramProfiler().emit_report()
+
+    assert registered == []
+
+
+def test_Given_report_path__When_emitted_twice__Then_report_written_once_at_exit(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    registered: list[Callable[[], None]] = []
+    monkeypatch.setattr(profiling.atexit, "register", registered.append)
+    report_path = tmp_path / "profile.json"
+    monkeypatch.setenv(PROFILE_REPORT_PATH_ENV_VAR, str(report_path))
+    profiler = ProgramProfiler()
+    profiler.record_component(scope=ProfileScope(component_type="Dashboard", resource_name="fleet-wide"), seconds=0.5)
+
+    profiler.emit_report()
+    profiler.emit_report()
+    for write_report in registered:
+        write_report()
+
+    assert len(registered) == 1
+    assert ProfileReport.model_validate_json(report_path.read_text(encoding="utf-8")) == profiler.create_report()
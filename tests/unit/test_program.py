@@ -0,0 +1,123 @@
+import io
+import json
+import logging
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Any
+from typing import override
+from zipfile import ZipFile
+
+import boto3
+import pulumi
+import pytest
+from moto import mock_aws
+from pulumi.runtime import MockResourceArgs
+from pulumi.runtime import set_all_config
+from pulumi.runtime import set_mocks
+
+from cloud_courier_infrastructure.lib import program
+from cloud_courier_infrastructure.lib.file_hashing import ARTIFACT_CACHE_DIR_ENV_VAR
+from cloud_courier_infrastructure.lib.file_hashing import get_file_digest_cache
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_CONFIG
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_PROGRAM_CONTEXT
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_PROJECT_NAME
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_STACK_NAME
+from cloud_courier_infrastructure.lib.fleet_benchmark import FleetBenchmarkMocks
+from cloud_courier_infrastructure.lib.program import pulumi_program
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+AGENT_ARTIFACTS_BUCKET_NAME = "manual-artifacts--artifact-stores--prod-82ba004"
+AGENT_EXE_ZIP_S3_KEY = "cloud-courier/v0.0.4/exe-windows-2022-3.12.7.zip"
+AGENT_PACKAGE_DIR_NAME = "cloud-courier-agent-0.0.4"
+AGENT_PACKAGE_ZIP_NAME = f"{AGENT_PACKAGE_DIR_NAME}_WINDOWS.zip"
+
+
+class PackageDocumentRecordingMocks(FleetBenchmarkMocks):
+    def __init__(self) -> None:
+        super().__init__()
+        self.package_manifests: list[dict[str, Any]] = []
+
+    @override
+    def new_resource(self, args: MockResourceArgs) -> tuple[str | None, dict[Any, Any]]:
+        inputs: dict[str, Any] = args.inputs  # type: ignore[reportUnknownMemberType] # the mock args are untyped in the Pulumi SDK
+        if args.typ == "aws-native:ssm:Document" and inputs.get("documentType") == "Package":
+            self.package_manifests.append(json.loads(inputs["content"]))
+        return super().new_resource(args)
+
+
+def _create_exe_zip() -> bytes:
+    buffer = io.BytesIO()
+    with ZipFile(buffer, "w") as archive:
+        archive.writestr("cloud-courier/cloud-courier.exe", b"agent executable")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def temp_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Iterator[Path]:
+    """Keep the artifact cache and the package build out of the machine's real temp directory."""
+    monkeypatch.setenv(ARTIFACT_CACHE_DIR_ENV_VAR, str(tmp_path / "cache"))
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    get_file_digest_cache.cache_clear()
+    yield tmp_path
+    get_file_digest_cache.cache_clear()
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator["S3Client"]:
+    for env_var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(env_var, "testing")
+    with mock_aws():
+        client = boto3.Session().client("s3", region_name="us-east-1")
+        _ = client.create_bucket(Bucket=AGENT_ARTIFACTS_BUCKET_NAME)
+        _ = client.put_object(Bucket=AGENT_ARTIFACTS_BUCKET_NAME, Key=AGENT_EXE_ZIP_S3_KEY, Body=_create_exe_zip())
+        yield client
+
+
+def _run_program_with_defaults(mocks: FleetBenchmarkMocks) -> None:
+    set_all_config(BENCHMARK_CONFIG)
+    set_mocks(mocks, project=BENCHMARK_PROJECT_NAME, stack=BENCHMARK_STACK_NAME, preview=True)
+
+    @pulumi.runtime.test  # type: ignore[reportUnknownMemberType,reportUntypedFunctionDecorator] # the decorator is untyped in the Pulumi SDK
+    def _run_program() -> None:
+        pulumi_program()
+
+    _run_program()
+
+
+@pytest.fixture(autouse=True)
+def benchmark_program_context(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(program, "get_program_context", lambda: BENCHMARK_PROGRAM_CONTEXT)
+
+
+@pytest.mark.usefixtures("s3_client")
+def test_When_program_is_run_with_defaults__Then_agent_package_is_built_with_the_scripts_and_exe(temp_dir: Path):
+    mocks = PackageDocumentRecordingMocks()
+
+    _run_program_with_defaults(mocks)
+
+    package_dir = temp_dir / BENCHMARK_PROJECT_NAME / BENCHMARK_STACK_NAME / AGENT_PACKAGE_DIR_NAME
+    with ZipFile(package_dir / AGENT_PACKAGE_ZIP_NAME) as archive:
+        assert sorted(archive.namelist()) == ["exe-v0.0.4.zip", "file-hashes.json", "install.ps1", "uninstall.ps1"]
+        assert json.loads(archive.read("file-hashes.json"))["files"].keys() == {"cloud-courier/cloud-courier.exe"}
+    assert len(mocks.package_manifests) == 1
+    assert mocks.package_manifests[0]["files"].keys() == {AGENT_PACKAGE_ZIP_NAME}
+    assert mocks.resource_counts["labauto:OnPremComputer"] == 1  # the computers configured for this stack
+
+
+@pytest.mark.usefixtures("s3_client", "temp_dir")
+def test_Given_package_already_built__When_program_is_run_again__Then_package_is_reused(
+    caplog: pytest.LogCaptureFixture,
+):
+    first_mocks = PackageDocumentRecordingMocks()
+    _run_program_with_defaults(first_mocks)
+    second_mocks = PackageDocumentRecordingMocks()
+
+    with caplog.at_level(logging.INFO):
+        _run_program_with_defaults(second_mocks)
+
+    assert f"Reusing the previously built {AGENT_PACKAGE_ZIP_NAME}" in caplog.text
+    assert second_mocks.package_manifests == first_mocks.package_manifests
@@ -0,0 +1,144 @@
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+from pulumi.runtime import set_all_config
+
+from cloud_courier_infrastructure.lib import program_context
+from cloud_courier_infrastructure.lib.fleet_benchmark import BENCHMARK_CONFIG
+from cloud_courier_infrastructure.lib.program_context import CENTRAL_INFRA_SSM_PACKAGES_BUCKET_NAME_PARAMETER
+from cloud_courier_infrastructure.lib.program_context import DESCRIBE_INSTANCE_INFORMATION_PAGE_SIZE
+from cloud_courier_infrastructure.lib.program_context import ManagedInstanceIndex
+from cloud_courier_infrastructure.lib.program_context import ProgramContext
+from cloud_courier_infrastructure.lib.program_context import get_managed_instance_index
+from cloud_courier_infrastructure.lib.program_context import get_program_context
+from cloud_courier_infrastructure.lib.program_context import resolve_program_context
+
+if TYPE_CHECKING:
+    from mypy_boto3_ssm import SSMClient
+
+AWS_REGION = "us-east-1"
+MOTO_ACCOUNT_ID = "123456789012"
+SSM_PACKAGES_BUCKET_NAME = "org-ssm-packages"
+MANAGED_INSTANCES = ManagedInstanceIndex(
+    instance_ids_by_iam_role={"site-0--instrument-0--cloud-courier--bench": ("mi-0",)},
+    instance_ids_by_activation_id={"activation-0": ("mi-0",)},
+)
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials(monkeypatch: pytest.MonkeyPatch):
+    for env_var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(env_var, "testing")
+
+
+@pytest.fixture
+def aws_account(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    def get_managed_instance_index(*, aws_region: str) -> ManagedInstanceIndex:
+        assert aws_region == AWS_REGION
+        return MANAGED_INSTANCES
+
+    with mock_aws():
+        _ = boto3.Session().client("organizations", region_name=AWS_REGION).create_organization(FeatureSet="ALL")
+        _ = (
+            boto3.Session()
+            .client("ssm", region_name=AWS_REGION)
+            .put_parameter(
+                Name=CENTRAL_INFRA_SSM_PACKAGES_BUCKET_NAME_PARAMETER, Value=SSM_PACKAGES_BUCKET_NAME, Type="String"
+            )
+        )
+        # moto doesn't implement DescribeInstanceInformation, which is tested with a stubbed client below
+        monkeypatch.setattr(program_context, "get_managed_instance_index", get_managed_instance_index)
+        yield
+
+
+@pytest.fixture
+def ssm_client(monkeypatch: pytest.MonkeyPatch) -> "SSMClient":
+    """Every boto3 client created during the test is this one, so the responses moto lacks can be stubbed on it."""
+    ssm_client = boto3.Session().client("ssm", region_name=AWS_REGION)
+
+    def get_ssm_client(*_: object, **__: object) -> "SSMClient":
+        return ssm_client
+
+    monkeypatch.setattr(boto3.Session, "client", get_ssm_client)
+    return ssm_client
+
+
+def test_Given_instances_on_several_pages__When_indexed__Then_grouped_by_role_and_activation(ssm_client: "SSMClient"):
+    with Stubber(ssm_client) as stubber:
+        stubber.add_response(
+            "describe_instance_information",
+            {
+                "InstanceInformationList": [
+                    {"InstanceId": "mi-0", "IamRole": "shared-role", "ActivationId": "activation-0"},
+                    {"IamRole": "shared-role"},  # not registered yet, so it has no instance ID
+                ],
+                "NextToken": "page-2",
+            },
+            {"MaxResults": DESCRIBE_INSTANCE_INFORMATION_PAGE_SIZE},
+        )
+        stubber.add_response(
+            "describe_instance_information",
+            {"InstanceInformationList": [{"InstanceId": "mi-1", "IamRole": "shared-role"}, {"InstanceId": "mi-2"}]},
+            {"MaxResults": DESCRIBE_INSTANCE_INFORMATION_PAGE_SIZE, "NextToken": "page-2"},
+        )
+
+        index = get_managed_instance_index(aws_region=AWS_REGION)
+
+    assert index == ManagedInstanceIndex(
+        instance_ids_by_iam_role={"shared-role": ("mi-0", "mi-1")},
+        instance_ids_by_activation_id={"activation-0": ("mi-0",)},
+    )
+
+
+@pytest.mark.usefixtures("aws_account")
+@pytest.mark.parametrize("parallel", [True, False])
+def test_When_resolved__Then_context_has_the_account_details(parallel: bool):
+    set_all_config(BENCHMARK_CONFIG)
+
+    context = resolve_program_context(parallel=parallel)
+
+    assert context.aws_account_id == MOTO_ACCOUNT_ID
+    assert context.aws_org_id.startswith("o-")
+    assert context.aws_region == AWS_REGION
+    assert context.central_infra_ssm_packages_bucket_name == SSM_PACKAGES_BUCKET_NAME
+    assert context.managed_instances == MANAGED_INSTANCES
+    assert context.has_been_activated(iam_role_name="site-0--instrument-0--cloud-courier--bench") is True
+    assert context.has_activation_been_used(activation_id="activation-1") is False
+
+
+def test_Given_no_region_configured__When_resolved__Then_error(monkeypatch: pytest.MonkeyPatch):
+    for env_var in ("AWS_REGION", "AWS_DEFAULT_REGION"):
+        monkeypatch.delenv(env_var, raising=False)
+    set_all_config({key: value for key, value in BENCHMARK_CONFIG.items() if key != "aws:region"})
+
+    with pytest.raises(ValueError, match="AWS region is not configured"):
+        _ = resolve_program_context()
+
+
+def test_When_context_is_needed_twice__Then_resolved_once(monkeypatch: pytest.MonkeyPatch):
+    contexts: list[ProgramContext] = []
+
+    def resolve_program_context() -> ProgramContext:
+        contexts.append(
+            ProgramContext(
+                aws_account_id=MOTO_ACCOUNT_ID,
+                aws_org_id="o-test",
+                aws_region=AWS_REGION,
+                central_infra_ssm_packages_bucket_name=SSM_PACKAGES_BUCKET_NAME,
+            )
+        )
+        return contexts[-1]
+
+    monkeypatch.setattr(program_context, "resolve_program_context", resolve_program_context)
+    get_program_context.cache_clear()
+
+    try:
+        assert get_program_context() is get_program_context()
+    finally:
+        get_program_context.cache_clear()
+
+    assert len(contexts) == 1
@@ -0,0 +1,30 @@
+from typing import Any
+
+import pytest
+
+from cloud_courier_infrastructure.lib import pulumi_deploy
+from cloud_courier_infrastructure.lib.program import pulumi_program
+from cloud_courier_infrastructure.lib.pulumi_deploy import generate_stack_config
+from cloud_courier_infrastructure.lib.pulumi_deploy import main
+
+
+def test_When_stack_config_generated__Then_repository_url_matches_repo_name():
+    stack_config = generate_stack_config()
+
+    assert stack_config["proj:github_repo_name"] == "cloud-courier-infrastructure"
+    assert stack_config["proj:git_repository_url"].value == "https://github.com/ejfine/cloud-courier-infrastructure"
+
+
+def test_When_run__Then_cli_is_run_with_the_program_and_stack_config(monkeypatch: pytest.MonkeyPatch):
+    cli_kwargs: list[dict[str, Any]] = []
+
+    def run_cli(**kwargs: Any) -> None:  # noqa: ANN401 # standing in for the CLI, whatever it's passed
+        cli_kwargs.append(kwargs)
+
+    monkeypatch.setattr(pulumi_deploy, "run_cli", run_cli)
+
+    main()
+
+    assert len(cli_kwargs) == 1
+    assert cli_kwargs[0]["pulumi_program"] is pulumi_program
+    assert cli_kwargs[0]["stack_config"].keys() == generate_stack_config().keys()
@@ -0,0 +1,203 @@
+import hashlib
+from collections.abc import Iterator
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from moto import mock_aws
+
+from cloud_courier_infrastructure.lib.s3_upload import SHA256_METADATA_KEY
+from cloud_courier_infrastructure.lib.s3_upload import S3UploadArgs
+from cloud_courier_infrastructure.lib.s3_upload import S3UploadProvider
+from cloud_courier_infrastructure.lib.s3_upload import create_s3_client
+from cloud_courier_infrastructure.lib.s3_upload import is_object_identical
+from cloud_courier_infrastructure.lib.s3_upload import upload_file_if_changed
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+BUCKET_NAME = "ssm-packages"
+S3_KEY = "123456789012/cloud-courier-agent/v1.0.0/cloud-courier-agent-1.0.0_WINDOWS.zip"
+BUCKET_REGION = "us-east-1"
+MIN_MULTIPART_CHUNKSIZE_BYTES = 5 * 1024 * 1024  # S3's minimum size for every part but the last
+
+
+@pytest.fixture
+def s3_client(monkeypatch: pytest.MonkeyPatch) -> Iterator["S3Client"]:
+    for env_var in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(env_var, "testing")
+    with mock_aws():
+        client = boto3.Session().client("s3", region_name=BUCKET_REGION)
+        _ = client.create_bucket(Bucket=BUCKET_NAME)
+        _ = client.put_bucket_versioning(  # each upload creates a version, so skipped uploads can be told apart
+            Bucket=BUCKET_NAME, VersioningConfiguration={"Status": "Enabled"}
+        )
+        yield client
+
+
+def _write_file(file_path: Path, contents: bytes) -> S3UploadArgs:
+    _ = file_path.write_bytes(contents)
+    return S3UploadArgs(
+        bucket_name=BUCKET_NAME,
+        s3_key=S3_KEY,
+        bucket_region=BUCKET_REGION,
+        local_file_path=str(file_path),
+        sha256=hashlib.sha256(contents).hexdigest(),
+        tags={"managed-via-iac-by": "pulumi", "iac-stack-name": "test"},
+        delete_on_destroy=False,
+    )
+
+
+def _count_versions(s3_client: "S3Client") -> int:
+    return len(s3_client.list_object_versions(Bucket=BUCKET_NAME, Prefix=S3_KEY).get("Versions", []))
+
+
+def _get_tags(s3_client: "S3Client") -> dict[str, str]:
+    return {tag["Key"]: tag["Value"] for tag in s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=S3_KEY)["TagSet"]}
+
+
+def test_Given_no_object__When_uploaded__Then_object_has_contents_checksum_metadata_and_tags(
+    s3_client: "S3Client", tmp_path: Path
+):
+    args = _write_file(tmp_path / "package.zip", b"agent package")
+
+    was_uploaded = upload_file_if_changed(args, s3_client=s3_client)
+
+    assert was_uploaded is True
+    s3_object = s3_client.get_object(Bucket=BUCKET_NAME, Key=S3_KEY)
+    assert s3_object["Body"].read() == b"agent package"
+    assert s3_object["Metadata"] == {SHA256_METADATA_KEY: args.sha256}
+    assert _get_tags(s3_client) == args.tags
+
+
+def test_Given_identical_object__When_uploaded_again__Then_upload_is_skipped_and_tags_are_updated(
+    s3_client: "S3Client", tmp_path: Path
+):
+    args = _write_file(tmp_path / "package.zip", b"agent package")
+    _ = upload_file_if_changed(args, s3_client=s3_client)
+    new_tags = {**args.tags, "iac-stack-name": "renamed"}
+
+    was_uploaded = upload_file_if_changed(args.model_copy(update={"tags": new_tags}), s3_client=s3_client)
+
+    assert was_uploaded is False
+    assert _count_versions(s3_client) == 1
+    assert _get_tags(s3_client) == new_tags
+
+
+def test_Given_object_with_other_contents__When_uploaded__Then_new_contents_are_uploaded(
+    s3_client: "S3Client", tmp_path: Path
+):
+    file_path = tmp_path / "package.zip"
+    _ = upload_file_if_changed(_write_file(file_path, b"old agent package"), s3_client=s3_client)
+    versions_before = _count_versions(s3_client)
+    new_args = _write_file(file_path, b"new agent package")
+
+    was_uploaded = upload_file_if_changed(new_args, s3_client=s3_client)
+
+    assert was_uploaded is True
+    assert _count_versions(s3_client) == versions_before + 1
+    s3_object = s3_client.get_object(Bucket=BUCKET_NAME, Key=S3_KEY)
+    assert s3_object["Body"].read() == b"new agent package"
+    assert s3_object["Metadata"] == {SHA256_METADATA_KEY: new_args.sha256}
+
+
+def test_Given_file_larger_than_chunksize__When_uploaded__Then_multipart_upload_keeps_checksum_metadata(
+    s3_client: "S3Client", tmp_path: Path
+):
+    contents = b"x" * (MIN_MULTIPART_CHUNKSIZE_BYTES + 1)
+    args = _write_file(tmp_path / "package.zip", contents).model_copy(
+        update={"multipart_chunksize_bytes": MIN_MULTIPART_CHUNKSIZE_BYTES}
+    )
+
+    _ = upload_file_if_changed(args, s3_client=s3_client)
+
+    head = s3_client.head_object(Bucket=BUCKET_NAME, Key=S3_KEY)
+    assert head["ETag"].endswith('-2"')  # the ETag of a multipart upload ends with its number of parts
+    assert is_object_identical(s3_client=s3_client, bucket_name=BUCKET_NAME, s3_key=S3_KEY, sha256=args.sha256) is True
+
+
+def test_Given_no_object__When_compared__Then_not_identical(s3_client: "S3Client"):
+    assert is_object_identical(s3_client=s3_client, bucket_name=BUCKET_NAME, s3_key=S3_KEY, sha256="abc") is False
+
+
+def test_Given_object_with_other_checksum__When_compared__Then_not_identical(s3_client: "S3Client", tmp_path: Path):
+    args = _write_file(tmp_path / "package.zip", b"agent package")
+    _ = upload_file_if_changed(args, s3_client=s3_client)
+
+    assert (
+        is_object_identical(s3_client=s3_client, bucket_name=BUCKET_NAME, s3_key=S3_KEY, sha256="other-sha256") is False
+    )
+
+
+def test_Given_access_denied__When_compared__Then_error_is_raised(s3_client: "S3Client"):
+    with Stubber(s3_client) as stubber:
+        stubber.add_client_error("head_object", service_error_code="403", http_status_code=HTTPStatus.FORBIDDEN)
+
+        with pytest.raises(ClientError, match="403"):
+            _ = is_object_identical(s3_client=s3_client, bucket_name=BUCKET_NAME, s3_key=S3_KEY, sha256="abc")
+
+
+@pytest.mark.usefixtures("s3_client")
+def test_When_resource_created__Then_file_is_uploaded_and_id_is_its_url(tmp_path: Path):
+    args = _write_file(tmp_path / "package.zip", b"agent package")
+
+    result = S3UploadProvider().create(args.model_dump())
+
+    assert result.id == f"s3://{BUCKET_NAME}/{S3_KEY}"
+    assert is_object_identical(
+        s3_client=create_s3_client(BUCKET_REGION), bucket_name=BUCKET_NAME, s3_key=S3_KEY, sha256=args.sha256
+    )
+
+
+@pytest.mark.parametrize(
+    ("changed_property", "expected_changes", "expected_replaces"),
+    [
+        pytest.param({}, False, [], id="unchanged"),
+        pytest.param({"sha256": "new-sha256"}, True, [], id="contents"),
+        pytest.param({"local_file_path": "elsewhere/package.zip"}, False, [], id="local-path"),
+        pytest.param({"s3_key": "other/package.zip"}, True, ["s3_key"], id="key"),
+    ],
+)
+def test_When_properties_diffed__Then_only_changes_to_the_object_count(
+    tmp_path: Path, changed_property: dict[str, str], expected_changes: bool, expected_replaces: list[str]
+):
+    olds = _write_file(tmp_path / "package.zip", b"agent package").model_dump()
+
+    result = S3UploadProvider().diff(f"s3://{BUCKET_NAME}/{S3_KEY}", olds, {**olds, **changed_property})
+
+    assert result.changes is expected_changes
+    assert result.replaces == expected_replaces
+
+
+def test_When_resource_updated__Then_new_contents_are_uploaded(s3_client: "S3Client", tmp_path: Path):
+    file_path = tmp_path / "package.zip"
+    provider = S3UploadProvider()
+    olds = _write_file(file_path, b"old agent package").model_dump()
+    _ = provider.create(olds)
+    news = _write_file(file_path, b"new agent package").model_dump()
+
+    result = provider.update(f"s3://{BUCKET_NAME}/{S3_KEY}", olds, news)
+
+    assert result.outs == news
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key=S3_KEY)["Body"].read() == b"new agent package"
+
+
+@pytest.mark.parametrize("delete_on_destroy", [True, False])
+def test_When_resource_deleted__Then_object_is_only_deleted_if_requested(
+    s3_client: "S3Client", tmp_path: Path, delete_on_destroy: bool
+):
+    provider = S3UploadProvider()
+    props = (
+        _write_file(tmp_path / "package.zip", b"agent package")
+        .model_copy(update={"delete_on_destroy": delete_on_destroy})
+        .model_dump()
+    )
+    _ = provider.create(props)
+
+    provider.delete(f"s3://{BUCKET_NAME}/{S3_KEY}", props)
+
+    assert s3_client.list_objects_v2(Bucket=BUCKET_NAME).get("KeyCount") == (0 if delete_on_destroy else 1)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from zipfile import ZIP_DEFLATED
+from zipfile import ZIP_STORED
+from zipfile import ZipFile
+
+import pytest
+
+from cloud_courier_infrastructure.lib.file_hashing import ARTIFACT_CACHE_DIR_ENV_VAR
+from cloud_courier_infrastructure.lib.file_hashing import get_file_digest_cache
+from cloud_courier_infrastructure.lib.ssm_distributor import DistributorFileToPackage
+from cloud_courier_infrastructure.lib.ssm_distributor import download_files_to_package
+from cloud_courier_infrastructure.lib.ssm_distributor import write_reproducible_zip
+from cloud_courier_infrastructure.lib.ssm_distributor import write_zip_entry_hashes
+
+MODERATE_COMPRESSION_LEVEL = 6
+
+
+@pytest.fixture
+def cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Iterator[Path]:
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv(ARTIFACT_CACHE_DIR_ENV_VAR, str(cache_dir))
+    get_file_digest_cache.cache_clear()
+    yield cache_dir
+    get_file_digest_cache.cache_clear()
+
+
+def _write_file_to_zip(tmp_path: Path) -> Path:
+    file_path = tmp_path / "install.ps1"
+    _ = file_path.write_text("Write-Host 'installing'\n" * 100, encoding="utf-8")
+    return file_path
+
+
+@pytest.mark.parametrize("compression_level", [-1, 10])
+def test_Given_compression_level_out_of_range__When_zipping__Then_error_before_writing(
+    tmp_path: Path, compression_level: int
+):
+    zip_file_path = tmp_path / "package.zip"
+
+    with pytest.raises(ValueError, match="must be between 0 and 9"):
+        _ = write_reproducible_zip(
+            zip_file_path=zip_file_path,
+            files_to_zip=[_write_file_to_zip(tmp_path)],
+            compression_level=compression_level,
+        )
+    assert not zip_file_path.exists()
+
+
+def test_Given_compression_level__When_zipped_twice__Then_entries_are_deflated_and_checksums_match(tmp_path: Path):
+    files_to_zip = [_write_file_to_zip(tmp_path)]
+
+    first_sha256 = write_reproducible_zip(
+        zip_file_path=tmp_path / "first.zip", files_to_zip=files_to_zip, compression_level=MODERATE_COMPRESSION_LEVEL
+    )
+    second_sha256 = write_reproducible_zip(
+        zip_file_path=tmp_path / "second.zip", files_to_zip=files_to_zip, compression_level=MODERATE_COMPRESSION_LEVEL
+    )
+
+    assert first_sha256 == second_sha256
+    with ZipFile(tmp_path / "first.zip") as archive:
+        zip_info = archive.getinfo("install.ps1")
+        assert zip_info.compress_type == ZIP_DEFLATED
+        assert zip_info.compress_size < zip_info.file_size
+
+
+def test_Given_no_compression_level__When_zipped__Then_entries_are_stored(tmp_path: Path):
+    zip_file_path = tmp_path / "package.zip"
+
+    _ = write_reproducible_zip(zip_file_path=zip_file_path, files_to_zip=[_write_file_to_zip(tmp_path)])
+
+    with ZipFile(zip_file_path) as archive:
+        assert archive.getinfo("install.ps1").compress_type == ZIP_STORED
+
+
+def test_Given_zip_with_folders__When_entry_hashes_written__Then_only_files_are_hashed(tmp_path: Path):
+    zip_file_path = tmp_path / "exe.zip"
+    with ZipFile(zip_file_path, "w") as archive:
+        archive.mkdir("cloud-courier")
+        archive.writestr("cloud-courier/cloud-courier.exe", b"agent executable")
+    hashes_file_path = tmp_path / "file-hashes.json"
+
+    write_zip_entry_hashes(zip_file_path=zip_file_path, hashes_file_path=hashes_file_path)
+
+    assert json.loads(hashes_file_path.read_text(encoding="utf-8")) == {
+        "files": {"cloud-courier/cloud-courier.exe": hashlib.sha256(b"agent executable").hexdigest()}
+    }
+
+
+def test_Given_local_files__When_gathered_for_package__Then_placed_in_order_with_their_digests(
+    cache_dir: Path, tmp_path: Path
+):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    contents_by_name = {"agent.zip": b"agent", "readme.txt": b"readme"}
+    for name, contents in contents_by_name.items():
+        _ = (source_dir / name).write_bytes(contents)
+    package_dir = tmp_path / "package"
+    package_dir.mkdir()
+
+    downloaded_files = download_files_to_package(
+        files_to_package=[
+            DistributorFileToPackage(source_path=str(source_dir / name), local_name=f"packaged-{name}")
+            for name in contents_by_name
+        ],
+        local_file_dir=package_dir,
+        aws_region="us-east-1",
+    )
+
+    assert [downloaded_file.local_path for downloaded_file in downloaded_files] == [
+        package_dir / f"packaged-{name}" for name in contents_by_name
+    ]
+    assert [downloaded_file.sha256 for downloaded_file in downloaded_files] == [
+        hashlib.sha256(contents).hexdigest() for contents in contents_by_name.values()
+    ]
+    assert (package_dir / "packaged-readme.txt").read_bytes() == b"readme"
+    assert cache_dir.exists()